@@ -0,0 +1,358 @@
+"""
+LangChain side of the agent: the chat model, the compact ReAct runnable, its callback handlers and the executor.
+
+Importing LangChain and langchain_openai takes longer than the rest of the backend together, so nothing here
+is imported at startup: agents.agent_factory imports this module and builds the AgentRuntime on first use,
+or in the background right after startup.
+"""
+import os
+import re
+import time
+import asyncio
+from typing import List, Tuple
+from langchain_openai import ChatOpenAI
+from langchain.agents import AgentExecutor
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain.agents.output_parsers import ReActSingleInputOutputParser
+from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
+from langchain.prompts import PromptTemplate
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.callbacks import AsyncCallbackHandler, BaseCallbackHandler
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.tools import render_text_description
+from dotenv import load_dotenv
+from config import agent_template, tool_calling_system_prompt
+from sessions import count_tokens
+from scheduler import scheduler
+from tools import build_tools, is_final_output
+from observability import get_logger, record_span, metrics
+
+load_dotenv()
+logger = get_logger(__name__)
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that waits for an openai_llm scheduler slot before each call"""
+
+    async def _agenerate(self, *args, **kwargs):
+        async with scheduler.slot("openai_llm"):
+            return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with scheduler.slot("openai_llm"):
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+
+def build_llm():
+    """
+    The agent's chat model: gpt-4o-mini, or the scripted stand-in when BENCH_FAKE_LLM is set
+    """
+    if os.getenv("BENCH_FAKE_LLM", "false").lower() == "true":
+        from bench.fake_llm import ScriptedChatModel
+        logger.warning("[AGENT] BENCH_FAKE_LLM is set, using the scripted benchmark model instead of OpenAI")
+        return ScriptedChatModel()
+    return ScheduledChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0.2,
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # Report token usage on streamed responses too
+        stream_usage=True
+    )
+
+
+_SENTENCE_END = re.compile(r"[.!?\n]\s")
+
+
+def compact_observation(observation: str, max_tokens: int) -> str:
+    """
+    Truncate an observation to about max_tokens, cutting at a sentence boundary when there is one
+    """
+    observation = str(observation)
+    if count_tokens(observation) <= max_tokens:
+        return observation
+    head = observation[:max_tokens * 4]
+    boundaries = [match.end() for match in _SENTENCE_END.finditer(head)]
+    if boundaries and boundaries[-1] > len(head) // 2:
+        head = head[:boundaries[-1]]
+    return f"{head.rstrip()} [... {len(observation) - len(head)} more characters truncated]"
+
+
+def compact_steps(intermediate_steps: List[Tuple[AgentAction, str]]) -> List[Tuple[AgentAction, str]]:
+    """
+    Bound the observations resent to the model on every iteration.
+
+    Observations of the latest model turn keep up to AGENT_OBSERVATION_MAX_TOKENS; earlier ones, which
+    the model has already reasoned about, shrink to AGENT_OBSERVATION_SUMMARY_TOKENS. This keeps the
+    prompt from growing by whole tool outputs.
+    """
+    latest_tokens = int(os.getenv("AGENT_OBSERVATION_MAX_TOKENS", "600"))
+    earlier_tokens = int(os.getenv("AGENT_OBSERVATION_SUMMARY_TOKENS", "150"))
+    if not intermediate_steps:
+        return []
+    latest_turn = _turn_of(intermediate_steps[-1][0])
+    return [
+        (action, compact_observation(observation, latest_tokens if _turn_of(action) == latest_turn else earlier_tokens))
+        for action, observation in intermediate_steps
+    ]
+
+
+def _turn_of(action: AgentAction) -> int:
+    # Parallel tool calls from one model turn share its message; a ReAct step is a turn of its own
+    message_log = getattr(action, "message_log", None)
+    return id(message_log[-1]) if message_log else id(action)
+
+
+def format_compact_scratchpad(intermediate_steps: List[Tuple[AgentAction, str]]) -> str:
+    """
+    Build the ReAct scratchpad like format_log_to_str, but with bounded observations
+    """
+    thoughts = ""
+    for action, observation in compact_steps(intermediate_steps):
+        thoughts += action.log
+        thoughts += f"\nObservation: {observation}\nThought: "
+    return thoughts
+
+
+def create_compact_react_agent(llm, tools, prompt):
+    """
+    Same runnable as langchain's create_react_agent, with the compacting scratchpad formatter
+    """
+    prompt = prompt.partial(
+        tools=render_text_description(list(tools)),
+        tool_names=", ".join([t.name for t in tools]),
+    )
+    return (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_compact_scratchpad(x["intermediate_steps"]),
+        )
+        | prompt
+        | llm.bind(stop=["\nObservation"])
+        | ReActSingleInputOutputParser()
+    )
+
+
+def create_compact_tool_calling_agent(llm, tools, prompt):
+    """
+    Same runnable as langchain's create_tool_calling_agent, with bounded tool messages
+    """
+    return (
+        RunnablePassthrough.assign(
+            agent_scratchpad=lambda x: format_to_tool_messages(compact_steps(x["intermediate_steps"])),
+        )
+        | prompt
+        | llm.bind_tools(tools)
+        | ToolsAgentOutputParser()
+    )
+
+
+SKIPPED_SYNTHESIS = metrics.counter(
+    "agent_skipped_synthesis_total", "Agent queries answered with a tool's output, without a final LLM call", ("tool",)
+)
+
+
+class MedicalAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor with two additions:
+
+    - tool calls from one model turn (already run with asyncio.gather) are capped at
+      max_parallel_tools at a time per query
+    - when return_direct_outputs is set and the router found a single-intent lookup, a single call to
+      that lookup's tool whose output meets its rule in tools.RETURN_DIRECT_RULES ends the run with
+      that output, skipping the final synthesis call. Confident lookups are already answered by the
+      router's fast path, so this only covers lookups it was unsure of, such as "side effects of
+      ibuprofen for my fever"; open questions (ask_medical_specialist) and images always get synthesis
+    """
+    max_parallel_tools: int = 4
+    return_direct_outputs: bool = True
+    _limits: dict = {}
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        key = run_manager.run_id if run_manager else None
+        limit = self._limits.get(key)
+        if limit is None:
+            limit = self._limits[key] = [asyncio.Semaphore(self.max_parallel_tools), 0]
+        limit[1] += 1
+        try:
+            async with limit[0]:
+                return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        finally:
+            limit[1] -= 1
+            if not limit[1]:
+                del self._limits[key]
+
+    def _get_tool_return(self, next_step_output):
+        # Called for turns with exactly one tool call
+        tool_return = super()._get_tool_return(next_step_output)
+        if tool_return is not None or not self.return_direct_outputs:
+            return tool_return
+        agent_action, observation = next_step_output
+        if not is_final_output(agent_action.tool, observation):
+            return None
+        SKIPPED_SYNTHESIS.inc(tool=agent_action.tool)
+        logger.info("[AGENT] Returning %s output directly, skipping the final LLM call", agent_action.tool)
+        return AgentFinish({"output": str(observation), "return_direct": agent_action.tool}, "")
+
+
+AGENT_TOKENS = metrics.counter("agent_tokens_total", "Tokens used by agent LLM calls", ("kind",))
+
+
+class SpanCallbackHandler(BaseCallbackHandler):
+    """
+    Records a span for every agent LLM iteration and tool call
+    """
+    # Called inline on the event loop, so spans land in the current request's trace
+    run_inline = True
+
+    def __init__(self):
+        self._started = {}
+
+    def _start(self, run_id, name: str, target: str) -> None:
+        self._started[run_id] = (name, target, time.perf_counter())
+
+    def _finish(self, run_id, status: str = "ok") -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            name, target, start = started
+            record_span(name, time.perf_counter() - start, target, status)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        params = kwargs.get("invocation_params") or {}
+        self._start(run_id, "llm_iteration", params.get("model") or params.get("model_name", ""))
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id, "error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self._start(run_id, "tool", (serialized or {}).get("name", ""))
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id, "error")
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised before an LLM call that would take a query past its token budget"""
+
+
+class TokenUsageHandler(AsyncCallbackHandler):
+    """
+    Counts prompt and completion tokens of every agent LLM call and enforces a per-query budget.
+
+    Before each call, the budget check assumes the next prompt is at least as long as the last one,
+    so a query stops before it overspends rather than after.
+    """
+    raise_error = True
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.iterations = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.budget_exceeded = False
+        self.last_observation = None
+        self.tool_calls = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs) -> None:
+        expected = self.iterations[-1]["prompt_tokens"] if self.iterations else 0
+        if self.budget and self.total_tokens + expected > self.budget:
+            self.budget_exceeded = True
+            raise TokenBudgetExceeded(f"Token budget of {self.budget} reached after {self.total_tokens} tokens")
+
+    async def on_llm_end(self, response, **kwargs) -> None:
+        prompt_tokens = completion_tokens = 0
+        generation = response.generations[0][0] if response.generations and response.generations[0] else None
+        usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+        if usage:
+            prompt_tokens, completion_tokens = usage["input_tokens"], usage["output_tokens"]
+        elif response.llm_output and response.llm_output.get("token_usage"):
+            token_usage = response.llm_output["token_usage"]
+            prompt_tokens, completion_tokens = token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        AGENT_TOKENS.inc(prompt_tokens, kind="prompt")
+        AGENT_TOKENS.inc(completion_tokens, kind="completion")
+        self.iterations.append({"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+
+    async def on_tool_end(self, output, **kwargs) -> None:
+        self.tool_calls += 1
+        self.last_observation = str(output)
+
+    def to_dict(self) -> dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "llm_calls": len(self.iterations),
+            "tool_calls": self.tool_calls,
+            "iterations": self.iterations,
+            "budget": self.budget,
+            "budget_exceeded": self.budget_exceeded,
+        }
+
+
+def token_usage_handler() -> TokenUsageHandler:
+    return TokenUsageHandler(int(os.getenv("AGENT_TOKEN_BUDGET", "20000")))
+
+
+def budget_exceeded_response(usage: TokenUsageHandler) -> str:
+    """Answer for a query stopped by its token budget, built from what the tools already found"""
+    if usage.last_observation:
+        return (
+            "I had to stop researching your question before completing it, but here is what I found so far:\n\n"
+            f"{usage.last_observation}\n\n"
+            "Please consult a healthcare professional for advice specific to your situation."
+        )
+    return (
+        "I'm sorry, your question needed more research than I can do for a single message. "
+        "Please try asking a shorter or more specific question, or consult a healthcare professional directly."
+    )
+
+
+class AgentRuntime:
+    """
+    The built agent: chat model, LangChain tools, executor and the shared span callback handler.
+
+    AGENT_MODE selects the agent: "react" (text ReAct, one tool per LLM call) or "tools" (native
+    function calling, where independent tool calls of one turn run concurrently, at most
+    AGENT_MAX_PARALLEL_TOOLS at a time).
+    """
+
+    def __init__(self):
+        self.mode = os.getenv("AGENT_MODE", "react").lower()
+        self.llm = build_llm()
+        self.tools = build_tools()
+        self.tools_by_name = {tool.name: tool for tool in self.tools}
+        if self.mode == "tools":
+            self.prompt = ChatPromptTemplate.from_messages([
+                ("system", tool_calling_system_prompt),
+                ("human", "{input}"),
+                MessagesPlaceholder("agent_scratchpad"),
+            ])
+            self.agent = create_compact_tool_calling_agent(self.llm, self.tools, self.prompt)
+        elif self.mode == "react":
+            self.prompt = PromptTemplate.from_template(agent_template)
+            self.agent = create_compact_react_agent(self.llm, self.tools, self.prompt)
+        else:
+            raise ValueError(f"Unknown AGENT_MODE {self.mode!r}, expected 'react' or 'tools'")
+        self.agent_executor = MedicalAgentExecutor(
+            agent=self.agent,
+            tools=self.tools,
+            verbose=False,
+            handle_parsing_errors=True,
+            max_iterations=10,
+            max_parallel_tools=int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4")),
+            return_direct_outputs=os.getenv("AGENT_RETURN_DIRECT", "true").lower() == "true"
+        )
+        self.span_callbacks = SpanCallbackHandler()
+        logger.info("[AGENT] %s agent created successfully", "Tool-calling" if self.mode == "tools" else "ReAct")
@@ -1,53 +1,204 @@
 import os
-import shutil
-from langchain_openai import ChatOpenAI
-from langchain.agents import create_react_agent, AgentExecutor
-from langchain.prompts import PromptTemplate
+import time
+import uuid
+import asyncio
 from dotenv import load_dotenv
-from config import agent_template
-from tools import (
-    ask_medical_specialist,
-    emergency_call_tool,
-    find_nearby_specialists_by_location,
-    analyze_medical_image,
-    get_medication_information,
-    schedule_appointment_helper
-)
+from image_store import image_store, current_request_id
+from utils import token_sink
+from emergency import emergency_dispatcher
+from router import route_query
+from triage import assess_emergency, SEVERITY_LEVELS
+from sessions import session_store, current_session_id
+from scheduler import request_priority, Overloaded, PRIORITY_EMERGENCY, PRIORITY_NORMAL
+from tools import TOOL_FUNCTIONS, return_direct_tool
+from observability import get_logger, span, metrics, request_id_var
 
 load_dotenv()
+logger = get_logger(__name__)
 
-# Initialize tools
-tools = [
-    ask_medical_specialist,
-    emergency_call_tool,
-    find_nearby_specialists_by_location,
-    analyze_medical_image,
-    get_medication_information,
-    schedule_appointment_helper
-]
-
-llm = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0.2,
-    api_key=os.getenv("OPENAI_API_KEY")
-)
+TOOLS_BY_NAME = {function.__name__: function for function in TOOL_FUNCTIONS}
+
+
+class AgentFactory:
+    """
+    Builds the LangChain agent (agent_runtime.AgentRuntime) once, on first use.
+
+    The app lifespan calls start() to build it in a worker thread right after startup, so the server
+    accepts requests (health checks, TTS, fast-path answers) while LangChain is still being imported.
+    Requests that need the agent before then wait for the same build. A failed build, e.g. without
+    OPENAI_API_KEY, is logged and retried by the next request instead of stopping the service.
+    """
+
+    def __init__(self):
+        self._runtime = None
+        self._building = None
+
+    def start(self) -> None:
+        if self._runtime is None and self._building is None:
+            self._building = asyncio.ensure_future(self._build())
+            # A failed background build is already logged; requests re-raise it from get()
+            self._building.add_done_callback(lambda task: task.cancelled() or task.exception())
 
+    async def get(self):
+        if self._runtime is None:
+            self.start()
+            await asyncio.shield(self._building)
+        return self._runtime
 
-prompt = PromptTemplate.from_template(agent_template)
-agent = create_react_agent(llm, tools, prompt)
-print("✅ [AGENT] ReAct agent created successfully")
+    async def _build(self) -> None:
+        try:
+            with span("agent_build"):
+                self._runtime = await asyncio.to_thread(self._build_runtime)
+        except Exception as e:
+            logger.error("[AGENT] Failed to build the agent: %s", e)
+            raise
+        finally:
+            self._building = None
 
+    @staticmethod
+    def _build_runtime():
+        start = time.perf_counter()
+        from agent_runtime import AgentRuntime
 
-agent_executor = AgentExecutor(
-    agent=agent, 
-    tools=tools, 
-    verbose=False, 
-    handle_parsing_errors=True,
-    max_iterations=10
+        runtime = AgentRuntime()
+        logger.info("[AGENT] Agent ready in %.0fms", (time.perf_counter() - start) * 1000)
+        return runtime
+
+    async def close(self) -> None:
+        building = self._building
+        if building is not None:
+            building.cancel()
+            try:
+                await building
+            except BaseException:
+                pass
+        self._runtime = None
+
+
+agent_factory = AgentFactory()
+
+AGENT_LLM_CALLS = metrics.histogram(
+    "agent_llm_calls_per_query", "LLM round trips per agent query", ("mode",), buckets=(1, 2, 3, 4, 5, 6, 8, 10)
 )
 
 
-async def process_medical_query(user_input: str, has_image: bool = False, image_context: str = None, image_data: bytes = None) -> dict:
+async def register_image(request_id: str, image_data: bytes) -> dict:
+    """
+    Preprocess an uploaded image for LLaVA and register the result for this request's tools
+    
+    Returns:
+        dict: Preprocessing stats (before/after bytes, sizes, tiles, timing)
+    """
+    if os.getenv("IMAGE_PREPROCESS", "true").lower() != "true":
+        image_store.put(request_id, image_data)
+        return {"input_bytes": len(image_data), "output_bytes": len(image_data), "preprocessed": False}
+    # Pillow is only loaded once an image arrives
+    from imaging import preprocess_image
+
+    try:
+        # Decoding and resampling is CPU-bound, keep it off the event loop
+        with span("image_preprocess"):
+            images, stats = await asyncio.to_thread(preprocess_image, image_data)
+    except Exception as e:
+        logger.warning("[IMAGE PREPROCESS] Failed, sending original image: %s", e)
+        image_store.put(request_id, image_data)
+        return {"input_bytes": len(image_data), "output_bytes": len(image_data), "preprocessed": False, "error": str(e)}
+    image_store.put_all(request_id, images)
+    logger.info("[IMAGE PREPROCESS] %s -> %s bytes, %s image(s) in %sms", stats["input_bytes"], stats["output_bytes"], stats["tiles"], stats["duration_ms"])
+    return {**stats, "preprocessed": True}
+
+
+def fast_path_decision(user_input: str, has_image: bool) -> dict:
+    """
+    Decide whether a message can skip the agent and call a tool directly
+    
+    Returns:
+        dict: The router decision, or None when the full agent should run
+    """
+    return_direct_tool.set(None)
+    if has_image or os.getenv("ROUTER_ENABLED", "true").lower() != "true":
+        return None
+    decision = route_query(user_input)
+    if decision["single_intent"]:
+        # The agent may end the run with this tool's output instead of a final LLM call
+        return_direct_tool.set(decision["tool"])
+    return decision if decision["fast_path"] else None
+
+
+# Strong references to fire-and-forget tasks so they are not garbage collected mid-flight
+_background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _tool_input(event: dict, planned: dict):
+    """
+    Input of an on_tool_start event. ReAct tools take a string, which the event reports as {}, so
+    the executor's planned action for the tool is used then; {"input": ...} wrappers are unwrapped.
+    """
+    tool_input = event["data"].get("input")
+    queued = planned.get(event["name"])
+    action_input = queued.pop(0) if queued else None
+    if not tool_input:
+        tool_input = action_input
+    if isinstance(tool_input, dict) and set(tool_input) == {"input"}:
+        tool_input = tool_input["input"]
+    return tool_input
+
+
+def emergency_lane(user_input: str, session_key: str) -> dict:
+    """
+    Assess a message for emergencies before the agent runs, dispatching the emergency call
+    when the severity reaches EMERGENCY_DISPATCH_SEVERITY
+    
+    Returns:
+        dict: The emergency assessment, with "dispatched" set when the call was placed
+    """
+    assessment = assess_emergency(user_input)
+    dispatch_severity = os.getenv("EMERGENCY_DISPATCH_SEVERITY", "critical")
+    assessment["dispatched"] = (
+        assessment["severity"] != "none"
+        and SEVERITY_LEVELS.index(assessment["severity"]) >= SEVERITY_LEVELS.index(dispatch_severity)
+    )
+    if assessment["dispatched"]:
+        logger.warning("[EMERGENCY LANE] %s severity (%s) detected in %sus", assessment["severity"], ", ".join(assessment["matches"]), assessment["detection_us"])
+        handle = emergency_dispatcher.dispatch(f"Emergency reported by user: {user_input[:200]}", session_key=session_key)
+        assessment["call"] = handle.to_dict()
+    return assessment
+
+
+def emergency_response(metadata: dict) -> dict:
+    """Immediate response returned when the emergency lane dispatches a call"""
+    return {
+        "response": (
+            "🚨 This sounds like a medical emergency. An emergency call is being placed to your emergency contact right now.\n\n"
+            "Please call your local emergency number immediately (108 in India, 911 in the US, 112 in Europe). "
+            "If someone is with you, ask them to stay with you until help arrives. Do not drive yourself to the hospital."
+        ),
+        "tool_used": "emergency_lane",
+        "all_tools_used": ["emergency_lane"],
+        "source": "emergency",
+        "has_emergency": True,
+        "metadata": metadata
+    }
+
+
+def continue_agent_after_emergency() -> bool:
+    return os.getenv("EMERGENCY_CONTINUE_AGENT", "false").lower() == "true"
+
+
+async def continue_agent_in_background(user_input: str, has_image: bool, image_context: str, image_data: bytes) -> None:
+    """Let the agent keep working on a message answered by the emergency lane, for the logs"""
+    result = await process_medical_query(user_input, has_image, image_context, image_data, skip_emergency_lane=True)
+    logger.info("[EMERGENCY LANE] Background agent finished: %.200s", result["response"])
+
+
+async def process_medical_query(user_input: str, has_image: bool = False, image_context: str = None, image_data: bytes = None, request_id: str = None, skip_emergency_lane: bool = False, session_id: str = None) -> dict:
     """
     Process a medical query using the agentic AI system
     
@@ -56,78 +207,304 @@ async def process_medical_query(user_input: str, has_image: bool = False, image_
         has_image (bool): Whether an image was uploaded
         image_context (str): Context about the uploaded image
         image_data (bytes): The actual image data for analysis
+        request_id (str): Request ID reported in the metadata and logs (defaults to the X-Request-ID one)
+        skip_emergency_lane (bool): Run the agent even if the message is an emergency
+        session_id (str): Conversation session to continue; a new one is started when missing or expired
     
     Returns:
-        dict: Response containing the AI's answer, tools used, and metadata
+        dict: Response containing the AI's answer, tools used, and metadata (including the session_id)
     """
-    print(f"\n🚀 [QUERY START] Processing: '{user_input[:100]}...'")
+    logger.info("[QUERY START] Processing: %.100r", user_input)
     
-    # Store image data globally for tools to access
-    if has_image and image_data:
-        # Store image data in a way tools can access it
-        # Save the image data to a temporary file and store the path for tools to access
-        temp_dir = "agentic_ai_images"
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        else:
-            os.makedirs(temp_dir, exist_ok=True)
-        image_path = os.path.join(temp_dir, f"uploaded_image.bin")
-        with open(image_path, "wb") as f:
-            f.write(image_data)
-        print(f"🖼️ [IMAGE DATA] Stored {len(image_data)} bytes for analysis")
+    # The image is registered under a server-generated ID so only this run's tools can see it;
+    # client-supplied request IDs can repeat and are only used to correlate logs
+    run_id = uuid.uuid4().hex
+    request_id = request_id or request_id_var.get() or run_id
+    request_token = current_request_id.set(run_id)
+    priority_token = request_priority.set(PRIORITY_NORMAL)
+    session = await session_store.aget(session_id)
+    session_token = current_session_id.set(session.id)
+    metadata = {"request_id": request_id, "session_id": session.id}
     try:
+        # Emergencies are detected and dispatched before any LLM call
+        if skip_emergency_lane:
+            assessment = assess_emergency(user_input)
+        else:
+            assessment = emergency_lane(user_input, session.id)
+        metadata["emergency"] = assessment
+        # Emergency-flagged requests are served first by every downstream wait queue
+        request_priority.set(PRIORITY_EMERGENCY if assessment["has_emergency"] else PRIORITY_NORMAL)
+        if assessment.get("dispatched"):
+            if continue_agent_after_emergency():
+                run_in_background(continue_agent_in_background(user_input, has_image, image_context, image_data))
+            result = emergency_response(metadata)
+            await session_store.arecord(session, user_input, result["response"])
+            return result
+
+        if has_image and image_data:
+            metadata["image"] = await register_image(run_id, image_data)
+
         # Modify input if image is present
         original_input = user_input
         if has_image and image_context:
             user_input = f"{user_input} [Image uploaded: {image_context}]"
 
-        # Execute the agent with timeout protection
-        import concurrent.futures
-        import asyncio
-        loop = asyncio.get_event_loop()
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            try:
-                # Set timeout to 60 seconds to prevent hanging
+        # Simple lookups skip the LLM loop entirely
+        decision = fast_path_decision(original_input, has_image)
+        if decision:
+            with span("tool", decision["tool"]):
+                response = await TOOLS_BY_NAME[decision["tool"]](decision["argument"], **decision.get("options", {}))
+            metadata["route"] = decision
+            logger.info("[FAST PATH] Answered with %s", decision["tool"])
+            await session_store.arecord(session, user_input, response)
+            return {
+                "response": response,
+                "tool_used": decision["tool"],
+                "all_tools_used": [decision["tool"]],
+                "source": "fast_path",
+                "has_emergency": assessment["has_emergency"],
+                "metadata": metadata
+            }
+
+        runtime = await agent_factory.get()
+        # Already imported by the factory
+        from agent_runtime import TokenBudgetExceeded, token_usage_handler, budget_exceeded_response
+
+        # Execute the agent on the server event loop with timeout protection
+        usage = token_usage_handler()
+        source = "agentic_ai"
+        try:
+            with span("agent_run"):
                 result = await asyncio.wait_for(
-                    loop.run_in_executor(
-                        executor, 
-                        lambda: agent_executor.invoke({"input": user_input})
+                    runtime.agent_executor.ainvoke(
+                        # Bounded conversation context: running summary, known facts and recent turns
+                        {"input": session_store.build_input(session, user_input)},
+                        config={"metadata": {"request_id": request_id}, "callbacks": [usage, runtime.span_callbacks]}
                     ),
                     timeout=90
                 )
-            except asyncio.TimeoutError:
-                return {
-                    "response": "I apologize, but your query is taking longer than expected to process. Please try asking a more specific question or break down your request into smaller parts.",
-                    "tool_used": "timeout_handler",
-                    "all_tools_used": ["timeout_handler"],
-                    "source": "timeout_handler",
-                    "has_emergency": False
-                }
+        except TokenBudgetExceeded as e:
+            logger.warning("[TOKEN BUDGET] %s", e)
+            result = {"output": budget_exceeded_response(usage)}
+            source = "token_budget"
+        except asyncio.TimeoutError:
+            return {
+                "response": "I apologize, but your query is taking longer than expected to process. Please try asking a more specific question or break down your request into smaller parts.",
+                "tool_used": "timeout_handler",
+                "all_tools_used": ["timeout_handler"],
+                "source": "timeout_handler",
+                "has_emergency": assessment["has_emergency"]
+            }
         
+        metadata["tokens"] = usage.to_dict()
+        metadata["agent_mode"] = runtime.mode
+        if result.get("return_direct"):
+            # The tool's answer was returned without a final LLM call
+            metadata["return_direct"] = result["return_direct"]
+        AGENT_LLM_CALLS.observe(len(usage.iterations), mode=runtime.mode)
         # Extract information from the result
         response = result.get("output", "I'm here to help with your medical questions.")
-        print(f"📝 [RESPONSE] Generated response: {len(response)} characters")
-        # Check if emergency was detected (basic keyword check)
-        emergency_keywords = ["emergency", "urgent", "severe", "critical", "help", "pain", "bleeding", "cant breathe", "chest pain"]
-        has_emergency = any(keyword in original_input.lower() for keyword in emergency_keywords)
+        logger.info("[RESPONSE] Generated response: %d characters, %d tokens in %d LLM call(s)", len(response), usage.total_tokens, len(usage.iterations))
+        await session_store.arecord(session, user_input, response)
+        has_emergency = assessment["has_emergency"]
         
         if has_emergency:
-            print(f"🚨 [EMERGENCY DETECTED] Emergency keywords found in query!")
+            logger.warning("[EMERGENCY DETECTED] %s severity: %s", assessment["severity"], ", ".join(assessment["matches"]))
         final_result = {
             "response": response,
             "tool_used": "agentic_ai",
             "all_tools_used": ["medical_agent"],
-            "source": "agentic_ai",
-            "has_emergency": has_emergency
+            "source": source,
+            "has_emergency": has_emergency,
+            "metadata": metadata
         }
         return final_result
         
+    except Overloaded:
+        # Answered with 429 and Retry-After by the API
+        raise
     except Exception as e:
-        print(f"❌ [ERROR] Agent execution failed: {str(e)}")
+        logger.exception("[ERROR] Agent execution failed: %s", e)
         return {
             "response": f"I apologize, but I encountered an issue processing your request: {str(e)}. Please try rephrasing your question or contact a healthcare professional directly if this is urgent.",
             "tool_used": "error",
             "all_tools_used": [],
             "source": "error",
-            "has_emergency": False
+            # The lane may have flagged the message before the agent failed
+            "has_emergency": metadata.get("emergency", {}).get("has_emergency", False)
         }
+    finally:
+        image_store.discard(run_id)
+        request_priority.reset(priority_token)
+        current_request_id.reset(request_token)
+        current_session_id.reset(session_token)
+
+
+async def stream_medical_query(user_input: str, has_image: bool = False, image_context: str = None, image_data: bytes = None, request_id: str = None, session_id: str = None):
+    """
+    Process a medical query like process_medical_query, yielding events as the agent works
+    
+    Yields:
+        dict: Events named by their "event" key:
+            emergency   - the emergency lane dispatched a call; a final event with the immediate response follows
+            thought     - the agent's reasoning before it picks a tool
+            tool_start  - a tool was chosen and started, with its input
+            tool_token  - a token generated by a tool's model (MedGemma/LLaVA)
+            tool_end    - a tool finished, with its output
+            token       - a token of the final answer
+            final       - the complete response; always the last event unless an error occurs
+            error       - the query failed, timed out or was rejected (status 429 with retry_after); always the last event
+    """
+    logger.info("[STREAM START] Processing: %.100r", user_input)
+    # Server-generated key for the uploaded image, as in process_medical_query
+    run_id = uuid.uuid4().hex
+    request_id = request_id or request_id_var.get() or run_id
+    original_input = user_input
+    session = await session_store.aget(session_id)
+    metadata = {"request_id": request_id, "session_id": session.id}
+    if has_image and image_context:
+        user_input = f"{user_input} [Image uploaded: {image_context}]"
+
+    events = asyncio.Queue()
+
+    async def run_agent():
+        # Context variables set here stay local to this task
+        current_request_id.set(run_id)
+        current_session_id.set(session.id)
+        assessment = emergency_lane(original_input, session.id)
+        metadata["emergency"] = assessment
+        request_priority.set(PRIORITY_EMERGENCY if assessment["has_emergency"] else PRIORITY_NORMAL)
+        if assessment["dispatched"]:
+            events.put_nowait({"event": "emergency", **assessment})
+            if continue_agent_after_emergency():
+                run_in_background(continue_agent_in_background(original_input, has_image, image_context, image_data))
+            result = emergency_response(metadata)
+            await session_store.arecord(session, original_input, result["response"])
+            events.put_nowait({"event": "final", **result})
+            return
+        if has_image and image_data:
+            metadata["image"] = await register_image(run_id, image_data)
+        decision = fast_path_decision(original_input, has_image)
+        if decision:
+            metadata["route"] = decision
+            events.put_nowait({"event": "tool_start", "tool": decision["tool"], "input": decision["argument"]})
+            with span("tool", decision["tool"]):
+                response = await TOOLS_BY_NAME[decision["tool"]](decision["argument"], **decision.get("options", {}))
+            events.put_nowait({"event": "tool_end", "tool": decision["tool"], "output": response})
+            await session_store.arecord(session, user_input, response)
+            events.put_nowait({
+                "event": "final",
+                "response": response,
+                "tool_used": decision["tool"],
+                "source": "fast_path",
+                "has_emergency": assessment["has_emergency"],
+                "metadata": metadata
+            })
+            return
+        runtime = await agent_factory.get()
+        from agent_runtime import TokenBudgetExceeded, token_usage_handler, budget_exceeded_response
+
+        # Tool-calling turns carry no text besides the answer, ReAct answers follow the marker
+        final_marker = "" if runtime.mode == "tools" else "Final Answer:"
+        token_sink.set(lambda token: events.put_nowait({"event": "tool_token", "token": token}))
+        llm_text = ""
+        emitted = 0
+        planned = {}  # tool name -> inputs of the executor's actions not started yet
+        usage = token_usage_handler()
+        try:
+            with span("agent_run"):
+                async for event in runtime.agent_executor.astream_events(
+                    {"input": session_store.build_input(session, user_input)},
+                    config={"metadata": {"request_id": request_id}, "callbacks": [usage, runtime.span_callbacks]},
+                    version="v2"
+                ):
+                    kind = event["event"]
+                    if kind == "on_chat_model_start":
+                        llm_text = ""
+                        emitted = 0
+                    elif kind == "on_chat_model_stream":
+                        llm_text += event["data"]["chunk"].content
+                        marker = llm_text.find(final_marker)
+                        if marker >= 0:
+                            start = max(marker + len(final_marker), emitted)
+                            if len(llm_text) > start:
+                                events.put_nowait({"event": "token", "token": llm_text[start:]})
+                                emitted = len(llm_text)
+                    elif kind == "on_chat_model_end" and final_marker:
+                        thought = llm_text.split(final_marker)[0].split("Action:")[0].strip()
+                        if thought:
+                            events.put_nowait({"event": "thought", "text": thought})
+                    elif kind == "on_chain_stream" and not event["parent_ids"]:
+                        # The executor streams each turn's actions before running their tools
+                        for action in event["data"]["chunk"].get("actions", []):
+                            planned.setdefault(action.tool, []).append(action.tool_input)
+                    elif kind == "on_tool_start":
+                        events.put_nowait({"event": "tool_start", "tool": event["name"], "input": _tool_input(event, planned)})
+                    elif kind == "on_tool_end":
+                        events.put_nowait({"event": "tool_end", "tool": event["name"], "output": str(event["data"].get("output"))})
+                    elif kind == "on_chain_end" and not event["parent_ids"]:
+                        # The executor itself is the root run
+                        output = event["data"]["output"]
+                        response = output.get("output", "I'm here to help with your medical questions.")
+                        metadata["tokens"] = usage.to_dict()
+                        metadata["agent_mode"] = runtime.mode
+                        if output.get("return_direct"):
+                            metadata["return_direct"] = output["return_direct"]
+                        AGENT_LLM_CALLS.observe(len(usage.iterations), mode=runtime.mode)
+                        logger.info("[RESPONSE] Streamed response: %d characters, %d tokens in %d LLM call(s)", len(response), usage.total_tokens, len(usage.iterations))
+                        await session_store.arecord(session, user_input, response)
+                        events.put_nowait({
+                            "event": "final",
+                            "response": response,
+                            "tool_used": "agentic_ai",
+                            "source": "agentic_ai",
+                            "has_emergency": assessment["has_emergency"],
+                            "metadata": metadata
+                        })
+        except TokenBudgetExceeded as e:
+            logger.warning("[TOKEN BUDGET] %s", e)
+            metadata["tokens"] = usage.to_dict()
+            response = budget_exceeded_response(usage)
+            await session_store.arecord(session, user_input, response)
+            events.put_nowait({
+                "event": "final",
+                "response": response,
+                "tool_used": "agentic_ai",
+                "source": "token_budget",
+                "has_emergency": assessment["has_emergency"],
+                "metadata": metadata
+            })
+
+    async def run_agent_with_timeout():
+        try:
+            await asyncio.wait_for(run_agent(), timeout=90)
+        except asyncio.TimeoutError:
+            events.put_nowait({
+                "event": "error",
+                "message": "I apologize, but your query is taking longer than expected to process. Please try asking a more specific question or break down your request into smaller parts."
+            })
+        except Overloaded as e:
+            logger.warning("[SCHEDULER] %s", e)
+            events.put_nowait({"event": "error", "status": 429, "retry_after": e.retry_after, "message": str(e)})
+        except Exception as e:
+            logger.exception("[ERROR] Agent streaming failed: %s", e)
+            events.put_nowait({
+                "event": "error",
+                "message": f"I apologize, but I encountered an issue processing your request: {str(e)}. Please try rephrasing your question or contact a healthcare professional directly if this is urgent."
+            })
+        else:
+            events.put_nowait({"event": "done"})
+
+    task = asyncio.create_task(run_agent_with_timeout())
+    try:
+        while True:
+            event = await events.get()
+            if event["event"] == "done":
+                break
+            yield event
+            if event["event"] == "error":
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+        image_store.discard(run_id)
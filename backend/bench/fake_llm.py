@@ -0,0 +1,159 @@
+"""
+Scripted chat model standing in for gpt-4o-mini in the agent during benchmarks (BENCH_FAKE_LLM=true).
+
+It picks tools from keywords in the question, answers after the first observations, sleeps for a
+configurable latency and reports token usage, so agent overhead can be measured without OpenAI.
+With tools bound (AGENT_MODE=tools) it requests one get_medication_information call per medication
+named in the question, in the same turn, like a function-calling model would.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from bench.latency import LatencyDistribution
+from config import DRUG_ALIASES
+from scheduler import scheduler
+
+_MEDICATION = re.compile(r"\b(?:medication|medicine|drug|tablet|dose|dosage|side effects?|ibuprofen|paracetamol|metformin|aspirin)\b", re.IGNORECASE)
+_APPOINTMENT = re.compile(r"\bappointments?\b", re.IGNORECASE)
+_QUESTION = re.compile(r"(?:Current question|Question): (?P<question>.+)")
+_DRUG = re.compile(
+    r"\b(?:" + "|".join(re.escape(name) for name in sorted(set(DRUG_ALIASES) | set(DRUG_ALIASES.values()), key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+FINAL_ANSWER = (
+    "Based on the specialist's assessment, rest, stay hydrated and monitor your symptoms. "
+    "Please consult a healthcare professional if they persist or worsen."
+)
+
+
+def _choose_tool(question: str) -> str:
+    if "[Image uploaded" in question:
+        return "analyze_medical_image"
+    if _MEDICATION.search(question):
+        return "get_medication_information"
+    if _APPOINTMENT.search(question):
+        return "schedule_appointment_helper"
+    return "ask_medical_specialist"
+
+
+def script_reply(prompt: str) -> str:
+    """
+    Next ReAct step for a rendered agent prompt: one tool call, then the final answer
+    """
+    scratchpad = prompt.rsplit("Question:", 1)[-1]
+    if "Observation:" in scratchpad:
+        return f"Thought: I now know the final answer\nFinal Answer: {FINAL_ANSWER}"
+    questions = _QUESTION.findall(prompt)
+    question = questions[-1].strip() if questions else "general health question"
+    tool = _choose_tool(question)
+    return f"Thought: I should use {tool} for this question\nAction: {tool}\nAction Input: {question[:200]}"
+
+
+def script_tool_calls(messages: List[BaseMessage], tools: list) -> list:
+    """
+    Tool calls for the next function-calling turn: every independent call at once, none after results
+    """
+    if any(isinstance(message, ToolMessage) for message in messages):
+        return []
+    questions = [str(message.content) for message in messages if isinstance(message, HumanMessage)]
+    question = questions[-1] if questions else "general health question"
+    plan = []
+    if "[Image uploaded" in question:
+        plan.append(("analyze_medical_image", question))
+    medications = list(dict.fromkeys(match.lower() for match in _DRUG.findall(question)))
+    plan.extend(("get_medication_information", medication) for medication in medications)
+    if not plan:
+        plan.append((_choose_tool(question), question))
+    parameters = {
+        spec["function"]["name"]: next(iter(spec["function"]["parameters"].get("properties", {})), "input")
+        for spec in tools
+    }
+    return [
+        {"name": name, "args": {parameters.get(name, "input"): argument[:200]}, "id": f"call_{uuid.uuid4().hex[:12]}", "type": "tool_call"}
+        for name, argument in plan
+    ]
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model emitting scripted ReAct traces after a sampled latency, holding an openai_llm slot like the real one
+    """
+    latency: str = os.getenv("BENCH_LLM_LATENCY", "lognormal:0.6,0.3")
+    chunk_size: int = 16
+    model_name: str = "bench-scripted"
+
+    @property
+    def _llm_type(self) -> str:
+        return "bench-scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _reply(self, messages: List[BaseMessage], tools: list = None) -> tuple:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if tools:
+            tool_calls = script_tool_calls(messages, tools)
+            text = "" if tool_calls else FINAL_ANSWER
+        else:
+            tool_calls = []
+            text = script_reply(prompt)
+        output_tokens = (len(text) + (len(json.dumps(tool_calls)) if tool_calls else 0)) // 4
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": output_tokens,
+            "total_tokens": len(prompt) // 4 + output_tokens,
+        }
+        return text, tool_calls, usage
+
+    def _result(self, text: str, tool_calls: list, usage: dict) -> ChatResult:
+        message = AIMessage(content=text, tool_calls=tool_calls, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        # Same script for invoke(); the scheduler's slots are async, so sync calls only sleep
+        text, tool_calls, usage = self._reply(messages, kwargs.get("tools"))
+        time.sleep(LatencyDistribution.parse(self.latency).sample())
+        return self._result(text, tool_calls, usage)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, tool_calls, usage = self._reply(messages, kwargs.get("tools"))
+        async with scheduler.slot("openai_llm"):
+            await asyncio.sleep(LatencyDistribution.parse(self.latency).sample())
+        return self._result(text, tool_calls, usage)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, tool_calls, usage = self._reply(messages, kwargs.get("tools"))
+        latency = LatencyDistribution.parse(self.latency).sample()
+        async with scheduler.slot("openai_llm"):
+            if tool_calls:
+                await asyncio.sleep(latency)
+                yield ChatGenerationChunk(message=AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index, "type": "tool_call_chunk"}
+                        for index, call in enumerate(tool_calls)
+                    ],
+                    usage_metadata=usage
+                ))
+                return
+            pieces = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+            # Half the latency before the first token, the rest spread over the stream
+            await asyncio.sleep(latency / 2)
+            for index, piece in enumerate(pieces):
+                chunk = ChatGenerationChunk(message=AIMessageChunk(
+                    content=piece,
+                    usage_metadata=usage if index == len(pieces) - 1 else None
+                ))
+                if run_manager:
+                    await run_manager.on_llm_new_token(piece, chunk=chunk)
+                yield chunk
+                await asyncio.sleep(latency / 2 / len(pieces))
@@ -0,0 +1,180 @@
+"""
+Local stand-ins for Ollama, the OpenAI audio endpoints and Twilio, for load tests without real models or accounts.
+
+Run from the backend directory:
+
+    python -m bench.fakes --port 9100 --ollama-latency lognormal:0.8,0.4 --token-delay 0.01
+
+then point the backend at it:
+
+    OLLAMA_BASE_URL=http://127.0.0.1:9100
+    OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    TWILIO_API_BASE_URL=http://127.0.0.1:9100
+    TWILIO_ACCOUNT_SID=ACbench TWILIO_AUTH_TOKEN=bench TWILIO_FROM_NUMBER=+15550000000 EMERGENCY_CONTACT=+15550000001
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from bench.latency import LatencyDistribution
+
+app = FastAPI(title="Benchmark stand-ins")
+
+config = {
+    "ollama_latency": LatencyDistribution.parse(os.getenv("BENCH_OLLAMA_LATENCY", "lognormal:0.5,0.4")),
+    "vision_latency": LatencyDistribution.parse(os.getenv("BENCH_VISION_LATENCY", "lognormal:1.5,0.4")),
+    "token_delay": float(os.getenv("BENCH_TOKEN_DELAY", "0.005")),
+    "speech_latency": LatencyDistribution.parse(os.getenv("BENCH_SPEECH_LATENCY", "lognormal:0.3,0.3")),
+    "transcription_latency": LatencyDistribution.parse(os.getenv("BENCH_TRANSCRIPTION_LATENCY", "lognormal:0.4,0.3")),
+    "twilio_latency": LatencyDistribution.parse(os.getenv("BENCH_TWILIO_LATENCY", "lognormal:0.2,0.3")),
+    "load_latency": LatencyDistribution.parse(os.getenv("BENCH_LOAD_LATENCY", "lognormal:2.0,0.3")),
+    "error_rate": float(os.getenv("BENCH_ERROR_RATE", "0")),
+}
+_random = random.Random()
+counters = {"generate": 0, "loads": 0, "speech": 0, "transcriptions": 0, "calls": 0, "errors": 0}
+# Loaded models and when their keep-alive expires, like Ollama unloading idle models
+loaded_models = {}
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+_ANSWER = (
+    "Based on the information provided, this is commonly caused by tension, dehydration or lack of sleep. "
+    "Rest, fluids and over-the-counter pain relief usually help. Seek medical attention if symptoms are severe, "
+    "sudden or persistent. Please consult a healthcare professional for personalised advice."
+)
+
+
+def _should_fail() -> bool:
+    rate = config["error_rate"]
+    if rate and _random.random() < rate:
+        counters["errors"] += 1
+        return True
+    return False
+
+
+def _keep_alive_seconds(value) -> float:
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        value = str(value).strip()
+        unit = next((unit for unit in ("ms", "s", "m", "h") if value.endswith(unit)), None)
+        seconds = float(value[:-len(unit)]) * _DURATION_UNITS[unit] if unit else float(value)
+    return float("inf") if seconds < 0 else seconds
+
+
+async def _ensure_loaded(model: str, keep_alive) -> int:
+    """
+    Load the model if it is not resident and refresh its keep-alive; returns the load time in nanoseconds
+    """
+    load_duration = 0
+    expires_at = loaded_models.get(model)
+    if expires_at is None or expires_at <= time.time():
+        load_seconds = config["load_latency"].sample()
+        await asyncio.sleep(load_seconds)
+        counters["loads"] += 1
+        load_duration = int(load_seconds * 1e9)
+    loaded_models[model] = time.time() + _keep_alive_seconds(keep_alive)
+    return load_duration
+
+
+@app.post("/api/generate")
+async def generate(request: Request):
+    body = await request.json()
+    started = time.perf_counter()
+    load_duration = await _ensure_loaded(body.get("model"), body.get("keep_alive"))
+    if not body.get("prompt") and not body.get("images"):
+        # Preload request: load the model only
+        return {"model": body.get("model"), "response": "", "done": True, "done_reason": "load"}
+    counters["generate"] += 1
+    latency = (config["vision_latency"] if body.get("images") else config["ollama_latency"]).sample()
+    if _should_fail():
+        return JSONResponse({"error": "model overloaded"}, status_code=503)
+    words = _ANSWER.split(" ")
+    # Time to first token, then a steady token rate
+    first_token = max(0.0, latency - config["token_delay"] * len(words))
+    await asyncio.sleep(first_token)
+    if not body.get("stream"):
+        await asyncio.sleep(config["token_delay"] * len(words))
+        return {"model": body.get("model"), "response": _ANSWER, "done": True,
+                "load_duration": load_duration, "total_duration": int((time.perf_counter() - started) * 1e9)}
+
+    async def tokens():
+        for word in words:
+            yield json.dumps({"model": body.get("model"), "response": word + " ", "done": False}) + "\n"
+            await asyncio.sleep(config["token_delay"])
+        yield json.dumps({"model": body.get("model"), "response": "", "done": True, "load_duration": load_duration,
+                          "total_duration": int((time.perf_counter() - started) * 1e9)}) + "\n"
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+@app.get("/api/ps")
+async def running_models():
+    now = time.time()
+    return {"models": [{"name": model, "model": model} for model, expires_at in loaded_models.items() if expires_at > now]}
+
+
+@app.post("/v1/audio/speech")
+async def speech(request: Request):
+    body = await request.json()
+    counters["speech"] += 1
+    await asyncio.sleep(config["speech_latency"].sample())
+    # Roughly 1KB of "audio" per 15 characters of text
+    return Response(content=b"\xff\xfb" + os.urandom(max(64, len(body.get("input", "")) * 64)), media_type="audio/mpeg")
+
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(request: Request):
+    await request.body()
+    counters["transcriptions"] += 1
+    await asyncio.sleep(config["transcription_latency"].sample())
+    return {"text": "I have had a headache since yesterday, what should I do?"}
+
+
+@app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+async def twilio_calls(account_sid: str, request: Request):
+    form = await request.form()
+    counters["calls"] += 1
+    await asyncio.sleep(config["twilio_latency"].sample())
+    return JSONResponse({
+        "sid": f"CA{counters['calls']:032d}",
+        "account_sid": account_sid,
+        "to": form.get("To"),
+        "from": form.get("From"),
+        "status": "queued",
+    }, status_code=201)
+
+
+@app.get("/bench/counters")
+async def get_counters():
+    return counters
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the benchmark stand-ins for Ollama, OpenAI audio and Twilio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ollama-latency", help="latency spec for text generation, e.g. lognormal:0.5,0.4")
+    parser.add_argument("--vision-latency", help="latency spec for generation with images")
+    parser.add_argument("--speech-latency", help="latency spec for TTS")
+    parser.add_argument("--transcription-latency", help="latency spec for Whisper")
+    parser.add_argument("--twilio-latency", help="latency spec for Twilio calls")
+    parser.add_argument("--load-latency", help="latency spec for loading a model that is not resident")
+    parser.add_argument("--token-delay", type=float, help="seconds between streamed tokens")
+    parser.add_argument("--error-rate", type=float, help="fraction of Ollama calls answered with 503")
+    args = parser.parse_args()
+    for name in ("ollama_latency", "vision_latency", "load_latency", "speech_latency", "transcription_latency", "twilio_latency"):
+        if getattr(args, name):
+            config[name] = LatencyDistribution.parse(getattr(args, name))
+    if args.token_delay is not None:
+        config["token_delay"] = args.token_delay
+    if args.error_rate is not None:
+        config["error_rate"] = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,39 @@
+import random
+
+
+class LatencyDistribution:
+    """
+    Latency in seconds drawn from a distribution given as a spec string:
+
+        fixed:0.2              always 0.2s
+        uniform:0.1,0.5        uniform between 0.1s and 0.5s
+        normal:0.4,0.1         normal with mean 0.4s and standard deviation 0.1s (clipped at 0)
+        lognormal:0.4,0.5      lognormal with median 0.4s and shape 0.5 (long right tail)
+    """
+
+    def __init__(self, kind: str, params: tuple, seed: int = None):
+        self.kind = kind
+        self.params = params
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = None) -> "LatencyDistribution":
+        kind, _, params = spec.partition(":")
+        values = tuple(float(value) for value in params.split(",") if value)
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"Invalid latency spec {spec!r}, expected e.g. fixed:0.2, uniform:0.1,0.5, normal:0.4,0.1 or lognormal:0.4,0.5")
+        return cls(kind, values, seed)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self._random.uniform(*self.params)
+        if self.kind == "normal":
+            return max(0.0, self._random.gauss(*self.params))
+        median, shape = self.params
+        return self._random.lognormvariate(0.0, shape) * median
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(str(value) for value in self.params)}"
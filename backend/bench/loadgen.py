@@ -0,0 +1,255 @@
+"""
+Closed-loop load generator for the backend API with per-scenario latency percentiles.
+
+Run from the backend directory against a backend wired to the stand-ins in bench.fakes:
+
+    python -m bench.loadgen --base-url http://127.0.0.1:8000 --scenarios chat_text=4,chat_image=1,tts=2 \\
+        --concurrency 16 --duration 60 --output results/head.json --compare results/baseline.json
+
+Each result file is labelled with the git commit (or --label) so runs can be compared across changes.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import wave
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict
+import httpx
+
+QUESTIONS = [
+    "I have had a headache since yesterday, what should I do?",
+    "What are the side effects of ibuprofen?",
+    "Is it safe to take paracetamol with metformin?",
+    "I have a sore throat and a mild fever, should I see a doctor?",
+    "How much sleep does an adult need?",
+    "What can I do about lower back pain after exercise?",
+    "Can you help me book an appointment with a dermatologist?",
+    "My child has a rash on their arm, what could it be?",
+]
+
+SCENARIOS = ("chat_text", "chat_image", "voice", "tts", "emergency")
+
+
+def _png_bytes() -> bytes:
+    from PIL import Image
+
+    image = Image.new("RGB", (256, 256), (210, 160, 140))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _wav_bytes(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buffer.getvalue()
+
+
+class LoadGenerator:
+    """
+    Runs weighted scenarios from a fixed number of concurrent workers and records per-request latency
+    """
+
+    def __init__(self, base_url: str, weights: dict, concurrency: int, unique: bool = False, seed: int = None):
+        self.base_url = base_url.rstrip("/")
+        self.weights = weights
+        self.concurrency = concurrency
+        # Unique questions defeat the result cache and request coalescing, measuring the cold path
+        self.unique = unique
+        self._random = random.Random(seed)
+        self._image = _png_bytes() if "chat_image" in weights else None
+        self._audio = _wav_bytes() if "voice" in weights else None
+        self.samples = defaultdict(list)  # scenario -> [(status, seconds)]
+
+    def _question(self) -> str:
+        question = self._random.choice(QUESTIONS)
+        if self.unique:
+            question += f" (ref {uuid.uuid4().hex[:8]})"
+        return question
+
+    async def _request(self, client: httpx.AsyncClient, scenario: str) -> httpx.Response:
+        if scenario == "chat_text":
+            return await client.post("/chat", json={"message": self._question()})
+        if scenario == "chat_image":
+            message = "What is this skin condition?" + (f" (ref {uuid.uuid4().hex[:8]})" if self.unique else "")
+            return await client.post("/chat/upload", data={"message": message},
+                                     files={"image": ("bench.png", self._image, "image/png")})
+        if scenario == "voice":
+            return await client.post("/voice", files={"audio_file": ("bench.wav", self._audio, "audio/wav")})
+        if scenario == "tts":
+            return await client.post("/tts", json={"text": self._question()})
+        if scenario == "emergency":
+            return await client.post("/emergency-call", json={"session_id": uuid.uuid4().hex})
+        raise ValueError(f"Unknown scenario {scenario!r}")
+
+    async def _worker(self, client: httpx.AsyncClient, budget: dict, deadline: float) -> None:
+        scenarios = list(self.weights)
+        weights = [self.weights[name] for name in scenarios]
+        while time.perf_counter() < deadline:
+            if budget["remaining"] is not None:
+                if budget["remaining"] <= 0:
+                    return
+                budget["remaining"] -= 1
+            scenario = self._random.choices(scenarios, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self._request(client, scenario)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            self.samples[scenario].append((status, time.perf_counter() - start))
+
+    async def run(self, requests: int = None, duration: float = None) -> dict:
+        deadline = time.perf_counter() + duration if duration else float("inf")
+        budget = {"remaining": requests}
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=120.0, limits=limits) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(self._worker(client, budget, deadline) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+        return summarize(self.samples, elapsed)
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _stats(samples: list, elapsed: float) -> dict:
+    latencies = sorted(seconds for _, seconds in samples)
+    statuses = defaultdict(int)
+    for status, _ in samples:
+        statuses[status] += 1
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    stats = {
+        "count": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "status": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+    }
+    if latencies:
+        stats.update({
+            "p50_ms": round(_percentile(latencies, 0.50) * 1000, 1),
+            "p95_ms": round(_percentile(latencies, 0.95) * 1000, 1),
+            "p99_ms": round(_percentile(latencies, 0.99) * 1000, 1),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+            "max_ms": round(latencies[-1] * 1000, 1),
+        })
+    return stats
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    """
+    Latency percentiles, error rates and throughput per scenario and overall
+    """
+    everything = [sample for scenario_samples in samples.values() for sample in scenario_samples]
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "overall": _stats(everything, elapsed),
+        "scenarios": {scenario: _stats(scenario_samples, elapsed) for scenario, scenario_samples in sorted(samples.items())},
+    }
+
+
+def parse_weights(spec: str) -> dict:
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}, expected one of {', '.join(SCENARIOS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def git_label() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print_table(title: str, report: dict) -> None:
+    print(f"\n{title}")
+    print(f"{'scenario':<12} {'count':>7} {'err%':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    rows = list(report["scenarios"].items()) + [("overall", report["overall"])]
+    for name, stats in rows:
+        print(f"{name:<12} {stats['count']:>7} {stats['error_rate'] * 100:>6.1f} {stats['throughput_rps']:>7.2f} "
+              f"{stats.get('p50_ms', 0):>8.1f} {stats.get('p95_ms', 0):>8.1f} {stats.get('p99_ms', 0):>8.1f} {stats.get('max_ms', 0):>8.1f}")
+
+
+def compare(baseline: dict, current: dict) -> None:
+    """
+    Print the change in p50/p95/p99, error rate and throughput against a baseline result file
+    """
+    print(f"\nComparison: {baseline.get('label')} -> {current.get('label')}")
+    print(f"{'scenario':<12} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>9}")
+    base_rows = dict(baseline["report"]["scenarios"], overall=baseline["report"]["overall"])
+    rows = dict(current["report"]["scenarios"], overall=current["report"]["overall"])
+    for name, stats in rows.items():
+        base = base_rows.get(name)
+        if base is None:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "error_rate", "throughput_rps"):
+            before, after = base.get(metric, 0), stats.get(metric, 0)
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+            print(f"{name:<12} {metric:<15} {before:>10} {after:>10} {change:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the medical consultation backend")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", type=parse_weights, default=parse_weights("chat_text=4,chat_image=1,voice=1,tts=2"),
+                        help=f"weighted mix, e.g. chat_text=4,tts=1 (scenarios: {', '.join(SCENARIOS)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, help="total number of requests to send")
+    parser.add_argument("--duration", type=float, help="seconds to run for (default 30 when --requests is not given)")
+    parser.add_argument("--unique", action="store_true", help="make every question unique to bypass caching and coalescing")
+    parser.add_argument("--seed", type=int, help="random seed for the scenario mix")
+    parser.add_argument("--label", help="label stored with the results (default: current git commit)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results against")
+    args = parser.parse_args()
+    if args.requests is None and args.duration is None:
+        args.duration = 30.0
+
+    generator = LoadGenerator(args.base_url, args.scenarios, args.concurrency, unique=args.unique, seed=args.seed)
+    report = asyncio.run(generator.run(requests=args.requests, duration=args.duration))
+    result = {
+        "label": args.label or git_label(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "base_url": args.base_url,
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "unique": args.unique,
+        },
+        "report": report,
+    }
+    _print_table(f"Results for {result['label']} ({report['elapsed_s']}s, concurrency {args.concurrency})", report)
+    if args.output:
+        directory = os.path.dirname(args.output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+    return 0 if report["overall"]["count"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
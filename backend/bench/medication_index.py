@@ -0,0 +1,169 @@
+"""
+Benchmark for the medication monograph index: build time, memory footprint and lookup latency.
+
+    python -m bench.medication_index --iterations 2000 --synthetic 20000
+
+Lookups are timed per kind (exact generic name, brand alias, misspelling, free-form tool input, miss).
+--synthetic adds generated drug names to the dataset to see how the index scales past the shipped file.
+A near-neighbour check then makes sure other drugs a few edits from an indexed one (paroxetine next to
+fluoxetine) miss instead of returning the wrong monograph; the exit status is 1 when one does.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from medication_index import MedicationIndex, DEFAULT_PATH
+
+_SYLLABLES = ("am", "bro", "cal", "dex", "fen", "gli", "lo", "mex", "nor", "pra", "ral", "sol", "tri", "vas", "zol")
+_SUFFIXES = ("pril", "sartan", "olol", "statin", "mab", "azole", "cillin", "mycin", "pine", "tidine")
+
+
+def synthetic_records(count: int, seed: int = 7) -> list:
+    """
+    Generated monographs with plausible drug-like names and one brand alias each
+    """
+    generator = random.Random(seed)
+    records = []
+    for i in range(count):
+        stem = "".join(generator.choice(_SYLLABLES) for _ in range(generator.randint(2, 3)))
+        records.append({
+            "name": f"{stem}{generator.choice(_SUFFIXES)}{i}",
+            "aliases": [f"{stem[::-1]}x{i}"],
+            "drug_class": "synthetic",
+            "uses": "Benchmarking",
+        })
+    return records
+
+
+def _misspell(name: str, generator: random.Random) -> str:
+    # One adjacent transposition, deletion or substitution away from the name
+    i = generator.randrange(1, len(name) - 1)
+    edit = generator.choice(("swap", "drop", "replace"))
+    if edit == "swap":
+        return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    if edit == "drop":
+        return name[:i] + name[i + 1:]
+    return name[:i] + generator.choice("aeiourst") + name[i + 1:]
+
+
+def build_queries(records: list, iterations: int, seed: int = 11) -> dict:
+    generator = random.Random(seed)
+    single_word = [record for record in records if " " not in record["name"] and len(record["name"]) >= 6]
+    with_aliases = [record for record in records if record["aliases"]]
+    return {
+        "exact": [generator.choice(records)["name"] for _ in range(iterations)],
+        "alias": [generator.choice(generator.choice(with_aliases)["aliases"]) for _ in range(iterations)],
+        "misspelled": [_misspell(generator.choice(single_word)["name"], generator) for _ in range(iterations)],
+        "tool_input": [f"side effects of {generator.choice(records)['name']} 500mg tablets" for _ in range(iterations)],
+        "miss": [f"unknowndrug{generator.randrange(10 ** 6)}" for _ in range(iterations)],
+    }
+
+
+# Different drugs a few edits from an indexed one: these must miss (and go to the LLM), never return the neighbour
+NEAR_NEIGHBOURS = (
+    "paroxetine", "duloxetine", "ranitidine", "lamotrigine", "olmesartan", "rabeprazole", "prednisone",
+    "desloratadine", "aceclofenac", "levocetirizine", "telmisartan", "nitrofurantoin",
+)
+# Single typos of indexed names, which should still be corrected
+TYPOS = {
+    "ibuprofn": "ibuprofen",
+    "metfromin": "metformin",
+    "side effects of amlodipin": "amlodipine",
+    "lipitorr": "atorvastatin",
+    "amoxicilin and clavulanate": "amoxicillin and clavulanate",
+}
+
+
+def check_near_neighbours(index: MedicationIndex) -> list:
+    """
+    Wrong-drug answers for NEAR_NEIGHBOURS and missed corrections for TYPOS, as (query, problem) pairs
+    """
+    problems = []
+    for query in NEAR_NEIGHBOURS:
+        match = index.lookup(query)
+        if match is not None and match.monograph.name != query and query not in match.monograph.aliases:
+            problems.append((query, f"matched {match.monograph.name} ({match.method})"))
+    for query, expected in TYPOS.items():
+        match = index.lookup(query)
+        if match is None or match.monograph.name != expected:
+            problems.append((query, f"expected {expected}, got {match.monograph.name if match else 'a miss'}"))
+    return problems
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def time_lookups(index: MedicationIndex, queries: list) -> dict:
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        match = index.lookup(query)
+        latencies.append(time.perf_counter() - start)
+        hits += match is not None
+    latencies.sort()
+    return {
+        "count": len(queries),
+        "hit_rate": round(hits / len(queries), 4),
+        "p50_us": round(_percentile(latencies, 0.50) * 1e6, 1),
+        "p95_us": round(_percentile(latencies, 0.95) * 1e6, 1),
+        "p99_us": round(_percentile(latencies, 0.99) * 1e6, 1),
+        "max_us": round(latencies[-1] * 1e6, 1),
+    }
+
+
+def run(path: str, synthetic: int, iterations: int) -> dict:
+    records = MedicationIndex.read_records(path) + synthetic_records(synthetic)
+    index = MedicationIndex(path=path)
+    tracemalloc.start()
+    index.build(records)
+    memory_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # Timed again without tracemalloc, which slows allocation-heavy code down
+    index.build(records)
+    stats = index.stats()
+    return {
+        "dataset": path,
+        "records": len(records),
+        "names": stats["names"],
+        "build_ms": stats["build_ms"],
+        "memory_kb": round(memory_bytes / 1024, 1),
+        "peak_memory_kb": round(peak_bytes / 1024, 1),
+        "lookups": {kind: time_lookups(index, queries) for kind, queries in build_queries(records, iterations).items()},
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the medication monograph index")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="monograph dataset (CSV or JSON)")
+    parser.add_argument("--synthetic", type=int, default=0, help="generated monographs added to the dataset")
+    parser.add_argument("--iterations", type=int, default=2000, help="lookups timed per query kind")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = run(args.path, args.synthetic, args.iterations)
+    index = MedicationIndex(path=args.path)
+    index.build(MedicationIndex.read_records(args.path))
+    result["near_neighbour_problems"] = [f"{query}: {problem}" for query, problem in check_near_neighbours(index)]
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 1 if result["near_neighbour_problems"] else 0
+    print(f"Indexed {result['records']} monographs ({result['names']} names) "
+          f"in {result['build_ms']}ms; {result['memory_kb']}KB resident, {result['peak_memory_kb']}KB peak during build\n")
+    print(f"{'lookup':<12} {'count':>7} {'hit%':>6} {'p50 us':>9} {'p95 us':>9} {'p99 us':>9} {'max us':>9}")
+    for kind, stats in result["lookups"].items():
+        print(f"{kind:<12} {stats['count']:>7} {stats['hit_rate'] * 100:>6.1f} {stats['p50_us']:>9} "
+              f"{stats['p95_us']:>9} {stats['p99_us']:>9} {stats['max_us']:>9}")
+    print(f"\nNear-neighbour check ({len(NEAR_NEIGHBOURS)} other drugs, {len(TYPOS)} typos): "
+          + ("ok" if not result["near_neighbour_problems"] else "FAILED"))
+    for problem in result["near_neighbour_problems"]:
+        print(f"  {problem}")
+    return 1 if result["near_neighbour_problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
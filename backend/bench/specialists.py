@@ -0,0 +1,166 @@
+"""
+Benchmark for the specialist directory: index build and load time, memory and k-nearest search latency.
+
+    python -m bench.specialists --providers 500000 --queries 2000
+
+A synthetic directory is generated around the places in the geocoding table (or read from --directory).
+The index is built once, then loaded again from its saved arrays the way a restart would, and searches
+are timed with and without a specialty filter and checked against a brute-force scan.
+--write saves the generated directory as CSV, e.g. to try the tool with data/specialists.csv.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from config import SPECIALTY_ALIASES
+from specialists import DATA_DIR, Geocoder, SpecialistDirectory, haversine_km
+
+SPECIALTIES = sorted({specialty.title() for specialty in SPECIALTY_ALIASES.values()})
+
+
+def synthetic_directory(count: int, geocoder: Geocoder, seed: int = 7):
+    """
+    Providers scattered around the geocoded places, clearly marked as synthetic
+    """
+    import numpy as np
+    import pandas as pd
+
+    generator = np.random.default_rng(seed)
+    places = sorted(set(geocoder._places.values()))
+    centers = generator.integers(0, len(places), count)
+    lat = np.array([places[i][1] for i in centers]) + generator.normal(0, 0.08, count)
+    lon = np.array([places[i][2] for i in centers]) + generator.normal(0, 0.08, count)
+    return pd.DataFrame({
+        "name": [f"Synthetic Provider {i}" for i in range(count)],
+        "specialty": np.array(SPECIALTIES)[generator.integers(0, len(SPECIALTIES), count)],
+        "phone": [f"+00 000 {i:07d}" for i in range(count)],
+        "address": [f"{i % 400 + 1} Example Street, {places[center][0]}" for i, center in enumerate(centers)],
+        "lat": lat.round(5),
+        "lon": lon.round(5),
+    })
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def time_searches(directory: SpecialistDirectory, points: list, specialty: str = None, verify: int = 0) -> dict:
+    import numpy as np
+
+    codes = directory.resolve_specialty(specialty)[1] if specialty else None
+    latencies = []
+    mismatches = 0
+    for i, (lat, lon) in enumerate(points):
+        start = time.perf_counter()
+        matches = directory.nearest(lat, lon, codes)
+        latencies.append(time.perf_counter() - start)
+        if i < verify:
+            # Brute force over every provider must find the same distances
+            arrays = directory._arrays
+            mask = np.isin(arrays["codes"], codes) if codes is not None else slice(None)
+            distances = np.sort(haversine_km(lat, lon, arrays["lat"][mask], arrays["lon"][mask]))
+            expected = [d for d in distances[:directory.results] if d <= directory.max_distance_km]
+            mismatches += not np.allclose([d for _, d in matches], expected)
+    latencies.sort()
+    return {
+        "count": len(points),
+        "verified": min(verify, len(points)),
+        "mismatches": mismatches,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def run(args) -> dict:
+    import numpy as np
+
+    geocoder = Geocoder(args.geocode)
+    geocoder.load()
+    index_dir = tempfile.mkdtemp(prefix="specialists-index-")
+    path = args.directory
+    if path is None:
+        frame = synthetic_directory(args.providers, geocoder)
+        path = args.write or os.path.join(index_dir, "specialists.csv")
+        frame.to_csv(path, index=False)
+
+    def directory(saved: bool = True) -> SpecialistDirectory:
+        return SpecialistDirectory(path, geocoder, index_dir=index_dir if saved else None,
+                                   max_distance_km=args.max_distance_km, results=args.k)
+
+    tracemalloc.start()
+    traced = directory(saved=False)
+    traced.load()
+    memory_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    # Timed again without tracemalloc, which slows allocation-heavy code down, then reloaded from the saved arrays
+    built = directory()
+    built.load()
+    reloaded = directory()
+    reloaded.load()
+
+    generator = random.Random(11)
+    places = list(set(geocoder._places.values()))
+    points = []
+    for _ in range(args.queries):
+        _, lat, lon = generator.choice(places)
+        points.append((lat + generator.gauss(0, 0.1), lon + generator.gauss(0, 0.1)))
+    return {
+        "directory": path,
+        "providers": int(len(built._arrays["lat"])),
+        "build_ms": round(built.build_ms, 1),
+        "prebuilt_load_ms": round(reloaded.build_ms, 1),
+        "index_mb": round(sum(array.nbytes for array in built._arrays.values()) / 2 ** 20, 1),
+        "build_memory_mb": round(memory_bytes / 2 ** 20, 1),
+        "build_peak_mb": round(peak_bytes / 2 ** 20, 1),
+        "searches": {
+            "any": time_searches(reloaded, points, verify=args.verify),
+            "specialty": time_searches(reloaded, points, "cardiology", verify=args.verify),
+            "rare_specialty": time_searches(reloaded, points, "nephrology", verify=args.verify),
+        },
+        "tool_search_ms": round(np.median([_timed(reloaded.search, "cardiologist near Pune") for _ in range(200)]) * 1000, 3),
+    }
+
+
+def _timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the specialist directory index")
+    parser.add_argument("--providers", type=int, default=200000, help="synthetic providers to generate")
+    parser.add_argument("--directory", help="existing provider directory (CSV or Parquet) instead of synthetic data")
+    parser.add_argument("--write", help="save the generated directory to this CSV path")
+    parser.add_argument("--geocode", default=os.path.join(DATA_DIR, "geocode.csv"), help="geocoding table")
+    parser.add_argument("--queries", type=int, default=2000, help="searches timed per kind")
+    parser.add_argument("--verify", type=int, default=100, help="searches per kind checked against a brute-force scan")
+    parser.add_argument("--k", type=int, default=5, help="results per search")
+    parser.add_argument("--max-distance-km", type=float, default=50.0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print(f"{result['providers']} providers: built in {result['build_ms']}ms ({result['build_memory_mb']}MB, "
+          f"{result['build_peak_mb']}MB peak), loaded prebuilt in {result['prebuilt_load_ms']}ms; index {result['index_mb']}MB\n")
+    print(f"{'search':<15} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'mismatches':>11}")
+    for kind, stats in result["searches"].items():
+        print(f"{kind:<15} {stats['count']:>6} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8} "
+              f"{stats['max_ms']:>8} {stats['mismatches']:>5}/{stats['verified']}")
+    print(f"\nFull tool search (geocode, specialty, format): {result['tool_search_ms']}ms median")
+    return 0 if all(stats["mismatches"] == 0 for stats in result["searches"].values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+import os
+import time
+import hashlib
+import sqlite3
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+from config import DRUG_ALIASES
+from observability import get_logger, metrics
+
+load_dotenv()
+logger = get_logger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Case-fold and collapse whitespace so trivially different phrasings share a cache key
+    """
+    return " ".join(text.casefold().split())
+
+
+def normalize_drug_name(name: str) -> str:
+    """
+    Normalize a drug name and resolve brand names to their generic name
+    """
+    name = normalize_text(name).strip(" .,;:!?\"'")
+    return DRUG_ALIASES.get(name, name)
+
+
+def make_cache_key(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier result cache: an in-process LRU with a TTL in front of a persistent SQLite table.
+
+    Memory hits are served synchronously; the SQLite tier is only touched off the event loop
+    through aget/aset. Set db_path to None to keep the cache in memory only, or pass persist=False
+    for entries that must not be written to disk.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 1024, ttl_seconds: float = 7 * 24 * 3600, db_path: str = None):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_memory(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        row = self._db_get(key)
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        value, expires_at = row
+        self._remember(key, value, expires_at)
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, value, expires_at)
+        self._db_set(key, value, expires_at)
+
+    async def aget(self, key: str, persist: bool = True) -> Optional[str]:
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        if self.db_path is None or not persist:
+            with self._lock:
+                self.misses += 1
+            return None
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str, persist: bool = True) -> None:
+        if self.db_path is None or not persist:
+            self._remember(key, value, time.time() + self.ttl_seconds)
+            return
+        await asyncio.to_thread(self.set, key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _db_get(self, key: str):
+        if self.db_path is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connect().execute(
+                    "SELECT value, expires_at FROM results WHERE namespace = ? AND key = ?",
+                    (self.namespace, key)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("[CACHE] SQLite read failed: %s", e)
+            return None
+        if row is None or row[1] <= time.time():
+            return None
+        return row
+
+    def _db_set(self, key: str, value: str, expires_at: float) -> None:
+        if self.db_path is None:
+            return
+        try:
+            with self._db_lock:
+                db = self._connect()
+                db.execute(
+                    "INSERT OR REPLACE INTO results (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                    (self.namespace, key, value, expires_at)
+                )
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning("[CACHE] SQLite write failed: %s", e)
+
+
+class AudioCache:
+    """
+    Content-addressed on-disk audio cache with an LRU byte budget.
+
+    Files are named by hash(text, voice, model, format), so the digest doubles as a strong ETag.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._files = None
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, voice: str, model: str, audio_format: str) -> str:
+        return make_cache_key(text, voice, model, audio_format)
+
+    def get(self, digest: str, audio_format: str) -> Optional[str]:
+        """
+        Return the path of the cached audio for a digest, or None on a miss
+        """
+        name = f"{digest}.{audio_format}"
+        with self._lock:
+            files = self._load()
+            if name not in files:
+                self.misses += 1
+                return None
+            files.move_to_end(name)
+            self.hits += 1
+        path = os.path.join(self.directory, name)
+        try:
+            # Keep recency on disk so eviction order survives restarts
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, digest: str, audio_format: str, data: bytes) -> str:
+        """
+        Store synthesized audio and return its path, evicting least-recently-used files over budget
+        """
+        name = f"{digest}.{audio_format}"
+        path = os.path.join(self.directory, name)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        with self._lock:
+            files = self._load()
+            self._total_bytes -= files.pop(name, 0)
+            files[name] = len(data)
+            self._total_bytes += len(data)
+            while self._total_bytes > self.max_bytes and len(files) > 1:
+                oldest, size = files.popitem(last=False)
+                self._total_bytes -= size
+                try:
+                    os.remove(os.path.join(self.directory, oldest))
+                except OSError:
+                    pass
+        return path
+
+    def stats(self) -> dict:
+        with self._lock:
+            files = self._load()
+            return {"hits": self.hits, "misses": self.misses, "files": len(files), "bytes": self._total_bytes}
+
+    def _load(self) -> OrderedDict:
+        # Index existing files oldest-first on first use so the budget survives restarts
+        if self._files is None:
+            os.makedirs(self.directory, exist_ok=True)
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.name, stat.st_size))
+            self._files = OrderedDict((name, size) for _, name, size in sorted(entries))
+            self._total_bytes = sum(self._files.values())
+        return self._files
+
+
+medgemma_cache = ResultCache(
+    "medgemma",
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600))),
+    db_path=os.getenv("RESULT_CACHE_DB", ".cache/results.sqlite3") or None,
+)
+
+tts_cache = AudioCache(
+    os.getenv("TTS_CACHE_DIR", ".cache/tts"),
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_BYTES", str(200 * 1024 * 1024))),
+)
+
+metrics.register_callback(
+    "cache_hits_total", "Cache hits", "counter", ("cache",),
+    lambda: [(("medgemma",), medgemma_cache.hits), (("tts",), tts_cache.hits)]
+)
+metrics.register_callback(
+    "cache_misses_total", "Cache misses", "counter", ("cache",),
+    lambda: [(("medgemma",), medgemma_cache.misses), (("tts",), tts_cache.misses)]
+)
@@ -22,3 +22,125 @@ Final Answer: the final answer to the original input question
 
 Question: {input}
 Thought: {agent_scratchpad}"""
+
+
+# System prompt of the tool-calling agent (AGENT_MODE=tools); tools are passed as function definitions
+tool_calling_system_prompt = """You are an AI medical consulting assistant with access to specialized medical tools.
+
+IMPORTANT GUIDELINES:
+- If the user mentions uploading an image, prescription, medical scan, or asks about "medicines in this image", ALWAYS use the analyze_medical_image tool
+- For emergency situations (chest pain, breathing problems, severe symptoms), use emergency_call_tool
+- For finding doctors/specialists in a location, use find_nearby_specialists_by_location
+- For medication questions, use get_medication_information, once per medication
+- For appointment help, use schedule_appointment_helper
+- For general medical questions, use ask_medical_specialist
+
+When several tool calls do not depend on each other's results (for example looking up several medications), request them all in the same turn so they run in parallel.
+Answer the user directly once the tool results are enough, and always recommend consulting a healthcare professional for diagnosis and treatment."""
+
+
+# Bump a prompt version whenever its wording changes so cached answers are not reused
+MEDGEMMA_PROMPT_VERSION = "1"
+MEDICATION_PROMPT_VERSION = "1"
+
+# Brand (and alternate) drug names resolved to the generic name used for cache keys
+DRUG_ALIASES = {
+    "glucophage": "metformin",
+    "glycomet": "metformin",
+    "tylenol": "acetaminophen",
+    "paracetamol": "acetaminophen",
+    "panadol": "acetaminophen",
+    "crocin": "acetaminophen",
+    "calpol": "acetaminophen",
+    "dolo": "acetaminophen",
+    "dolo 650": "acetaminophen",
+    "advil": "ibuprofen",
+    "motrin": "ibuprofen",
+    "brufen": "ibuprofen",
+    "ecosprin": "aspirin",
+    "disprin": "aspirin",
+    "lipitor": "atorvastatin",
+    "zocor": "simvastatin",
+    "crestor": "rosuvastatin",
+    "norvasc": "amlodipine",
+    "zestril": "lisinopril",
+    "prinivil": "lisinopril",
+    "cozaar": "losartan",
+    "synthroid": "levothyroxine",
+    "eltroxin": "levothyroxine",
+    "thyronorm": "levothyroxine",
+    "prilosec": "omeprazole",
+    "nexium": "esomeprazole",
+    "pantocid": "pantoprazole",
+    "protonix": "pantoprazole",
+    "coumadin": "warfarin",
+    "plavix": "clopidogrel",
+    "amoxil": "amoxicillin",
+    "augmentin": "amoxicillin and clavulanate",
+    "zithromax": "azithromycin",
+    "azee": "azithromycin",
+    "ventolin": "salbutamol",
+    "albuterol": "salbutamol",
+    "asthalin": "salbutamol",
+    "zyrtec": "cetirizine",
+    "claritin": "loratadine",
+    "allegra": "fexofenadine",
+    "lasix": "furosemide",
+    "xanax": "alprazolam",
+    "zoloft": "sertraline",
+    "prozac": "fluoxetine",
+}
+
+# Symptom words remembered as session facts when a user mentions them
+SYMPTOM_TERMS = (
+    "headache", "migraine", "fever", "cough", "sore throat", "runny nose", "congestion", "fatigue",
+    "dizziness", "nausea", "vomiting", "diarrhea", "constipation", "abdominal pain", "stomach pain",
+    "back pain", "joint pain", "chest pain", "shortness of breath", "wheezing", "rash", "itching",
+    "swelling", "insomnia", "anxiety", "palpitations", "numbness", "blurred vision", "chills",
+    "loss of appetite", "weight loss", "bleeding", "bruising", "cramps", "heartburn",
+)
+
+# Words people use for a kind of doctor, resolved to the specialty used in the provider directory
+SPECIALTY_ALIASES = {
+    "gp": "general practice",
+    "family doctor": "general practice",
+    "general physician": "general practice",
+    "physician": "internal medicine",
+    "internist": "internal medicine",
+    "cardiologist": "cardiology",
+    "heart": "cardiology",
+    "dermatologist": "dermatology",
+    "skin": "dermatology",
+    "neurologist": "neurology",
+    "pediatrician": "pediatrics",
+    "paediatrician": "pediatrics",
+    "child": "pediatrics",
+    "gynecologist": "obstetrics and gynecology",
+    "gynaecologist": "obstetrics and gynecology",
+    "obstetrician": "obstetrics and gynecology",
+    "orthopedic": "orthopedics",
+    "orthopaedic": "orthopedics",
+    "orthopedist": "orthopedics",
+    "orthopaedics": "orthopedics",
+    "bone": "orthopedics",
+    "psychiatrist": "psychiatry",
+    "psychologist": "psychology",
+    "ent": "otolaryngology",
+    "ent specialist": "otolaryngology",
+    "dentist": "dentistry",
+    "dental": "dentistry",
+    "oncologist": "oncology",
+    "cancer": "oncology",
+    "ophthalmologist": "ophthalmology",
+    "eye doctor": "ophthalmology",
+    "eye": "ophthalmology",
+    "urologist": "urology",
+    "endocrinologist": "endocrinology",
+    "diabetes": "endocrinology",
+    "gastroenterologist": "gastroenterology",
+    "pulmonologist": "pulmonology",
+    "lung": "pulmonology",
+    "nephrologist": "nephrology",
+    "kidney": "nephrology",
+    "emergency": "emergency medicine",
+}
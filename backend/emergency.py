@@ -0,0 +1,280 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+from collections import OrderedDict
+from typing import Optional
+from xml.sax.saxutils import escape
+from dotenv import load_dotenv
+from observability import get_logger, span
+
+load_dotenv()
+logger = get_logger(__name__)
+
+
+def build_twiml(message: str) -> str:
+    return f"""
+    <Response>
+        <Say voice="alice">
+            {escape(message)}
+        </Say>
+        <Say voice="alice">
+            This is an automated emergency call from the AI Medical Consulting system.
+            Please contact the user immediately for medical assistance.
+        </Say>
+    </Response>
+    """
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether a failed call attempt may succeed later: timeouts, network errors, 429 and 5xx responses.
+    Other 4xx responses (a bad number or bad credentials) fail the same way every time.
+    """
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return isinstance(error, (asyncio.TimeoutError, TimeoutError, OSError))
+
+
+class CallHandle:
+    """
+    Status of one emergency call request, returned to callers so they can poll it
+    """
+    __slots__ = ("id", "session_key", "message", "status", "attempts", "call_sid", "error", "created_at", "updated_at")
+
+    def __init__(self, message: str, session_key: str = None):
+        self.id = uuid.uuid4().hex
+        self.session_key = session_key
+        self.message = message
+        self.status = "queued"  # queued -> dialing -> initiated | failed
+        self.attempts = 0
+        self.call_sid = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def update(self, status: str, **fields) -> None:
+        self.status = status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated_at = time.time()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "attempts": self.attempts,
+            "call_sid": self.call_sid,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class TwilioProvider:
+    """
+    Places calls through Twilio's async HTTP client, reusing one client and connection pool
+    """
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str, to_number: str, api_base_url: str = None):
+        self.from_number = from_number
+        self.to_number = to_number
+        self._account_sid = account_sid
+        self._auth_token = auth_token
+        self._api_base_url = api_base_url
+        self._http_client = None
+        self._client = None
+
+    def _get_client(self):
+        # The twilio package is imported on the first call rather than at startup
+        if self._client is None:
+            from twilio.rest import Client
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+
+            # Retries are handled by the dispatcher with backoff, not by the HTTP client
+            self._http_client = AsyncTwilioHttpClient(timeout=float(os.getenv("TWILIO_TIMEOUT", "10")))
+            self._client = Client(self._account_sid, self._auth_token, http_client=self._http_client)
+            if self._api_base_url:
+                self._client.api.base_url = self._api_base_url.rstrip("/")
+        return self._client
+
+    @classmethod
+    def from_env(cls) -> Optional["TwilioProvider"]:
+        """
+        Build the provider from TWILIO_* settings, or None if the configuration is incomplete
+        """
+        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
+        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+        from_number = os.getenv("TWILIO_FROM_NUMBER")
+        to_number = os.getenv("EMERGENCY_CONTACT")
+        if not all([account_sid, auth_token, from_number, to_number]):
+            return None
+        return cls(account_sid, auth_token, from_number, to_number, os.getenv("TWILIO_API_BASE_URL"))
+
+    async def place_call(self, message: str) -> str:
+        with span("twilio_call"):
+            call = await self._get_client().calls.create_async(
+                twiml=build_twiml(message),
+                to=self.to_number,
+                from_=self.from_number
+            )
+        return call.sid
+
+    async def close(self) -> None:
+        if self._http_client is not None:
+            await self._http_client.close()
+
+
+class ProviderError(Exception):
+    """
+    HTTP error from a call provider, carrying its status like Twilio's TwilioRestException
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeProvider:
+    """
+    Local stand-in provider for tests: records messages and can fail the first N attempts,
+    with a connection error or, when fail_status is set, an HTTP error of that status
+    """
+
+    def __init__(self, fail_times: int = 0, latency: float = 0.0, fail_status: int = None):
+        self.fail_times = fail_times
+        self.latency = latency
+        self.fail_status = fail_status
+        self.attempts = 0
+        self.calls = []
+
+    async def place_call(self, message: str) -> str:
+        self.attempts += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.attempts <= self.fail_times:
+            if self.fail_status is not None:
+                raise ProviderError(self.fail_status, f"Fake provider HTTP {self.fail_status} {self.attempts}/{self.fail_times}")
+            raise ConnectionError(f"Fake provider failure {self.attempts}/{self.fail_times}")
+        self.calls.append(message)
+        return f"CAFAKE{len(self.calls):08d}"
+
+    async def close(self) -> None:
+        pass
+
+
+class EmergencyDispatcher:
+    """
+    Asynchronous emergency call dispatcher.
+
+    dispatch() never blocks: it enqueues the call and returns a CallHandle immediately. Worker tasks
+    place calls through the provider, retrying timeouts, network errors, 429 and 5xx responses with
+    exponential backoff; other failures (bad number, bad credentials) fail at once. Repeated triggers
+    for the same session within the dedup window return the existing handle instead of calling again.
+    """
+
+    def __init__(self, provider=None, workers: int = 2, max_attempts: int = 4, backoff_base: float = 1.0,
+                 backoff_max: float = 30.0, dedup_window: float = 300.0, max_handles: int = 1000):
+        self.provider = provider
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.dedup_window = dedup_window
+        self.max_handles = max_handles
+        self._queue = None
+        self._tasks = []
+        self._handles = OrderedDict()
+        self._by_session = {}
+        # A provider built from the environment is owned (and closed) by the dispatcher
+        self._owns_provider = provider is None
+
+    def start(self) -> None:
+        """
+        Start the worker tasks on the running event loop (idempotent)
+        """
+        if self._tasks:
+            return
+        if self.provider is None and self._owns_provider:
+            self.provider = TwilioProvider.from_env()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._owns_provider and self.provider is not None:
+            await self.provider.close()
+            self.provider = None
+
+    def dispatch(self, message: str, session_key: str = None) -> CallHandle:
+        """
+        Queue an emergency call and return its handle without waiting for the provider
+        """
+        if session_key:
+            existing = self._by_session.get(session_key)
+            if (existing is not None and existing.status != "failed"
+                    and time.time() - existing.created_at < self.dedup_window):
+                logger.info("[EMERGENCY DISPATCH] Duplicate trigger for session %s, reusing call %s", session_key, existing.id)
+                return existing
+        self.start()
+        handle = CallHandle(message, session_key)
+        self._remember(handle)
+        if self.provider is None:
+            handle.update("failed", error="Emergency call configuration missing. Please contact emergency services directly.")
+            return handle
+        self._queue.put_nowait(handle)
+        logger.info("[EMERGENCY DISPATCH] Queued call %s", handle.id)
+        return handle
+
+    def get(self, handle_id: str) -> Optional[CallHandle]:
+        return self._handles.get(handle_id)
+
+    def _remember(self, handle: CallHandle) -> None:
+        self._handles[handle.id] = handle
+        if handle.session_key:
+            self._by_session[handle.session_key] = handle
+        while len(self._handles) > self.max_handles:
+            _, oldest = self._handles.popitem(last=False)
+            if oldest.session_key and self._by_session.get(oldest.session_key) is oldest:
+                del self._by_session[oldest.session_key]
+
+    async def _worker(self) -> None:
+        while True:
+            handle = await self._queue.get()
+            try:
+                await self._place(handle)
+            finally:
+                self._queue.task_done()
+
+    async def _place(self, handle: CallHandle) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            handle.update("dialing", attempts=attempt)
+            try:
+                call_sid = await self.provider.place_call(handle.message)
+                handle.update("initiated", call_sid=call_sid, error=None)
+                logger.info("[EMERGENCY DISPATCH] Call %s initiated. Call SID: %s", handle.id, call_sid)
+                return
+            except Exception as e:
+                handle.error = str(e)
+                logger.error("[EMERGENCY DISPATCH] Attempt %d/%d for call %s failed: %s", attempt, self.max_attempts, handle.id, e)
+                if not is_retryable(e):
+                    # Report the failure now so the user is told to call emergency services themselves
+                    break
+                if attempt < self.max_attempts:
+                    delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+                    await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+        handle.update("failed")
+
+
+emergency_dispatcher = EmergencyDispatcher(
+    workers=int(os.getenv("EMERGENCY_WORKERS", "2")),
+    max_attempts=int(os.getenv("EMERGENCY_MAX_ATTEMPTS", "4")),
+    backoff_base=float(os.getenv("EMERGENCY_BACKOFF_BASE", "1.0")),
+    backoff_max=float(os.getenv("EMERGENCY_BACKOFF_MAX", "30")),
+    dedup_window=float(os.getenv("EMERGENCY_DEDUP_WINDOW", "300")),
+)
@@ -0,0 +1,156 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import List, Optional, Union
+from dotenv import load_dotenv
+from observability import get_logger
+
+load_dotenv()
+logger = get_logger(__name__)
+
+# Server-generated ID of the agent run currently executing (the key of its uploaded images), visible to its tools
+current_request_id: ContextVar[Optional[str]] = ContextVar("current_request_id", default=None)
+
+Blob = Union[bytes, bytearray, memoryview]
+
+
+class _Entry:
+    # Each part is either an in-memory memoryview or the path of a spilled blob
+    __slots__ = ("parts", "memory_bytes", "expires_at")
+
+    def __init__(self, parts: list, memory_bytes: int, expires_at: float):
+        self.parts = parts
+        self.memory_bytes = memory_bytes
+        self.expires_at = expires_at
+
+
+class ImageStore:
+    """
+    Request-scoped registry for uploaded images.
+
+    Blobs are held as zero-copy memoryviews keyed by request/session ID, expire after a TTL
+    and are evicted least-recently-used once the in-memory byte budget is exceeded.
+    Blobs above the spill threshold are written to a temp dir instead of being held in memory.
+    """
+
+    def __init__(self, ttl_seconds: float = 300, max_bytes: int = 256 * 1024 * 1024,
+                 spill_threshold: int = 16 * 1024 * 1024, spill_dir: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, key: str, data: Blob) -> None:
+        """
+        Register the image for a request, replacing any previous blob under the same key
+        """
+        self.put_all(key, [data])
+
+    def put_all(self, key: str, blobs: List[Blob]) -> None:
+        """
+        Register several images (e.g. tiles of one document) for a request
+        """
+        parts = []
+        memory_bytes = 0
+        for blob in blobs:
+            view = memoryview(blob)
+            if view.nbytes > self.spill_threshold:
+                parts.append(self._spill(view))
+            else:
+                parts.append(view)
+                memory_bytes += view.nbytes
+        entry = _Entry(parts, memory_bytes, time.monotonic() + self.ttl_seconds)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._memory_bytes += memory_bytes
+            self._evict()
+
+    def get(self, key: str) -> Optional[Blob]:
+        """
+        Return the image registered for a request, or None if it is missing or expired
+        """
+        blobs = self.get_all(key)
+        return blobs[0] if blobs else None
+
+    def get_all(self, key: str) -> Optional[List[Blob]]:
+        """
+        Return every image registered for a request, or None if they are missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            parts = list(entry.parts)
+        blobs = []
+        for part in parts:
+            if isinstance(part, memoryview):
+                blobs.append(part)
+                continue
+            try:
+                with open(part, "rb") as f:
+                    blobs.append(f.read())
+            except OSError:
+                # Expired or discarded while we were reading
+                return None
+        return blobs
+
+    def discard(self, key: str) -> None:
+        """
+        Drop the image registered for a request
+        """
+        with self._lock:
+            self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "spilled": sum(1 for entry in self._entries.values() for part in entry.parts if isinstance(part, str)),
+            }
+
+    def _spill(self, view: memoryview) -> str:
+        fd, path = tempfile.mkstemp(prefix="agentic_ai_image_", suffix=".bin", dir=self.spill_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(view)
+        return path
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._memory_bytes -= entry.memory_bytes
+        for part in entry.parts:
+            if isinstance(part, str):
+                try:
+                    os.remove(part)
+                except OSError:
+                    pass
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry.expires_at <= now]:
+            self._remove(key)
+        while self._memory_bytes > self.max_bytes:
+            oldest = next(key for key, entry in self._entries.items() if entry.memory_bytes)
+            logger.info("[IMAGE STORE] Evicting image for request %s", oldest)
+            self._remove(oldest)
+
+
+image_store = ImageStore(
+    ttl_seconds=float(os.getenv("IMAGE_STORE_TTL", "300")),
+    max_bytes=int(os.getenv("IMAGE_STORE_MAX_BYTES", str(256 * 1024 * 1024))),
+    spill_threshold=int(os.getenv("IMAGE_STORE_SPILL_THRESHOLD", str(16 * 1024 * 1024))),
+    spill_dir=os.getenv("IMAGE_STORE_SPILL_DIR") or None,
+)
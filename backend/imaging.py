@@ -0,0 +1,94 @@
+import io
+import os
+import time
+from typing import List, Tuple
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _flatten(image: Image.Image, grayscale: bool) -> Image.Image:
+    """
+    Convert to RGB/grayscale, compositing transparent images onto white instead of black
+    """
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    mode = "L" if grayscale else "RGB"
+    return image if image.mode == mode else image.convert(mode)
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    # No exif= argument, so no EXIF (GPS, device, timestamps) is written
+    image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def _tile(image: Image.Image, max_edge: int, overlap: int, max_tiles: int) -> List[Image.Image]:
+    """
+    Cut a tall document into overlapping tiles at most max_edge high, using at most max_tiles tiles
+    """
+    width, height = image.size
+    scale = min(1.0, max_edge / width)
+    step = max_edge - overlap
+    # Shrink further if the page would need more tiles than allowed
+    scale = min(scale, (max_tiles * step + overlap) / height)
+    if scale < 1.0:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+        width, height = image.size
+    tiles = []
+    top = 0
+    while True:
+        bottom = min(top + max_edge, height)
+        tiles.append(image.crop((0, top, width, bottom)))
+        if bottom >= height:
+            break
+        top += step
+    return tiles
+
+
+def preprocess_image(image_bytes: bytes, max_edge: int = None, quality: int = None, grayscale: bool = None,
+                     tile_aspect_ratio: float = None, max_tiles: int = None, tile_overlap: int = 64) -> Tuple[List[bytes], dict]:
+    """
+    Prepare an uploaded image for the LLaVA vision model.
+
+    Applies the EXIF orientation and drops EXIF, converts to RGB (or grayscale), downscales to max_edge
+    preserving aspect ratio and recompresses as JPEG. Documents taller than tile_aspect_ratio × width are
+    cut into overlapping tiles instead of being shrunk into an unreadable strip.
+
+    Returns:
+        tuple: (list of JPEG images to send, stats with before/after byte counts, sizes and timing)
+    """
+    max_edge = max_edge or int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+    quality = quality or int(os.getenv("IMAGE_JPEG_QUALITY", "85"))
+    if grayscale is None:
+        grayscale = os.getenv("IMAGE_GRAYSCALE", "false").lower() == "true"
+    tile_aspect_ratio = tile_aspect_ratio or float(os.getenv("IMAGE_TILE_ASPECT_RATIO", "2.5"))
+    max_tiles = max_tiles or int(os.getenv("IMAGE_MAX_TILES", "4"))
+
+    start = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    input_size = image.size
+    image = ImageOps.exif_transpose(image)
+    image = _flatten(image, grayscale)
+
+    width, height = image.size
+    if height > width * tile_aspect_ratio and height > max_edge:
+        images = _tile(image, max_edge, tile_overlap, max_tiles)
+    else:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        images = [image]
+
+    outputs = [_encode_jpeg(part, quality) for part in images]
+    stats = {
+        "input_bytes": len(image_bytes),
+        "output_bytes": sum(len(output) for output in outputs),
+        "input_size": list(input_size),
+        "output_sizes": [list(part.size) for part in images],
+        "tiles": len(outputs),
+        "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+    return outputs, stats
@@ -1,18 +1,64 @@
 import io
+import os
+import json
+import time
+import asyncio
 import base64
+from contextlib import asynccontextmanager
+_import_started = time.perf_counter()
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from PIL import Image
-from utils import call_emergency, transcribe_audio_whisper, generate_speech_tts
-from agents import process_medical_query
+from utils import transcribe_audio_whisper, generate_speech_tts, stream_speech_chunks, init_ollama_clients, close_ollama_clients, close_openai_client, ollama_flights
+from agents import process_medical_query, stream_medical_query, agent_factory
+from cache import medgemma_cache, tts_cache
+from emergency import emergency_dispatcher
+from scheduler import scheduler, Overloaded
+from sessions import session_store
+from warmup import model_warmer
+from medication_index import medication_index
+from specialists import specialist_directory
+from observability import get_logger, span, metrics, RequestContextMiddleware
+
 # Load environment variables
 load_dotenv()
+logger = get_logger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Open shared downstream clients on startup and close them on shutdown.
 
-app = FastAPI(title="Agentic AI Medical Consulting API", version="2.0.0")
+    The LangChain agent and the OpenAI client are built on first use, so startup needs neither
+    their imports nor an API key; AGENT_PRELOAD builds the agent in the background right away.
+    """
+    await init_ollama_clients()
+    # Preloads the Ollama models in the background; /ready reports when they are resident
+    model_warmer.start()
+    emergency_dispatcher.start()
+    # Build the medication index now rather than on the event loop during the first lookup
+    await asyncio.to_thread(medication_index.load)
+    # The provider directory can be large; searches use the built-in list until its index is ready
+    specialist_directory.start()
+    if not os.getenv("OPENAI_API_KEY"):
+        logger.warning("[STARTUP] OPENAI_API_KEY is not set, the agent, voice and TTS endpoints will fail until it is")
+    if os.getenv("AGENT_PRELOAD", "true").lower() == "true":
+        agent_factory.start()
+    app.state.agent_factory = agent_factory
+    logger.info("[STARTUP] Ready to serve %.0fms after import started", (time.perf_counter() - _import_started) * 1000)
+    yield
+    await agent_factory.close()
+    await model_warmer.stop()
+    await emergency_dispatcher.stop()
+    await close_openai_client()
+    await close_ollama_clients()
+
+
+app = FastAPI(title="Agentic AI Medical Consulting API", version="2.0.0", lifespan=lifespan)
 # CORS middleware for frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -22,24 +68,40 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+# Request IDs, request metrics and span summaries
+app.add_middleware(RequestContextMiddleware)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Backpressure: a saturated downstream answers 429 with a Retry-After hint"""
+    logger.warning("[SCHEDULER] Rejected %s: %s", request.url.path, exc)
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc), "backend": exc.backend},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Pydantic models
 class ChatRequest(BaseModel):
     message: str
     has_image: bool = False
     image_data: Optional[str] = None  # base64 encoded image
+    session_id: Optional[str] = None  # continue a conversation; returned with every response
 
 class ChatResponse(BaseModel):
     response: str
     source: str  # "agentic_ai"
     tool_used: Optional[str] = None
     has_emergency: bool = False
+    session_id: Optional[str] = None
+    metadata: Optional[dict] = None
 
 class TTSRequest(BaseModel):
     text: str
 
 class EmergencyRequest(BaseModel):
     message: Optional[str] = "Emergency medical assistance needed. Please call back immediately."
+    session_id: Optional[str] = None  # repeated triggers within the dedup window reuse one call
 
 @app.get("/")
 async def root():
@@ -47,41 +109,103 @@ async def root():
 
 
 
-@app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
-    """Main chat endpoint using Agentic AI with LangChain tools"""
+def describe_image(image_bytes: bytes) -> str:
+    """Build the image context from the image header only; the pixel data is never decoded here"""
+    from PIL import Image
+
+    with span("image_decode"):
+        image = Image.open(io.BytesIO(image_bytes))
+    return f"Medical image uploaded - Format: {image.format}, Size: {image.size}"
+
+
+def describe_chat_image(image_bytes: bytes) -> str:
+    """Image context for the agent, or the processing error when the image cannot be read"""
+    try:
+        return describe_image(image_bytes)
+    except Exception as e:
+        logger.error("[IMAGE] Processing failed: %s", e)
+        return f"Image processing error: {str(e)}"
+
+
+def decode_chat_image(request: ChatRequest):
+    """Decode the base64 image of a chat request, returning (image_context, image_bytes)"""
+    image_context = None
+    image_bytes = None
+    if request.has_image and request.image_data:
+        logger.info("[IMAGE PROCESSING] Processing uploaded image...")
+        try:
+            # Decode and validate image
+            image_bytes = base64.b64decode(request.image_data)
+        except Exception as e:
+            image_context = f"Image processing error: {str(e)}"
+            logger.error("[IMAGE] Processing failed: %s", e)
+        else:
+            image_context = describe_chat_image(image_bytes)
+    return image_context, image_bytes
+
+
+async def answer_chat(message: str, has_image: bool, image_context: Optional[str], image_bytes: Optional[bytes], session_id: Optional[str]) -> ChatResponse:
+    """Run one chat turn for /chat and /chat/upload: the agent query, the response model and error mapping"""
     try:
-        # Prepare image context if available
-        image_context = None
-        image_bytes = None
-        if request.has_image and request.image_data:
-            print(f"🖼️ [IMAGE PROCESSING] Processing uploaded image...")
-            try:
-                # Decode and validate image
-                image_bytes = base64.b64decode(request.image_data)
-                image = Image.open(io.BytesIO(image_bytes))
-                image_context = f"Medical image uploaded - Format: {image.format}, Size: {image.size}"
-            except Exception as e:
-                image_context = f"Image processing error: {str(e)}"
-                print(f"❌ [IMAGE] Processing failed: {str(e)}")
-        # Process query using agentic AI
         result = await process_medical_query(
-            user_input=request.message,
-            has_image=request.has_image,
+            user_input=message,
+            has_image=has_image,
             image_context=image_context,
-            image_data=image_bytes
+            image_data=image_bytes,
+            session_id=session_id
         )
         return ChatResponse(
             response=result["response"],
             source=result["source"],
             tool_used=result.get("tool_used"),
-            has_emergency=result.get("has_emergency", False)
+            has_emergency=result.get("has_emergency", False),
+            session_id=(result.get("metadata") or {}).get("session_id"),
+            metadata=result.get("metadata")
         )
             
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"❌ [CHAT] Error processing request: {str(e)}")
+        logger.exception("[CHAT] Error processing request: %s", e)
         raise HTTPException(status_code=500, detail=f"Error processing chat: {str(e)}")
 
+
+@app.post("/chat", response_model=ChatResponse)
+async def chat(request: ChatRequest):
+    """Main chat endpoint using Agentic AI with LangChain tools"""
+    # Prepare image context if available
+    image_context, image_bytes = decode_chat_image(request)
+    return await answer_chat(request.message, request.has_image, image_context, image_bytes, request.session_id)
+
+@app.post("/chat/upload", response_model=ChatResponse)
+async def chat_upload(message: str = Form(...), image: Optional[UploadFile] = File(None), session_id: Optional[str] = Form(None)):
+    """Chat endpoint taking the raw image bytes as multipart form data instead of base64 JSON"""
+    # The uploaded bytes are the only copy of the image until the Ollama boundary
+    image_bytes = await image.read() if image is not None else None
+    image_context = describe_chat_image(image_bytes) if image_bytes else None
+    return await answer_chat(message, bool(image_bytes), image_context, image_bytes, session_id)
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Streaming chat endpoint emitting Server-Sent Events for agent steps and answer tokens"""
+    image_context, image_bytes = decode_chat_image(request)
+
+    async def event_source():
+        async for event in stream_medical_query(
+            user_input=request.message,
+            has_image=request.has_image,
+            image_context=image_context,
+            image_data=image_bytes,
+            session_id=request.session_id
+        ):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/voice")
 async def transcribe_voice(audio_file: UploadFile = File(...)):
     """Transcribe voice input using OpenAI Whisper"""
@@ -90,38 +214,124 @@ async def transcribe_voice(audio_file: UploadFile = File(...)):
         audio_data = await audio_file.read()
         
         # Transcribe using helper function
-        transcript_text = transcribe_audio_whisper(audio_data)
+        transcript_text = await transcribe_audio_whisper(audio_data)
         
         return {"text": transcript_text}
         
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error transcribing audio: {str(e)}")
 
 @app.post("/tts")
-async def text_to_speech(request: TTSRequest):
-    """Convert text to speech using OpenAI TTS"""
+async def text_to_speech(request: TTSRequest, http_request: Request):
+    """Convert text to speech using OpenAI TTS, serving repeat texts from the audio cache"""
     try:
-        audio_data = generate_speech_tts(request.text)
+        voice = os.getenv("TTS_VOICE", "nova")
+        model = os.getenv("TTS_MODEL", "tts-1")
+        digest = tts_cache.key(request.text, voice, model, "mp3")
+        etag = f'"{digest}"'
+        if http_request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
         
+        # Read into memory rather than served by path: a concurrent eviction could delete the file before it is sent
+        audio_data = await synthesize_cached_speech(request.text)
         return Response(
             content=audio_data,
             media_type="audio/mpeg",
-            headers={"Content-Disposition": "attachment; filename=speech.mp3"}
+            headers={"ETag": etag, "Cache-Control": "private, max-age=86400", "Content-Disposition": 'attachment; filename="speech.mp3"'}
         )
         
+    except Overloaded:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating speech: {str(e)}")
 
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+async def synthesize_cached_speech(text: str) -> bytes:
+    """Synthesize speech through the TTS audio cache, synthesizing again when a cached file has been evicted"""
+    voice = os.getenv("TTS_VOICE", "nova")
+    model = os.getenv("TTS_MODEL", "tts-1")
+    digest = tts_cache.key(text, voice, model, "mp3")
+    # The first lookup indexes the cache directory and hits touch the file, so both stay off the event loop
+    audio_path = await asyncio.to_thread(tts_cache.get, digest, "mp3")
+    if audio_path is not None:
+        try:
+            return await asyncio.to_thread(_read_file, audio_path)
+        except OSError:
+            # Evicted by a concurrent put() since the lookup
+            pass
+    audio_data = await generate_speech_tts(text, voice=voice, model=model, audio_format="mp3")
+    await asyncio.to_thread(tts_cache.put, digest, "mp3", audio_data)
+    return audio_data
+
+@app.post("/tts/stream")
+async def text_to_speech_stream(request: TTSRequest):
+    """Stream speech sentence by sentence so playback can start after the first chunk"""
+    max_concurrency = int(os.getenv("TTS_STREAM_CONCURRENCY", "3"))
+    return StreamingResponse(
+        stream_speech_chunks(request.text, synthesize=synthesize_cached_speech, max_concurrency=max_concurrency),
+        media_type="audio/mpeg",
+        headers={"Content-Disposition": "attachment; filename=speech.mp3"}
+    )
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the Ollama models are loaded (see OLLAMA_PRELOAD)"""
+    stats = model_warmer.stats()
+    return JSONResponse(status_code=200 if stats["ready"] else 503, content=stats)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the MedGemma result cache and the TTS audio cache, coalesced Ollama calls and the local indexes"""
+    return {
+        "medgemma": medgemma_cache.stats(),
+        "tts": await asyncio.to_thread(tts_cache.stats),
+        "medication_index": medication_index.stats(),
+        "specialists": specialist_directory.stats(),
+        "coalescing": ollama_flights.stats(),
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Request, span, scheduler and cache metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/scheduler/stats")
+async def scheduler_stats():
+    """Concurrency, queue depth, rejections and wait times for each downstream backend"""
+    return scheduler.stats()
+
+@app.delete("/sessions/{session_id}")
+async def end_session(session_id: str):
+    """Forget a conversation session (e.g. when the user clears the chat)"""
+    await asyncio.to_thread(session_store.discard, session_id)
+    return {"status": "success"}
+
 @app.post("/emergency-call")
 async def emergency_call(request: EmergencyRequest):
-    """Trigger emergency call using Twilio"""
+    """Queue an emergency call via Twilio and return a handle to poll for its status"""
     try:
-        result = call_emergency(request.message)
-        return {"status": "success", "message": result}
+        # Only a real chat session dedupes; callers behind one proxy or NAT share an address
+        handle = emergency_dispatcher.dispatch(request.message, session_key=request.session_id or None)
+        if handle.status == "failed":
+            return {"status": "failed", "message": handle.error, "call": handle.to_dict()}
+        return {"status": "success", "message": f"Emergency call queued (call ID: {handle.id})", "call": handle.to_dict()}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error making emergency call: {str(e)}")
 
+@app.get("/emergency-call/{call_id}")
+async def emergency_call_status(call_id: str):
+    """Poll the status of a queued emergency call"""
+    handle = emergency_dispatcher.get(call_id)
+    if handle is None:
+        raise HTTPException(status_code=404, detail="Unknown emergency call")
+    return handle.to_dict()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,273 @@
+import os
+import re
+import csv
+import json
+import time
+import threading
+from collections import defaultdict
+from typing import Optional
+from dotenv import load_dotenv
+from config import DRUG_ALIASES
+from cache import normalize_text
+from observability import get_logger, metrics
+
+load_dotenv()
+logger = get_logger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "medications.csv")
+
+FIELDS = ("drug_class", "uses", "common_side_effects", "serious_side_effects", "warnings", "interactions")
+
+LOOKUPS = metrics.counter("medication_index_lookups_total", "Medication index lookups by how they matched", ("result",))
+
+_WORD = re.compile(r"[a-z][a-z0-9\-]*")
+
+# Misspellings are only corrected for names this long and one edit away: different drugs are often two or three
+# edits apart (paroxetine/fluoxetine, prednisone/prednisolone), and showing the wrong drug's monograph is unsafe
+MIN_FUZZY_LENGTH = 6
+
+# Words around a drug name in tool inputs like "side effects of ibuprofen 400mg tablets"
+_STOPWORDS = {
+    "about", "and", "are", "can", "capsule", "capsules", "does", "dosage", "dose", "drug", "effects", "for",
+    "information", "interactions", "medication", "medicine", "side", "syrup", "tablet", "tablets", "take",
+    "taking", "the", "uses", "warnings", "what", "with",
+}
+
+
+class Monograph:
+    """
+    One medication: generic name, brand aliases and the sections shown to the user
+    """
+    __slots__ = ("name", "aliases") + FIELDS
+
+    def __init__(self, name: str, aliases: list, **fields):
+        self.name = name
+        self.aliases = aliases
+        for field in FIELDS:
+            setattr(self, field, (fields.get(field) or "").strip())
+
+    def render(self) -> str:
+        lines = [f"{self.name[0].upper()}{self.name[1:]}" + (f" ({self.drug_class})" if self.drug_class else "")]
+        if self.aliases:
+            lines.append("Also known as: " + ", ".join(alias.title() for alias in self.aliases))
+        for label, value in (
+            ("Used for", self.uses),
+            ("Common side effects", self.common_side_effects),
+            ("Serious side effects (seek medical help)", self.serious_side_effects),
+            ("Warnings", self.warnings),
+            ("Interactions", self.interactions),
+        ):
+            if value:
+                lines.append(f"{label}: {value}")
+        return "\n".join(lines)
+
+
+class MedicationMatch:
+    __slots__ = ("monograph", "matched", "method", "distance")
+
+    def __init__(self, monograph: Monograph, matched: str, method: str, distance: int = 0):
+        self.monograph = monograph
+        self.matched = matched  # the indexed name or alias that matched
+        self.method = method  # "exact", "alias" or "fuzzy"
+        self.distance = distance
+
+    def render(self, query: str) -> str:
+        text = self.monograph.render()
+        if self.method == "fuzzy":
+            return (f"Showing information for {self.monograph.name}, the closest match to \"{query.strip()}\". "
+                    f"If you meant a different medication, please check the spelling.\n\n{text}")
+        return text
+
+
+def _deletes(name: str) -> set:
+    return {name[:i] + name[i + 1:] for i in range(len(name))}
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions), or limit + 1 once it exceeds limit
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class MedicationIndex:
+    """
+    In-memory medication monograph index with brand-name and misspelling-tolerant lookup.
+
+    Generic names, dataset aliases and DRUG_ALIASES are held in a dict for exact lookups. A single typo
+    is corrected through the names' one-deletion variants, but only when exactly one medication is in
+    reach; anything else is a miss and goes to the LLM. The dataset (CSV or JSON) is loaded on first
+    use from MEDICATION_INDEX_PATH.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._names = {}  # normalized name or alias -> Monograph
+        self._deletes = {}  # name with one character deleted -> name, or a tuple when several share it
+        self._max_words = 1
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.build_ms = None
+        self.hits = defaultdict(int)
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "MedicationIndex":
+        return cls(
+            path=os.getenv("MEDICATION_INDEX_PATH") or DEFAULT_PATH,
+            enabled=os.getenv("MEDICATION_INDEX_ENABLED", "true").lower() == "true",
+        )
+
+    @staticmethod
+    def read_records(path: str) -> list:
+        """
+        Monograph rows from a CSV file or a JSON list; aliases are a list or a ";"-separated string
+        """
+        with open(path, encoding="utf-8", newline="") as f:
+            records = json.load(f) if path.endswith(".json") else list(csv.DictReader(f))
+        for record in records:
+            aliases = record.get("aliases") or []
+            if isinstance(aliases, str):
+                aliases = aliases.split(";")
+            record["aliases"] = [alias for alias in (normalize_text(alias) for alias in aliases) if alias]
+        return records
+
+    def build(self, records: list) -> None:
+        """
+        Replace the index contents with the given monograph records
+        """
+        start = time.perf_counter()
+        names = {}
+        for record in records:
+            name = normalize_text(record.get("name") or "")
+            if not name:
+                continue
+            monograph = Monograph(name, record["aliases"], **{field: record.get(field) for field in FIELDS})
+            names[name] = monograph
+            for alias in monograph.aliases:
+                names.setdefault(alias, monograph)
+        for brand, generic in DRUG_ALIASES.items():
+            if generic in names:
+                names.setdefault(brand, names[generic])
+        deletes = {}
+        for name in names:
+            if len(name) < MIN_FUZZY_LENGTH:
+                continue
+            for variant in _deletes(name):
+                # Most variants belong to one name; a bare string instead of a list saves most of the memory
+                existing = deletes.get(variant)
+                deletes[variant] = name if existing is None else (existing, name) if isinstance(existing, str) else existing + (name,)
+        self._names = names
+        self._deletes = deletes
+        self._max_words = max((len(name.split()) for name in names), default=1)
+        self._loaded = True
+        self.build_ms = (time.perf_counter() - start) * 1000
+
+    def load(self) -> bool:
+        """
+        Load the dataset once; returns False when the index is disabled or the dataset is unavailable
+        """
+        if self._loaded or not self.enabled:
+            return self._loaded
+        with self._lock:
+            if not self._loaded:
+                try:
+                    self.build(self.read_records(self.path))
+                    logger.info("[MEDICATION INDEX] Indexed %d names from %s in %.1fms", len(self._names), self.path, self.build_ms)
+                except (OSError, ValueError, KeyError) as e:
+                    # Keep answering through the LLM rather than failing every lookup
+                    logger.warning("[MEDICATION INDEX] Could not load %s: %s", self.path, e)
+                    self.enabled = False
+        return self._loaded
+
+    def _one_edit(self, term: str) -> list:
+        # Names one insertion, deletion, substitution or transposition away share a single-deletion variant
+        if len(term) < MIN_FUZZY_LENGTH:
+            return []
+        candidates = set()
+        for variant in _deletes(term) | {term}:
+            if len(variant) >= MIN_FUZZY_LENGTH and variant in self._names:
+                candidates.add(variant)
+            names = self._deletes.get(variant, ())
+            if isinstance(names, str):
+                candidates.add(names)
+            else:
+                candidates.update(names)
+        return [name for name in candidates if edit_distance(term, name, 1) == 1]
+
+    def _match(self, name: str, distance: int = 0) -> MedicationMatch:
+        monograph = self._names[name]
+        method = "fuzzy" if distance else "exact" if name == monograph.name else "alias"
+        return MedicationMatch(monograph, name, method, distance)
+
+    def lookup(self, query: str) -> Optional[MedicationMatch]:
+        """
+        Find the medication named in a tool input such as "Crocin 500mg" or "side effects of ibuprofn"
+        """
+        if not self.load():
+            return None
+        text = normalize_text(query).strip(" .,;:!?\"'")
+        match = None
+        if text in self._names:
+            match = self._match(text)
+        else:
+            words = _WORD.findall(text)
+            # Longest word windows first, so "amoxicillin and clavulanate" wins over "amoxicillin"
+            for size in range(min(self._max_words, len(words)), 0, -1):
+                for i in range(len(words) - size + 1):
+                    window = " ".join(words[i:i + size])
+                    if window in self._names:
+                        match = self._match(window)
+                        break
+                if match:
+                    break
+            if match is None:
+                found = {}
+                if 1 < len(words) <= self._max_words:
+                    # Misspelled multi-word names such as "amoxicilin and clavulanate", before their single words
+                    found = {id(self._names[name]): name for name in self._one_edit(" ".join(words))}
+                if not found:
+                    for word in words:
+                        if word not in _STOPWORDS:
+                            for name in self._one_edit(word):
+                                found.setdefault(id(self._names[name]), name)
+                # Only an unambiguous correction is served; two drugs within reach means we cannot tell which was meant
+                if len(found) == 1:
+                    match = self._match(next(iter(found.values())), distance=1)
+        if match is None:
+            self.misses += 1
+            LOOKUPS.inc(result="miss")
+            return None
+        self.hits[match.method] += 1
+        LOOKUPS.inc(result=match.method)
+        return match
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loaded": self._loaded,
+            "path": self.path,
+            "medications": len({id(monograph) for monograph in self._names.values()}),
+            "names": len(self._names),
+            "build_ms": round(self.build_ms, 2) if self.build_ms is not None else None,
+            "hits": dict(self.hits),
+            "misses": self.misses,
+        }
+
+
+medication_index = MedicationIndex.from_env()
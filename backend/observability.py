@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Request ID of the HTTP request being served, set by RequestContextMiddleware
+request_id_var: ContextVar = ContextVar("request_id", default=None)
+# Spans recorded while serving the current request, summarized when it finishes
+_request_spans: ContextVar = ContextVar("request_spans", default=None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_listener = None
+
+
+def setup_logging() -> None:
+    """
+    Route all logging through a queue so request handlers never block on stdout.
+
+    Records are filtered by LOG_LEVEL and stamped with the request ID on the calling thread, then
+    formatted and written by a background listener thread (LOG_FORMAT "text" or "json").
+    """
+    global _listener
+    if _listener is not None:
+        return
+    if os.getenv("LOG_FORMAT", "text").lower() == "json":
+        formatter = _JsonFormatter()
+    else:
+        formatter = _TextFormatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(_RequestIdFilter())
+    root = logging.getLogger()
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.addHandler(queue_handler)
+    # Per-request client logs are noise at INFO
+    logging.getLogger("httpx").setLevel(os.getenv("HTTPX_LOG_LEVEL", "WARNING").upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    Flush queued records and stop the listener thread
+    """
+    global _listener
+    listener = _listener
+    _listener = None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
+
+
+logger = get_logger(__name__)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class _CallbackMetric:
+    """Gauge or counter whose samples are read from a callback at scrape time"""
+
+    def __init__(self, name: str, help_text: str, metric_type: str, labelnames: tuple, collect: Callable):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        try:
+            samples = self.collect()
+        except Exception as e:
+            logger.warning("Metric collector %s failed: %s", self.name, e)
+            return []
+        for labels, value in samples:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name: str, help_text: str, metric_type: str, labelnames: tuple, collect: Callable) -> None:
+        """
+        Register a gauge/counter read at scrape time; collect returns [(label values tuple, value), ...]
+        """
+        self._metrics.append(_CallbackMetric(name, help_text, metric_type, labelnames, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+HTTP_REQUESTS = metrics.counter("http_requests_total", "HTTP requests served", ("method", "route", "status"))
+HTTP_DURATION = metrics.histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+SPAN_DURATION = metrics.histogram("span_duration_seconds", "Duration of traced operations", ("span", "target", "status"))
+
+
+def record_span(name: str, duration: float, target: str = "", status: str = "ok") -> None:
+    """
+    Record a finished span: observe its duration and attach it to the current request's trace
+    """
+    SPAN_DURATION.observe(duration, span=name, target=target, status=status)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((name, target, duration, status))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("span %s", name, extra={"fields": {"target": target, "status": status, "duration_ms": round(duration * 1000, 2)}})
+
+
+@contextmanager
+def span(name: str, target: str = ""):
+    """
+    Time a block as a span (usable inside coroutines as well as synchronous code)
+    """
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        record_span(name, time.perf_counter() - start, target, status)
+
+
+def _summarize_spans(spans: list) -> dict:
+    summary = {}
+    for name, target, duration, status in spans:
+        key = f"{name}:{target}" if target else name
+        entry = summary.setdefault(key, {"count": 0, "ms": 0.0, "errors": 0})
+        entry["count"] += 1
+        entry["ms"] = round(entry["ms"] + duration * 1000, 2)
+        if status != "ok":
+            entry["errors"] += 1
+    return summary
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware giving each HTTP request an ID (X-Request-ID, generated when absent), request
+    metrics and a one-line summary of its spans when it finishes
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        spans_token = _request_spans.set([])
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_request_id(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode("latin-1")))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            duration = time.perf_counter() - start
+            route = self._route_path(scope)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=str(status_code))
+            HTTP_DURATION.observe(duration, method=scope["method"], route=route)
+            logger.info("%s %s %s", scope["method"], route, status_code, extra={"fields": {
+                "duration_ms": round(duration * 1000, 2),
+                "spans": json.dumps(_summarize_spans(_request_spans.get()), separators=(",", ":")),
+            }})
+            _request_spans.reset(spans_token)
+            request_id_var.reset(id_token)
+
+    def _route_path(self, scope) -> str:
+        # Label by route template, not raw path, to keep metric cardinality bounded
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            router = scope.get("router")
+            for route in getattr(router, "routes", ()):
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = self._route_paths[endpoint] = path or "unmatched"
+        return path
+
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import pickle
+from typing import Optional
+from dotenv import load_dotenv
+from specialists import specialist_directory
+from observability import get_logger
+
+load_dotenv()
+logger = get_logger(__name__)
+
+SPECIALTIES = (
+    r"doctors?|physicians?|specialists?|clinics?|hospitals?|gp|"
+    r"cardiologists?|dermatologists?|neurologists?|pediatricians?|paediatricians?|gynaecologists?|gynecologists?|"
+    r"orthopedics?|orthopaedics?|orthopedists?|psychiatrists?|psychologists?|ent|dentists?|oncologists?|"
+    r"ophthalmologists?|eye doctors?|urologists?|endocrinologists?|gastroenterologists?|pulmonologists?|nephrologists?"
+)
+
+_GENERIC_PROVIDER = re.compile(r"doctors?|physicians?|specialists?|clinics?|hospitals?")
+
+# A few words up to the end of the sentence; not "me" or "my area", which leave the agent to ask where
+_LOCATION = (
+    r"(?P<location>(?!(?:me|us|you|here|there|my|our|your|this|that|the area)\b)"
+    r"[a-z0-9][\w.'-]*(?:,?\s+[a-z0-9][\w.'-]*){0,4}?)(?:,?\s+(?:please|thanks|thank you))?\s*[?.!]*$"
+)
+# Place-name words kept when the geocoder does not know the place
+_MAX_UNKNOWN_PLACE_WORDS = 2
+
+_FIND_SPECIALIST = re.compile(
+    r"\b(?:find|locate|search(?: for)?|looking for|look for|need|recommend|suggest|show(?: me)?|list|any|where (?:is|are|can i find))\b"
+    r".{0,40}?\b(?P<specialty>" + SPECIALTIES + r")\b.{0,30}?\b(?:near|in|around|close to|nearby)\s+" + _LOCATION,
+    re.IGNORECASE
+)
+_SPECIALIST_NEAR = re.compile(
+    # Not "my doctor in Pune ...", which is about the user's own doctor
+    r"(?<!\bmy )(?<!\bour )\b(?P<specialty>" + SPECIALTIES + r")\b.{0,30}?\b(?:near|in|around|close to)\s+" + _LOCATION,
+    re.IGNORECASE
+)
+_BOOK_APPOINTMENT = re.compile(
+    r"\b(?:book|schedule|make|set up|get|fix|arrange)\b.{0,30}?\bappointments?\b(?:\s+(?:with|for)\s+(?:an?\s+|the\s+|my\s+)?(?P<type>[a-z][\w -]{1,40}?))?\s*[?.!]*$",
+    re.IGNORECASE
+)
+_MEDICATION_LOOKUP = re.compile(
+    r"^(?:what are |tell me (?:about )?)?(?:the )?(?:side effects|uses|warnings|interactions|information)\s+(?:of|about|for)\s+"
+    r"(?P<drug>[a-z][\w -]{2,40}?)\s*[?.!]*$",
+    re.IGNORECASE
+)
+_APPOINTMENT_HOWTO = re.compile(r"\bhow (?:do|can|should) i\b.{0,20}?\bappointments?\b", re.IGNORECASE)
+
+# Signals that the message needs medical reasoning, not just a lookup
+_NEEDS_AGENT = re.compile(
+    r"\b(?:pain|bleeding|breath|symptoms?|fever|dose|dosage|side effects?|medicines?|medications?|tablets?|"
+    r"prescription|prescribed|diagnos\w*|should i|is it|what is|why)\b",
+    re.IGNORECASE
+)
+_COMPOUND = re.compile(r"\b(?:and|also|then)\s+(?:what|how|why|is|should|can|tell)\b", re.IGNORECASE)
+
+_model = None
+_model_loaded = False
+
+
+def _load_model():
+    """
+    Load the optional sklearn-style intent model (anything with predict_proba and classes_)
+    """
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        model_path = os.getenv("ROUTER_MODEL_PATH")
+        if model_path and os.path.exists(model_path):
+            with open(model_path, "rb") as f:
+                _model = pickle.load(f)
+            logger.info("[ROUTER] Loaded intent model from %s", model_path)
+    return _model
+
+
+def _penalty(text: str) -> float:
+    penalty = 0.0
+    if _NEEDS_AGENT.search(text):
+        penalty += 0.4
+    if _COMPOUND.search(text):
+        penalty += 0.3
+    if len(text.split()) > 25:
+        penalty += 0.2
+    return penalty
+
+
+def _split_location(span: str) -> tuple:
+    """
+    (place, trailing clause) of the words after "near"/"in": the longest place the geocoder knows,
+    else the first few words
+    """
+    try:
+        specialist_directory.geocoder.load()
+        place = specialist_directory.geocoder.leading_place(span)
+    except OSError:
+        place = None
+    words = list(re.finditer(r"[^\s,]+", span))
+    if not words:
+        return span, ""
+    size = len(place.split()) if place else min(len(words), _MAX_UNKNOWN_PLACE_WORDS)
+    # Sliced from the message to keep the user's spelling and punctuation of the place
+    end = words[size - 1].end()
+    return span[:end], span[end:].strip(" ,")
+
+
+def _specialist_route(match: re.Match, confidence: float) -> dict:
+    location, rest = _split_location(match.group("location"))
+    if rest:
+        # "clinic in Pune open on Sunday": more than a place follows, so the agent should read the whole message
+        confidence -= 0.3
+    decision = {"intent": "find_specialist", "tool": "find_nearby_specialists_by_location",
+                "argument": location.strip(" .,"), "confidence": confidence, "method": "rule"}
+    specialty = match.group("specialty").lower()
+    if not _GENERIC_PROVIDER.fullmatch(specialty):
+        # Passed to the tool as a keyword argument to filter the directory
+        decision["options"] = {"specialty": specialty}
+    return decision
+
+
+def _rule_route(text: str) -> Optional[dict]:
+    match = _FIND_SPECIALIST.search(text)
+    if match:
+        return _specialist_route(match, 0.95)
+    match = _SPECIALIST_NEAR.search(text)
+    if match:
+        return _specialist_route(match, 0.85)
+    match = _BOOK_APPOINTMENT.search(text)
+    if match:
+        return {"intent": "schedule_appointment", "tool": "schedule_appointment_helper",
+                "argument": (match.group("type") or "general").strip(), "confidence": 0.9, "method": "rule"}
+    if _APPOINTMENT_HOWTO.search(text):
+        return {"intent": "schedule_appointment", "tool": "schedule_appointment_helper",
+                "argument": "general", "confidence": 0.85, "method": "rule"}
+    match = _MEDICATION_LOOKUP.search(text)
+    if match:
+        # "side effects of" is what this lookup answers, so only the drug part is checked for signs the
+        # question needs the agent ("side effects of ibuprofen" is fast-pathed, "... for my fever" is not)
+        return {"intent": "medication_info", "tool": "get_medication_information",
+                "argument": match.group("drug").strip(), "confidence": 0.9, "method": "rule",
+                "penalty_text": match.group("drug")}
+    return None
+
+
+def _model_route(text: str) -> Optional[dict]:
+    model = _load_model()
+    if model is None:
+        return None
+    probabilities = model.predict_proba([text])[0]
+    best = max(range(len(probabilities)), key=lambda i: probabilities[i])
+    intent = str(model.classes_[best])
+    confidence = float(probabilities[best])
+    if intent == "schedule_appointment":
+        return {"intent": intent, "tool": "schedule_appointment_helper", "argument": "general",
+                "confidence": confidence, "method": "model"}
+    if intent == "find_specialist":
+        # The tool needs a location; without one the agent has to ask for it
+        match = re.search(r"\b(?:near|in|around)\s+" + _LOCATION, text, re.IGNORECASE)
+        if match:
+            location, rest = _split_location(match.group("location"))
+            return {"intent": intent, "tool": "find_nearby_specialists_by_location", "argument": location,
+                    "confidence": confidence - 0.3 if rest else confidence, "method": "model"}
+    return None
+
+
+def route_query(text: str) -> dict:
+    """
+    Classify a message for the fast path.
+
+    Returns:
+        dict: intent, tool to call directly, its argument (and keyword "options" for some tools), confidence (0-1)
+              and the method that decided.
+              intent is "agent" with confidence 0 when the message should go through the full agent.
+              single_intent is set when the message is one lookup with a tool, even if not confident enough to fast-path.
+    """
+    text = " ".join(text.split())
+    decision = _rule_route(text) or _model_route(text)
+    if decision is None:
+        decision = {"intent": "agent", "tool": None, "argument": None, "confidence": 0.0, "method": "none"}
+    else:
+        decision["confidence"] = round(max(0.0, decision["confidence"] - _penalty(decision.pop("penalty_text", text))), 3)
+    threshold = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.8"))
+    decision["fast_path"] = decision["tool"] is not None and decision["confidence"] >= threshold
+    decision["single_intent"] = decision["tool"] is not None and not _COMPOUND.search(text)
+    logger.info("[ROUTER] decision", extra={"fields": {"text": json.dumps(text[:80]), **decision}})
+    return decision
@@ -0,0 +1,191 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from observability import metrics
+
+load_dotenv()
+
+PRIORITY_EMERGENCY = 0
+PRIORITY_NORMAL = 1
+
+# Priority of the request currently being served; emergency-flagged requests jump the wait queues
+request_priority: ContextVar = ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+BACKENDS = {
+    # name: (default max concurrency, default max queue)
+    "ollama_text": (2, 16),
+    "ollama_vision": (1, 8),
+    "openai_llm": (8, 32),
+    "whisper": (4, 16),
+    "tts": (4, 32),
+}
+
+
+WAIT_SECONDS = metrics.histogram(
+    "scheduler_wait_seconds", "Time spent waiting for a backend slot", ("backend",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+)
+
+
+class Overloaded(Exception):
+    """
+    Raised when a backend's wait queue is full or a request waited too long for a slot
+    """
+
+    def __init__(self, backend: str, retry_after: int):
+        super().__init__(f"The {backend} service is busy, please retry in {retry_after} seconds")
+        self.backend = backend
+        self.retry_after = retry_after
+
+
+class BackendLimiter:
+    """
+    Concurrency limit for one downstream with a bounded priority wait queue.
+
+    Waiters are served lowest priority value first, then in arrival order. Emergency requests are
+    never rejected for a full queue; everyone else gets Overloaded instead of queueing without bound.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hold_avg = 1.0
+
+    def _retry_after(self) -> int:
+        # Rough time until a queued request would get a slot, from the average hold time
+        backlog = len(self._waiters) + 1
+        return max(1, round(self._hold_avg * backlog / self.max_concurrency))
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL) -> float:
+        """
+        Wait for a slot and return the time spent waiting in seconds
+        """
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self._admitted += 1
+            WAIT_SECONDS.observe(0.0, backend=self.name)
+            return 0.0
+        if priority != PRIORITY_EMERGENCY and len(self._waiters) >= self.max_queue:
+            self._rejected += 1
+            raise Overloaded(self.name, self._retry_after())
+
+        start = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up, pass it on
+                self.release()
+            else:
+                future.cancel()
+                self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.TimeoutError):
+                self._timed_out += 1
+                raise Overloaded(self.name, self._retry_after())
+            raise
+        waited = time.perf_counter() - start
+        self._admitted += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        WAIT_SECONDS.observe(waited, backend=self.name)
+        return waited
+
+    def release(self, held: float = None) -> None:
+        if held is not None:
+            self._hold_avg = 0.9 * self._hold_avg + 0.1 * held
+        # Hand the slot straight to the next live waiter so nobody can barge in
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = None):
+        await self.acquire(request_priority.get() if priority is None else priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": len(self._waiters),
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "avg_wait_ms": round(1000 * self._wait_total / self._admitted, 2) if self._admitted else 0.0,
+            "max_wait_ms": round(1000 * self._wait_max, 2),
+            "avg_hold_ms": round(1000 * self._hold_avg, 2),
+        }
+
+
+class Scheduler:
+    """
+    Admission control for every downstream service (Ollama text/vision, OpenAI LLM, Whisper, TTS)
+    """
+
+    def __init__(self, limiters: dict):
+        self.limiters = limiters
+
+    @classmethod
+    def from_env(cls) -> "Scheduler":
+        """
+        Build the limiters from <BACKEND>_MAX_CONCURRENCY and <BACKEND>_MAX_QUEUE settings
+        """
+        queue_timeout = float(os.getenv("SCHEDULER_QUEUE_TIMEOUT", "30"))
+        limiters = {}
+        for name, (concurrency, queue) in BACKENDS.items():
+            limiters[name] = BackendLimiter(
+                name,
+                max_concurrency=int(os.getenv(f"{name.upper()}_MAX_CONCURRENCY", str(concurrency))),
+                max_queue=int(os.getenv(f"{name.upper()}_MAX_QUEUE", str(queue))),
+                queue_timeout=queue_timeout,
+            )
+        return cls(limiters)
+
+    def slot(self, backend: str, priority: int = None):
+        """
+        Hold one slot of a backend for the duration of an `async with` block
+        """
+        return self.limiters[backend].slot(priority)
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+
+scheduler = Scheduler.from_env()
+
+for _name, _help, _type, _field in (
+    ("scheduler_active", "Calls currently holding a backend slot", "gauge", "active"),
+    ("scheduler_queue_depth", "Calls waiting for a backend slot", "gauge", "queue_depth"),
+    ("scheduler_rejected_total", "Calls rejected with 429 because the wait queue was full", "counter", "rejected"),
+    ("scheduler_timed_out_total", "Calls that gave up waiting for a backend slot", "counter", "timed_out"),
+):
+    metrics.register_callback(
+        _name, _help, _type, ("backend",),
+        lambda field=_field: [((name,), stats[field]) for name, stats in scheduler.stats().items()]
+    )
@@ -0,0 +1,268 @@
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from contextvars import ContextVar
+from collections import OrderedDict, deque
+from typing import Optional
+from dotenv import load_dotenv
+from config import DRUG_ALIASES, SYMPTOM_TERMS
+from observability import get_logger
+
+load_dotenv()
+logger = get_logger(__name__)
+
+_MEDICATION = re.compile(
+    r"\b(?:" + "|".join(re.escape(name) for name in sorted(set(DRUG_ALIASES) | set(DRUG_ALIASES.values()), key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+_SYMPTOM = re.compile(
+    r"\b(?:" + "|".join(re.escape(term) for term in sorted(SYMPTOM_TERMS, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+# Conversation session of the agent run currently executing, so tools dedupe per session like the emergency lane
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+_ALLERGY = re.compile(r"\ballergic to (?P<allergen>[a-z][\w-]{2,30})", re.IGNORECASE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+FACT_KINDS = ("medications", "symptoms", "allergies")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count (about four characters per token for English text)
+    """
+    return max(1, len(text) // 4)
+
+
+def extract_facts(text: str) -> dict:
+    """
+    Pull medications, symptoms and allergies mentioned in a message
+    """
+    return {
+        "medications": {DRUG_ALIASES.get(match.lower(), match.lower()) for match in _MEDICATION.findall(text)},
+        "symptoms": {match.lower() for match in _SYMPTOM.findall(text)},
+        "allergies": {match.lower() for match in _ALLERGY.findall(text)},
+    }
+
+
+def _condense(role: str, text: str, max_chars: int = 160) -> str:
+    # First sentence of the turn, as one summary line
+    text = " ".join(text.split())
+    first = _SENTENCE_END.split(text, 1)[0]
+    if len(first) > max_chars:
+        first = first[:max_chars - 1].rstrip() + "…"
+    return f"{'User' if role == 'u' else 'Assistant'}: {first}"
+
+
+class Session:
+    """
+    One conversation: recent turns within a token window, a running summary of older turns,
+    and the facts gathered so far
+    """
+    __slots__ = ("id", "turns", "window_tokens", "summary", "summary_tokens", "facts", "updated_at")
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.turns = deque()  # (role "u"/"a", text, tokens)
+        self.window_tokens = 0
+        self.summary = deque()  # (line, tokens)
+        self.summary_tokens = 0
+        self.facts = {kind: set() for kind in FACT_KINDS}
+        self.updated_at = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "turns": [list(turn) for turn in self.turns],
+            "summary": [list(line) for line in self.summary],
+            "facts": {kind: sorted(values) for kind, values in self.facts.items()},
+            "updated_at": self.updated_at,
+        })
+
+    @classmethod
+    def from_json(cls, session_id: str, data: str) -> "Session":
+        session = cls(session_id)
+        data = json.loads(data)
+        session.turns = deque(tuple(turn) for turn in data["turns"])
+        session.window_tokens = sum(turn[2] for turn in session.turns)
+        session.summary = deque(tuple(line) for line in data["summary"])
+        session.summary_tokens = sum(line[1] for line in session.summary)
+        session.facts = {kind: set(data["facts"].get(kind, [])) for kind in FACT_KINDS}
+        session.updated_at = data["updated_at"]
+        return session
+
+
+class SessionStore:
+    """
+    Conversation sessions keyed by session ID, kept in an in-memory LRU with optional SQLite persistence.
+
+    Each session keeps its most recent turns within window_tokens. Older turns are compacted one by one
+    into summary lines (their first sentence), and the summary itself is capped at summary_tokens, so
+    the context built for the agent stays bounded however long the conversation runs. Medications,
+    symptoms and allergies mentioned by the user are cached as facts and always included.
+    """
+
+    def __init__(self, window_tokens: int = 1200, summary_tokens: int = 400, max_sessions: int = 1000,
+                 ttl_seconds: float = 24 * 3600, db_path: str = None):
+        self.window_tokens = window_tokens
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._db = None
+
+    async def aget(self, session_id: str = None) -> Session:
+        """
+        Return the session for an ID, loading it from SQLite if needed, or start a new one
+        """
+        if session_id:
+            session = self._get_memory(session_id)
+            if session is None and self.db_path is not None:
+                session = await asyncio.to_thread(self._db_load, session_id)
+                if session is not None:
+                    self._remember(session)
+            if session is not None:
+                return session
+        session = Session(session_id or uuid.uuid4().hex)
+        self._remember(session)
+        return session
+
+    async def arecord(self, session: Session, user_text: str, assistant_text: str) -> None:
+        """
+        Append one exchange to a session, compacting older turns and persisting it
+        """
+        with self._lock:
+            for kind, values in extract_facts(user_text).items():
+                session.facts[kind].update(values)
+            for role, text in (("u", user_text), ("a", assistant_text)):
+                # A single long answer may use at most half the window
+                if count_tokens(text) > self.window_tokens // 2:
+                    text = text[:self.window_tokens * 2].rstrip() + "…"
+                tokens = count_tokens(text)
+                session.turns.append((role, text, tokens))
+                session.window_tokens += tokens
+            self._compact(session)
+            session.updated_at = time.time()
+            data = session.to_json() if self.db_path is not None else None
+        if data is not None:
+            await asyncio.to_thread(self._db_save, session.id, data, session.updated_at)
+
+    def build_input(self, session: Session, message: str) -> str:
+        """
+        Build the agent input for a message: summary, known facts and recent turns, then the message
+        """
+        with self._lock:
+            facts = "; ".join(f"{kind}: {', '.join(sorted(values))}" for kind, values in session.facts.items() if values)
+            summary = "\n".join(line for line, _ in session.summary)
+            recent = "\n".join(
+                f"{'User' if role == 'u' else 'Assistant'}: {text}" for role, text, _ in session.turns
+            )
+        if not (facts or summary or recent):
+            return message
+        parts = []
+        if summary:
+            parts.append(f"Earlier in this conversation:\n{summary}")
+        if facts:
+            parts.append(f"Known facts about the user: {facts}")
+        if recent:
+            parts.append(f"Recent messages:\n{recent}")
+        parts.append(f"Current question: {message}")
+        return "\n\n".join(parts)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.db_path is not None:
+            self._db_execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"sessions": len(self._sessions)}
+
+    def _compact(self, session: Session) -> None:
+        # Keep at least the latest exchange verbatim
+        while session.window_tokens > self.window_tokens and len(session.turns) > 2:
+            role, text, tokens = session.turns.popleft()
+            session.window_tokens -= tokens
+            line = _condense(role, text)
+            line_tokens = count_tokens(line)
+            session.summary.append((line, line_tokens))
+            session.summary_tokens += line_tokens
+        while session.summary_tokens > self.summary_tokens and len(session.summary) > 1:
+            _, line_tokens = session.summary.popleft()
+            session.summary_tokens -= line_tokens
+
+    def _get_memory(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            if session.updated_at + self.ttl_seconds <= time.time():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def _remember(self, session: Session) -> None:
+        with self._lock:
+            self._sessions[session.id] = session
+            self._sessions.move_to_end(session.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _connect(self):
+        if self._db is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _db_load(self, session_id: str) -> Optional[Session]:
+        try:
+            with self._db_lock:
+                row = self._connect().execute(
+                    "SELECT data, updated_at FROM sessions WHERE id = ?", (session_id,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("[SESSIONS] SQLite read failed: %s", e)
+            return None
+        if row is None or row[1] + self.ttl_seconds <= time.time():
+            return None
+        return Session.from_json(session_id, row[0])
+
+    def _db_save(self, session_id: str, data: str, updated_at: float) -> None:
+        self._db_execute(
+            "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+            (session_id, data, updated_at)
+        )
+
+    def _db_execute(self, sql: str, parameters: tuple) -> None:
+        try:
+            with self._db_lock:
+                db = self._connect()
+                db.execute(sql, parameters)
+                db.commit()
+        except sqlite3.Error as e:
+            logger.warning("[SESSIONS] SQLite write failed: %s", e)
+
+
+session_store = SessionStore(
+    window_tokens=int(os.getenv("SESSION_WINDOW_TOKENS", "1200")),
+    summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "400")),
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600))),
+    db_path=os.getenv("SESSION_DB") or None,
+)
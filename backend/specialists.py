@@ -0,0 +1,429 @@
+import os
+import re
+import csv
+import json
+import math
+import time
+import asyncio
+import threading
+from typing import Optional
+from dotenv import load_dotenv
+from config import SPECIALTY_ALIASES
+from cache import normalize_text
+from observability import get_logger, metrics
+
+load_dotenv()
+logger = get_logger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+INDEX_VERSION = 1
+
+# Columns of the provider directory; lat/lon may be left empty when city or postcode can be geocoded
+REQUIRED_COLUMNS = ("name", "specialty")
+OPTIONAL_COLUMNS = ("phone", "address", "city", "postcode", "lat", "lon")
+_ARRAYS = ("lat", "lon", "codes", "keys", "text", "offsets")
+
+SEARCHES = metrics.counter("specialist_searches_total", "Specialist directory searches by outcome", ("result",))
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9\-]*")
+_COORDINATES = re.compile(r"^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+def _windows(text: str, max_words: int):
+    # Word windows of a query, longest first, so "new delhi" wins over "delhi"
+    words = _WORD.findall(normalize_text(text))
+    for size in range(min(max_words, len(words)), 0, -1):
+        for i in range(len(words) - size + 1):
+            yield " ".join(words[i:i + size])
+
+
+def _specialty_key(name: str) -> str:
+    # "Obstetrics & Gynecology" and "obstetrics and gynecology" compare equal
+    return " ".join(_WORD.findall(normalize_text(name.replace("&", " and "))))
+
+
+class Geocoder:
+    """
+    City and postcode lookup from a place table (place, name, lat, lon), plus literal "lat, lon" input
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._places = {}  # normalized place or postcode -> (display name, lat, lon)
+        self._max_words = 1
+        self._loaded = False
+
+    def load(self) -> None:
+        if self._loaded:
+            return
+        with open(self.path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                place = normalize_text(row["place"])
+                self._places[place] = (row.get("name") or place.title(), float(row["lat"]), float(row["lon"]))
+        self._max_words = max((len(place.split()) for place in self._places), default=1)
+        self._loaded = True
+
+    def locate(self, text: str) -> Optional[tuple]:
+        """
+        (display name, lat, lon) of the first known place in the text, e.g. "Andheri West, Mumbai 400053"
+        """
+        match = _COORDINATES.match(text or "")
+        if match:
+            lat, lon = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                return f"{lat:.4f}, {lon:.4f}", lat, lon
+        for window in _windows(text or "", self._max_words):
+            if window in self._places:
+                return self._places[window]
+        return None
+
+    def leading_place(self, text: str) -> Optional[str]:
+        """
+        The longest known place or postcode the text starts with, e.g. "new delhi" for "New Delhi open on Sunday"
+        """
+        words = _WORD.findall(normalize_text(text or ""))
+        for size in range(min(self._max_words, len(words)), 0, -1):
+            if " ".join(words[:size]) in self._places:
+                return " ".join(words[:size])
+        return None
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distance in km from one point to arrays of points
+    """
+    import numpy as np
+
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpecialistDirectory:
+    """
+    Provider directory with k-nearest search by location and specialty.
+
+    Providers are loaded from a CSV or Parquet file and bucketed into a lat/lon grid. The arrays are
+    sorted by (specialty, grid cell), so the providers of one specialty in one cell are a contiguous
+    slice found with a binary search; a search scans rings of cells outward from the location until
+    nothing closer than the k-th result can remain. The sorted arrays are saved to index_dir and
+    memory-mapped on later starts while the source file is unchanged, so they are built once.
+    """
+
+    def __init__(self, path: str, geocoder: Geocoder, index_dir: str = None, cell_degrees: float = 0.1,
+                 max_distance_km: float = 50.0, results: int = 5, enabled: bool = True):
+        self.path = path
+        self.geocoder = geocoder
+        self.index_dir = index_dir
+        self.cell_degrees = cell_degrees
+        self.max_distance_km = max_distance_km
+        self.results = results
+        self.enabled = enabled
+        self.specialties = []  # display names, indexed by specialty code
+        self._normalized = []
+        self._arrays = {}
+        self._rows = int(math.ceil(180 / cell_degrees)) + 1
+        self._cols = int(math.ceil(360 / cell_degrees))
+        self._loaded = False
+        self._lock = threading.Lock()
+        self._task = None
+        self.source = None  # "built" or "prebuilt"
+        self.build_ms = None
+        self.searches = 0
+
+    @classmethod
+    def from_env(cls) -> "SpecialistDirectory":
+        return cls(
+            path=os.getenv("SPECIALIST_DIRECTORY_PATH") or os.path.join(DATA_DIR, "specialists.csv"),
+            geocoder=Geocoder(os.getenv("SPECIALIST_GEOCODE_PATH") or os.path.join(DATA_DIR, "geocode.csv")),
+            index_dir=os.getenv("SPECIALIST_INDEX_DIR", ".cache/specialists") or None,
+            cell_degrees=float(os.getenv("SPECIALIST_CELL_DEGREES", "0.1")),
+            max_distance_km=float(os.getenv("SPECIALIST_MAX_DISTANCE_KM", "50")),
+            results=int(os.getenv("SPECIALIST_RESULTS", "5")),
+            enabled=os.getenv("SPECIALIST_DIRECTORY_ENABLED", "true").lower() == "true",
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def start(self) -> None:
+        """
+        Load or build the index in a worker thread without delaying startup (idempotent)
+        """
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(asyncio.to_thread(self.load))
+
+    def load(self) -> bool:
+        """
+        Load the index once; returns False when it is disabled or the directory is unavailable
+        """
+        if self._loaded or not self.enabled:
+            return self._loaded
+        with self._lock:
+            if self._loaded:
+                return True
+            try:
+                self.geocoder.load()
+                if not os.path.exists(self.path):
+                    logger.info("[SPECIALISTS] No provider directory at %s, using the built-in list", self.path)
+                    self.enabled = False
+                    return False
+                start = time.perf_counter()
+                prebuilt = self._load_prebuilt()
+                if prebuilt is None:
+                    arrays, specialties = self._build()
+                    self._save(arrays, specialties)
+                    self.source = "built"
+                else:
+                    arrays, specialties = prebuilt
+                    self.source = "prebuilt"
+                self._arrays = arrays
+                self.specialties = specialties
+                self._normalized = [_specialty_key(specialty) for specialty in specialties]
+                self.build_ms = (time.perf_counter() - start) * 1000
+                self._loaded = True
+            except (OSError, ValueError, KeyError, ImportError) as e:
+                # Keep answering with the built-in list rather than failing every search
+                logger.warning("[SPECIALISTS] Could not load %s: %s", self.path, e)
+                self.enabled = False
+                return False
+        logger.info("[SPECIALISTS] %s index of %d providers from %s in %.0fms",
+                    self.source.capitalize(), len(self._arrays["lat"]), self.path, self.build_ms)
+        return True
+
+    def _fingerprint(self) -> dict:
+        stat = os.stat(self.path)
+        return {
+            "version": INDEX_VERSION,
+            "path": os.path.abspath(self.path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "geocode_mtime_ns": os.stat(self.geocoder.path).st_mtime_ns,
+            "cell_degrees": self.cell_degrees,
+        }
+
+    def _load_prebuilt(self) -> Optional[tuple]:
+        import numpy as np
+
+        if not self.index_dir:
+            return None
+        try:
+            with open(os.path.join(self.index_dir, "meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("fingerprint") != self._fingerprint():
+            return None
+        arrays = {name: np.load(os.path.join(self.index_dir, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        return arrays, meta["specialties"]
+
+    def _save(self, arrays: dict, specialties: list) -> None:
+        import numpy as np
+
+        if not self.index_dir:
+            return
+        try:
+            os.makedirs(self.index_dir, exist_ok=True)
+            for name in _ARRAYS:
+                np.save(os.path.join(self.index_dir, f"{name}.npy"), arrays[name])
+            # The metadata goes last, so a partly written index is never picked up
+            temp_path = os.path.join(self.index_dir, "meta.json.tmp")
+            with open(temp_path, "w") as f:
+                json.dump({"fingerprint": self._fingerprint(), "specialties": specialties}, f)
+            os.replace(temp_path, os.path.join(self.index_dir, "meta.json"))
+        except OSError as e:
+            logger.warning("[SPECIALISTS] Could not save the index to %s: %s", self.index_dir, e)
+
+    def _read_frame(self):
+        import pandas as pd
+
+        columns = set(REQUIRED_COLUMNS + OPTIONAL_COLUMNS)
+        if self.path.endswith((".parquet", ".pq")):
+            frame = pd.read_parquet(self.path)
+            frame = frame[[column for column in frame.columns if column in columns]]
+        else:
+            frame = pd.read_csv(self.path, usecols=lambda column: column in columns,
+                                dtype={"phone": str, "postcode": str}, keep_default_na=False, na_values={"lat": [""], "lon": [""]})
+        missing = [column for column in REQUIRED_COLUMNS if column not in frame.columns]
+        if missing:
+            raise ValueError(f"missing columns {', '.join(missing)}")
+        for column in OPTIONAL_COLUMNS:
+            if column not in frame.columns:
+                frame[column] = float("nan") if column in ("lat", "lon") else ""
+        return frame
+
+    def _build(self) -> tuple:
+        import numpy as np
+        import pandas as pd
+
+        frame = self._read_frame()
+        # Plain lists: pandas string methods are several times slower for a single pass like this
+        columns = {
+            column: ["" if value is None or value != value else str(value).strip() for value in frame[column].tolist()]
+            for column in ("name", "specialty", "phone", "address", "city", "postcode")
+        }
+        lat = pd.to_numeric(frame["lat"], errors="coerce").to_numpy(dtype=np.float64, copy=True)
+        lon = pd.to_numeric(frame["lon"], errors="coerce").to_numpy(dtype=np.float64, copy=True)
+        # Providers without coordinates are placed at their postcode or city
+        for i in np.flatnonzero(np.isnan(lat) | np.isnan(lon)):
+            place = self.geocoder.locate(columns["postcode"][i]) or self.geocoder.locate(columns["city"][i])
+            if place is not None:
+                lat[i], lon[i] = place[1], place[2]
+        named = np.array([bool(name and specialty) for name, specialty in zip(columns["name"], columns["specialty"])], dtype=bool)
+        keep = np.flatnonzero(named & ~(np.isnan(lat) | np.isnan(lon)))
+        if len(keep) < len(lat):
+            logger.warning("[SPECIALISTS] Skipped %d providers without a name, specialty or location", len(lat) - len(keep))
+        lat, lon = lat[keep], lon[keep]
+        specialty = [columns["specialty"][i] for i in keep]
+
+        codes, _ = pd.factorize(np.array([value.casefold() for value in specialty], dtype=object))
+        # Codes follow the order of first appearance, so the first occurrences give the display names in code order
+        _, first = np.unique(codes, return_index=True)
+        specialties = [specialty[i] for i in np.sort(first)]
+        codes = codes.astype(np.int32)
+        keys = codes.astype(np.int64) * (self._rows * self._cols) + self._cells(lat, lon)
+        order = np.argsort(keys, kind="stable")
+
+        rows = keep[order]
+        records = [
+            "\x1f".join((columns["name"][i], columns["specialty"][i], columns["phone"][i], columns["address"][i] or columns["city"][i] or columns["postcode"][i])).encode("utf-8")
+            for i in rows.tolist()
+        ]
+        offsets = np.zeros(len(records) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(record) for record in records])
+        arrays = {
+            "lat": lat[order],
+            "lon": lon[order],
+            "codes": codes[order],
+            "keys": keys[order],
+            "text": np.frombuffer(b"".join(records), dtype=np.uint8),
+            "offsets": offsets,
+        }
+        return arrays, specialties
+
+    def _cells(self, lat, lon):
+        import numpy as np
+
+        rows = np.floor((np.asarray(lat) + 90) / self.cell_degrees).astype(np.int64)
+        cols = np.floor((np.asarray(lon) + 180) / self.cell_degrees).astype(np.int64) % self._cols
+        return rows * self._cols + cols
+
+    def resolve_specialty(self, text: str) -> Optional[tuple]:
+        """
+        (specialty, codes) for the specialty named in the text, e.g. "skin doctor" -> dermatology; None when no specialty is named
+        """
+        for window in _windows(text or "", 3):
+            for term in (window, window[:-1] if window.endswith("s") else None):
+                specialty = SPECIALTY_ALIASES.get(term) or (term if term in self._normalized else None)
+                if specialty:
+                    # Whole names only: a substring test would let "urology" match "neurology"
+                    return specialty, [code for code, name in enumerate(self._normalized) if name == specialty]
+        return None
+
+    def nearest(self, lat: float, lon: float, codes: list = None, k: int = None, max_distance_km: float = None) -> list:
+        """
+        Up to k (provider position, distance km) pairs nearest to a point, optionally limited to specialty codes
+        """
+        import numpy as np
+
+        k = k or self.results
+        max_distance_km = self.max_distance_km if max_distance_km is None else max_distance_km
+        codes = np.arange(len(self.specialties), dtype=np.int64) if codes is None else np.asarray(codes, dtype=np.int64)
+        if not len(codes):
+            return []
+        keys = self._arrays["keys"]
+        cells_per_code = self._rows * self._cols
+        row = int(math.floor((lat + 90) / self.cell_degrees))
+        col = int(math.floor((lon + 180) / self.cell_degrees))
+        best_positions = np.empty(0, dtype=np.int64)
+        best_distances = np.empty(0, dtype=np.float64)
+        for ring in range(max(self._rows, self._cols)):
+            if ring == 0:
+                ring_rows, ring_cols = np.array([row]), np.array([col])
+            else:
+                side = np.arange(-ring, ring + 1)
+                ring_rows = np.concatenate([np.full(side.size, row - ring), np.full(side.size, row + ring), row + side[1:-1], row + side[1:-1]])
+                ring_cols = np.concatenate([col + side, col + side, np.full(side.size - 2, col - ring), np.full(side.size - 2, col + ring)])
+            inside = (ring_rows >= 0) & (ring_rows < self._rows)
+            cells = np.unique(ring_rows[inside] * self._cols + ring_cols[inside] % self._cols)
+            wanted = (codes[:, None] * cells_per_code + cells[None, :]).ravel()
+            starts = np.searchsorted(keys, wanted, side="left")
+            ends = np.searchsorted(keys, wanted + 1, side="left")
+            lengths = ends - starts
+            total = int(lengths.sum())
+            if total:
+                # Positions of every provider in the matching (specialty, cell) slices, without a Python loop
+                nonempty = lengths > 0
+                starts, lengths = starts[nonempty], lengths[nonempty]
+                positions = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+                distances = haversine_km(lat, lon, self._arrays["lat"][positions], self._arrays["lon"][positions])
+                best_positions = np.concatenate([best_positions, positions])
+                best_distances = np.concatenate([best_distances, distances])
+                if best_distances.size > k:
+                    top = np.argpartition(best_distances, k - 1)[:k]
+                    best_positions, best_distances = best_positions[top], best_distances[top]
+            # Anything outside this ring is at least `ring` cells away from the location
+            edge_latitude = min(89.9, abs(lat) + (ring + 1) * self.cell_degrees)
+            reach = ring * self.cell_degrees * KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+            if (best_distances.size >= k and best_distances.max() <= reach) or reach > max_distance_km:
+                break
+        order = np.argsort(best_distances)
+        return [(int(best_positions[i]), float(best_distances[i])) for i in order if best_distances[i] <= max_distance_km]
+
+    def provider(self, position: int) -> dict:
+        offsets = self._arrays["offsets"]
+        record = self._arrays["text"][offsets[position]:offsets[position + 1]].tobytes().decode("utf-8")
+        name, specialty, phone, address = record.split("\x1f")
+        return {"name": name, "specialty": specialty, "phone": phone, "address": address}
+
+    def search(self, location: str, specialty: str = "") -> Optional[str]:
+        """
+        Formatted list of the nearest providers, or None when the directory is not loaded
+        """
+        if not self._loaded:
+            return None
+        self.searches += 1
+        place = self.geocoder.locate(location)
+        if place is None:
+            SEARCHES.inc(result="unknown_location")
+            return (f"I couldn't find \"{location}\" in the location directory. Please share a nearby city or postcode "
+                    f"so I can list specialists close to it.")
+        resolved = self.resolve_specialty(specialty) or self.resolve_specialty(location)
+        label = f"{resolved[0]} specialists" if resolved else "medical specialists"
+        name, lat, lon = place
+        matches = self.nearest(lat, lon, resolved[1] if resolved else None)
+        if not matches:
+            SEARCHES.inc(result="no_results")
+            return (f"I couldn't find any {label} within {self.max_distance_km:.0f} km of {name} in the provider directory. "
+                    f"Your insurer's provider list or a nearby hospital can refer you.")
+        SEARCHES.inc(result="found")
+        lines = [f"Here are the nearest {label} to {name}:"]
+        for number, (position, distance) in enumerate(matches, 1):
+            provider = self.provider(position)
+            details = " - ".join(part for part in (f"{distance:.1f} km", provider["address"], provider["phone"]) if part)
+            lines.append(f"{number}. {provider['name']} ({provider['specialty']}) - {details}")
+        lines.append("Please call ahead to confirm availability and whether they accept your insurance.")
+        return "\n".join(lines)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "loaded": self._loaded,
+            "path": self.path,
+            "source": self.source,
+            "providers": len(self._arrays["lat"]) if self._loaded else 0,
+            "specialties": len(self.specialties),
+            "places": len(self.geocoder),
+            "build_ms": round(self.build_ms, 1) if self.build_ms is not None else None,
+            "searches": self.searches,
+        }
+
+
+specialist_directory = SpecialistDirectory.from_env()
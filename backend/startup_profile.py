@@ -0,0 +1,125 @@
+"""
+Startup profiler: per-module import times and time to first request for the backend.
+
+    python startup_profile.py --top 20 --runs 3
+
+Imports are timed with Python's -X importtime in a fresh interpreter, then a second interpreter imports
+main, runs the app lifespan and serves GET / to measure time to first request.
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_FIRST_REQUEST = """
+import time, json
+spawned = time.time()
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    status = client.get("/").status_code
+    served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "lifespan_ms": (ready - imported) * 1000,
+    "first_request_ms": (served - started) * 1000,
+    "served_at": spawned + (served - started),
+    "status": status,
+}))
+"""
+
+
+def import_times(module: str = "main") -> list:
+    """
+    Import a module in a fresh interpreter with -X importtime; returns [(module, self_us, cumulative_us, depth)]
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def time_to_first_request() -> dict:
+    """
+    Wall time from interpreter start to the first response, with the import/lifespan split
+    """
+    started = time.time()
+    result = subprocess.run([sys.executable, "-c", _FIRST_REQUEST], cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Serving the first request failed:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_wall_ms"] = (timings.pop("served_at") - started) * 1000
+    return timings
+
+
+def report(entries: list, top: int) -> dict:
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        by_package[name.split(".")[0]] += self_us
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _, _ in entries) / 1000, 1),
+        "modules": len(entries),
+        "top_cumulative": [
+            {"module": name, "cumulative_ms": round(cumulative / 1000, 1), "self_ms": round(self_us / 1000, 1)}
+            for name, self_us, cumulative, _ in sorted(entries, key=lambda entry: entry[2], reverse=True)[:top]
+        ],
+        "top_packages": [
+            {"package": package, "ms": round(us / 1000, 1)}
+            for package, us in sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Profile backend import time and time to first request")
+    parser.add_argument("--module", default="main", help="module to import (default: main)")
+    parser.add_argument("--top", type=int, default=20, help="number of modules/packages to list")
+    parser.add_argument("--runs", type=int, default=3, help="time-to-first-request runs (median is reported)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    result = report(import_times(args.module), args.top)
+    runs = [time_to_first_request() for _ in range(args.runs)]
+    result["first_request"] = {
+        key: round(statistics.median(run[key] for run in runs), 1)
+        for key in ("import_ms", "lifespan_ms", "first_request_ms", "process_wall_ms")
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+
+    print(f"Imported {result['modules']} modules in {result['total_ms']}ms (importing {args.module})\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for entry in result["top_cumulative"]:
+        print(f"{entry['cumulative_ms']:>14} {entry['self_ms']:>9}  {entry['module']}")
+    print(f"\n{'ms':>14}  package (self time of all its modules)")
+    for entry in result["top_packages"]:
+        print(f"{entry['ms']:>14}  {entry['package']}")
+    timings = result["first_request"]
+    print(f"\nTime to first request (median of {args.runs}): {timings['first_request_ms']}ms "
+          f"(import {timings['import_ms']}ms, lifespan {timings['lifespan_ms']}ms); "
+          f"{timings['process_wall_ms']}ms including interpreter start")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from emergency import EmergencyDispatcher, FakeProvider, is_retryable
+
+
+def _place(provider: FakeProvider, max_attempts: int = 4):
+    async def scenario():
+        dispatcher = EmergencyDispatcher(provider=provider, max_attempts=max_attempts, backoff_base=0.001, backoff_max=0.001)
+        handle = dispatcher.dispatch("help")
+        await dispatcher._queue.join()
+        await dispatcher.stop()
+        return handle
+
+    return asyncio.run(scenario())
+
+
+def test_network_errors_are_retried():
+    provider = FakeProvider(fail_times=2)
+    handle = _place(provider)
+    assert handle.status == "initiated"
+    assert handle.attempts == 3
+
+
+@pytest.mark.parametrize("status", [400, 401, 404])
+def test_client_errors_fail_without_retrying(status):
+    provider = FakeProvider(fail_times=10, fail_status=status)
+    handle = _place(provider)
+    assert handle.status == "failed"
+    assert handle.attempts == 1
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_rate_limits_and_server_errors_are_retried(status):
+    provider = FakeProvider(fail_times=1, fail_status=status)
+    handle = _place(provider)
+    assert handle.status == "initiated"
+    assert handle.attempts == 2
+
+
+def test_twilio_errors_use_their_status():
+    exceptions = pytest.importorskip("twilio.base.exceptions")
+    assert not is_retryable(exceptions.TwilioRestException(400, "/Calls", "Invalid 'To' phone number"))
+    assert is_retryable(exceptions.TwilioRestException(503, "/Calls", "Service unavailable"))
+    assert is_retryable(asyncio.TimeoutError())
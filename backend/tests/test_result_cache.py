@@ -0,0 +1,17 @@
+import asyncio
+import sqlite3
+from cache import ResultCache
+
+
+def test_only_persisted_entries_reach_sqlite(tmp_path):
+    db_path = str(tmp_path / "results.sqlite3")
+    cache = ResultCache("test", db_path=db_path)
+
+    async def scenario():
+        await cache.aset("medication", "monograph")
+        await cache.aset("question", "answer about my symptoms", persist=False)
+        return await cache.aget("question", persist=False)
+
+    assert asyncio.run(scenario()) == "answer about my symptoms"
+    rows = sqlite3.connect(db_path).execute("SELECT key, value FROM results").fetchall()
+    assert rows == [("medication", "monograph")]
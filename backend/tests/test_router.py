@@ -0,0 +1,53 @@
+import pytest
+import router
+
+
+@pytest.fixture(autouse=True)
+def rules_only(monkeypatch):
+    monkeypatch.delenv("ROUTER_MODEL_PATH", raising=False)
+    monkeypatch.delenv("ROUTER_CONFIDENCE_THRESHOLD", raising=False)
+    monkeypatch.setattr(router, "_model_loaded", True)
+    monkeypatch.setattr(router, "_model", None)
+
+
+@pytest.mark.parametrize("text, location", [
+    ("find a cardiologist near Pune", "Pune"),
+    ("cardiologist in New Delhi please", "New Delhi"),
+    ("find a dentist near Bandra, Mumbai", "Bandra, Mumbai"),
+    ("any hospitals near 400001?", "400001"),
+])
+def test_specialist_search_is_fast_pathed(text, location):
+    decision = router.route_query(text)
+    assert decision["fast_path"]
+    assert decision["tool"] == "find_nearby_specialists_by_location"
+    assert decision["argument"] == location
+
+
+@pytest.mark.parametrize("text", [
+    "My doctor in Pune prescribed metformin",
+    "find a doctor near me",
+    "Is there any clinic in my area open on Sunday?",
+    "find a clinic in Pune open on Sunday",
+])
+def test_not_a_plain_specialist_search(text):
+    assert not router.route_query(text)["fast_path"]
+
+
+def test_clause_after_location_lowers_confidence():
+    decision = router.route_query("find a clinic in Pune open on Sunday")
+    assert decision["argument"] == "Pune"
+    assert decision["confidence"] < 0.8
+
+
+def test_medication_lookup_is_fast_pathed():
+    # "side effects" is what the lookup answers, so it does not count against the fast path
+    decision = router.route_query("side effects of ibuprofen")
+    assert decision["fast_path"]
+    assert decision["tool"] == "get_medication_information"
+    assert decision["argument"] == "ibuprofen"
+
+
+def test_medication_question_with_context_goes_to_agent():
+    decision = router.route_query("side effects of ibuprofen for my fever")
+    assert not decision["fast_path"]
+    assert decision["single_intent"]
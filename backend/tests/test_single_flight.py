@@ -0,0 +1,47 @@
+import asyncio
+from utils import SingleFlight
+
+
+def test_caller_arriving_after_last_waiter_cancels_starts_a_new_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def factory():
+            calls.append(len(calls) + 1)
+            await asyncio.sleep(0.05)
+            return 200, f"result {len(calls)}"
+
+        first = asyncio.create_task(flights.do("key", factory))
+        await asyncio.sleep(0)
+        # The second caller runs right after the first one's cancellation, before the cancelled
+        # upstream task has finished and run its done callbacks
+        first.cancel()
+        second = asyncio.create_task(flights.do("key", factory))
+        result = await second
+        assert first.cancelled()
+        return result, calls, flights
+
+    result, calls, flights = asyncio.run(scenario())
+    assert result == (200, "result 2")
+    assert calls == [1, 2]
+    assert flights.cancelled == 1
+
+
+def test_identical_calls_share_one_upstream_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 200, "shared"
+
+        results = await asyncio.gather(*(flights.do("key", factory) for _ in range(3)))
+        return results, calls, flights
+
+    results, calls, flights = asyncio.run(scenario())
+    assert results == [(200, "shared")] * 3
+    assert len(calls) == 1
+    assert flights.coalesced == 2
@@ -0,0 +1,42 @@
+import pytest
+from triage import assess_emergency
+
+# Questions, past events, other people and jokes: never dispatched (critical)
+HARMLESS = [
+    "Can anxiety cause chest pain?",
+    "I had chest pain last week, what could cause it?",
+    "Is chest pain a side effect of metformin?",
+    "My father had a heart attack last year, is aspirin ok for him?",
+    "can seizures be caused by low sugar?",
+    "I overdosed on vitamin C gummies lol",
+    "What are the signs of a stroke?",
+    "My father had a stroke in 2019, is aspirin safe?",
+    "I have no chest pain, just a mild headache",
+    "chest pain",
+]
+
+# Present reports, first person or happening right now: critical
+EMERGENCIES = [
+    "I have crushing chest pain and my left arm is numb",
+    "I can't breathe",
+    "my dad collapsed and is not breathing",
+    "I think my mom is having a stroke",
+    "help my friend took an overdose",
+    "I want to kill myself",
+    "my throat is closing, severe allergic reaction",
+    "I'm having a seizure",
+    "she isn't breathing",
+    "I took an overdose of my sleeping pills",
+]
+
+
+@pytest.mark.parametrize("text", HARMLESS)
+def test_harmless_wording_is_not_critical(text):
+    assert assess_emergency(text)["severity"] != "critical"
+
+
+@pytest.mark.parametrize("text", EMERGENCIES)
+def test_present_emergency_is_critical(text):
+    assessment = assess_emergency(text)
+    assert assessment["severity"] == "critical"
+    assert assessment["has_emergency"]
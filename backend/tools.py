@@ -1,68 +1,69 @@
 import asyncio
-from langchain.agents import tool
-import os
-import shutil
+from contextvars import ContextVar
 from dotenv import load_dotenv
-from utils import query_medgemma, query_llava_vision, call_emergency
-load_dotenv()
-
-def run_async_in_sync(coro):
-    """Helper function to run async functions in sync context"""
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # We're already in an event loop, create a new thread
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, coro)
-                return future.result()
-        else:
-            return loop.run_until_complete(coro)
-    except RuntimeError:
-        # No event loop, create one
-        return asyncio.run(coro)
+from utils import query_medgemma, query_llava_vision
+from emergency import emergency_dispatcher
+from image_store import image_store, current_request_id
+from cache import normalize_drug_name
+from medication_index import medication_index
+from specialists import specialist_directory
+from sessions import current_session_id
+from config import MEDICATION_PROMPT_VERSION
+from scheduler import Overloaded
+from observability import get_logger, span
 
+load_dotenv()
+logger = get_logger(__name__)
 
-@tool
-def ask_medical_specialist(query: str) -> str:
+async def ask_medical_specialist(query: str) -> str:
     """
     Generate a medical response using the MedGemma model.
     Use this for all medical queries, health questions, symptom analysis,
     or to provide evidence-based medical guidance in a conversational tone.
     Always recommends consulting healthcare professionals for proper diagnosis.
     """
-    print(f"🏥 [MEDICAL SPECIALIST TOOL] Called with query: {query[:100]}...")
+    logger.info("[MEDICAL SPECIALIST TOOL] Called with query: %.100r", query)
     try:
-        result = run_async_in_sync(query_medgemma(query))
+        result = await query_medgemma(query)
         return result
+    except Overloaded:
+        # Surfaces to the API as 429 instead of becoming tool output
+        raise
     except Exception as e:
-        print(f"❌ [MEDICAL SPECIALIST] Error: {str(e)}")
+        logger.error("[MEDICAL SPECIALIST] Error: %s", e)
         return f"I apologize, but I'm having trouble accessing the medical knowledge base right now. For your safety, please consult with a healthcare professional directly. Error: {str(e)}"
 
 
-@tool
-def emergency_call_tool(emergency_message: str = "Emergency medical assistance needed") -> str:
+async def emergency_call_tool(emergency_message: str = "Emergency medical assistance needed") -> str:
     """
     Initiate an emergency call when a user is experiencing a medical emergency.
     Use this tool immediately when detecting emergency situations, severe symptoms,
     or when a user explicitly requests emergency assistance.
     """
-    print(f"🚨 [EMERGENCY TOOL] ACTIVATED! Message: {emergency_message[:100]}...")
+    logger.warning("[EMERGENCY TOOL] ACTIVATED! Message: %.100r", emergency_message)
     try:
-        print(f"📞 [TWILIO] Initiating emergency call...")
-        result = run_async_in_sync(call_emergency(emergency_message))
-        return result
+        logger.info("[TWILIO] Initiating emergency call...")
+        # Queued, retried and deduplicated per session by the dispatcher, sharing the emergency lane's call
+        handle = emergency_dispatcher.dispatch(emergency_message, session_key=current_session_id.get())
+        if handle.status == "failed":
+            return f"{handle.error} If this is a life-threatening emergency, please call 108 immediately."
+        return f"Emergency call is being placed (call ID: {handle.id}). If this is a life-threatening emergency, please call 108 immediately."
     except Exception as e:
-        print(f"❌ [EMERGENCY] Call failed: {str(e)}")
+        logger.error("[EMERGENCY] Call failed: %s", e)
         return f"Emergency services contacted. If this is a life-threatening emergency, please call 108 immediately. Error: {str(e)}"
 
 
-@tool
-def find_nearby_specialists_by_location(location: str) -> str:
+async def find_nearby_specialists_by_location(location: str, specialty: str = "") -> str:
     """
-    Finds and returns a list of licensed medical specialists near the specified location.
+    Finds and returns a list of licensed medical specialists near the specified location (a city, postcode
+    or "lat, lon"), nearest first. Optionally pass a specialty such as "cardiology" or "dermatologist".
     """
-    print(f"🗺️ [SPECIALIST FINDER] Searching for doctors in: {location}")
+    logger.info("[SPECIALIST FINDER] Searching for %s doctors in: %s", specialty or "any", location)
+    with span("specialist_search"):
+        result = specialist_directory.search(location, specialty)
+    if result is not None:
+        return result
+    # Without a provider directory (see SPECIALIST_DIRECTORY_PATH) the generic list is all there is
     result = (
         f"Here are some medical specialists near {location}:\n"
         "- Dr. Sarah Johnson (Internal Medicine) - +1 (555) 123-4567\n"
@@ -74,64 +75,65 @@ def find_nearby_specialists_by_location(location: str) -> str:
     return result
 
 
-@tool
-def analyze_medical_image(image_description: str) -> str:
+async def analyze_medical_image(image_description: str) -> str:
     """
     Analyze medical images, scans, X-rays, or other visual medical content.
     Use this when a user uploads or describes a medical image they want analyzed.
     """
-    print(f"🖼️ [IMAGE ANALYSIS] Processing medical image: {image_description[:100]}...")
+    logger.info("[IMAGE ANALYSIS] Processing medical image: %.100r", image_description)
     try:
-        print(f"👁️ [LLAVA] Analyzing image with LLaVA vision model...")
-        # Get the current image data if available
-        temp_dir = "agentic_ai_images"
-        image_data = None
-        if os.path.exists(temp_dir):
-            print(f"🗂️ [IMAGE DATA] Found existing directory: {temp_dir}")
-            image_path = os.path.join(temp_dir, "uploaded_image.bin")
-            if os.path.exists(image_path):
-                with open(image_path, "rb") as f:
-                    image_data = f.read()
+        logger.debug("[LLAVA] Analyzing image with LLaVA vision model...")
+        # Get the image uploaded with the current request, if any
+        request_id = current_request_id.get()
+        image_data = image_store.get_all(request_id) if request_id else None
         if image_data:
-            print(f"✅ [IMAGE DATA] Found image data: {len(image_data)} bytes")
-            result = run_async_in_sync(query_llava_vision(
+            logger.debug("[IMAGE DATA] Found %d image(s): %d bytes", len(image_data), sum(len(image) for image in image_data))
+            result = await query_llava_vision(
                 f"Please analyze this medical prescription image and list all the medicines, dosages, and instructions you can see: {image_description}",
                 image_data
-            ))
+            )
         else:
-            print(f"⚠️ [IMAGE DATA] No image data available, using text-only analysis")
-            result = run_async_in_sync(query_llava_vision(
+            logger.warning("[IMAGE DATA] No image data available, using text-only analysis")
+            result = await query_llava_vision(
                 f"Please provide general information about medical image analysis: {image_description}",
                 None
-            ))
+            )
         
-        print(f"✅ [IMAGE ANALYSIS] Analysis completed: {len(result)} characters")
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        logger.info("[IMAGE ANALYSIS] Analysis completed: %d characters", len(result))
         return result
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"❌ [IMAGE ANALYSIS] Error: {str(e)}")
+        logger.error("[IMAGE ANALYSIS] Error: %s", e)
         return f"I'm unable to analyze the medical image at this time. Please consult with a healthcare professional or radiologist for proper image interpretation. Error: {str(e)}"
 
 
-@tool
-def get_medication_information(medication_name: str) -> str:
+async def get_medication_information(medication_name: str) -> str:
     """
     Provide information about medications including side effects, interactions, and usage.
     Use this when users ask about specific medications, drugs, or treatments.
     """
-    print(f"💊 [MEDICATION INFO] Looking up drug: {medication_name}")
+    logger.info("[MEDICATION INFO] Looking up drug: %s", medication_name)
+    note = "\n\n⚠️ Important: Always consult your healthcare provider or pharmacist before starting, stopping, or changing any medication."
+    # Answer from the local monograph index when it knows the drug; MedGemma only covers the misses
+    with span("medication_index"):
+        match = medication_index.lookup(medication_name)
+    if match is not None:
+        logger.info("[MEDICATION INFO] Index %s match: %s", match.method, match.monograph.name)
+        return match.render(medication_name) + note
     try:
-        query = f"Please provide information about {medication_name} including common side effects, usage, and important warnings."
-        result = run_async_in_sync(query_medgemma(query))
-        return result + "\n\n⚠️ Important: Always consult your healthcare provider or pharmacist before starting, stopping, or changing any medication."
+        drug_name = normalize_drug_name(medication_name)
+        query = f"Please provide information about {drug_name} including common side effects, usage, and important warnings."
+        result = await query_medgemma(query, cache_key=f"medication:v{MEDICATION_PROMPT_VERSION}:{drug_name}")
+        return result + note
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"❌ [MEDICATION INFO] Error: {str(e)}")
+        logger.error("[MEDICATION INFO] Error: %s", e)
         return f"I'm unable to provide medication information at this time. Please consult your pharmacist or healthcare provider for accurate medication information. Error: {str(e)}"
 
 
-@tool
-def schedule_appointment_helper(appointment_type: str) -> str:
+async def schedule_appointment_helper(appointment_type: str) -> str:
     """
     Provide guidance on scheduling medical appointments.
     Use this when users need help with appointment scheduling or finding healthcare services.
@@ -142,7 +144,7 @@ def schedule_appointment_helper(appointment_type: str) -> str:
     Returns:
         str: Guidance on scheduling appointments
     """
-    print(f"📅 [APPOINTMENT HELPER] Providing guidance for: {appointment_type}")
+    logger.info("[APPOINTMENT HELPER] Providing guidance for: %s", appointment_type)
 
     result = f"""To schedule a routine appointment with your doctor, follow these steps:
 
@@ -161,5 +163,60 @@ def schedule_appointment_helper(appointment_type: str) -> str:
     return result
 
 
+# Tools whose output the agent may return as the final answer, skipping its last LLM call, when the
+# output is at least min_chars long and contains none of the error markers (AGENT_RETURN_DIRECT).
+# Image analysis and open specialist questions always get a final LLM pass to put them in context.
+RETURN_DIRECT_RULES = {
+    "get_medication_information": {"min_chars": 300},
+    "find_nearby_specialists_by_location": {"min_chars": 80},
+    "schedule_appointment_helper": {"min_chars": 80},
+}
+
+# Tool of the single-intent lookup the router found in the current question, set per request by agents.py;
+# only that tool's output can end the agent run. Confident lookups never reach the agent (router fast path),
+# so this saves the final LLM call only for lookups the router routed below its confidence threshold
+return_direct_tool: ContextVar = ContextVar("return_direct_tool", default=None)
+
+ERROR_MARKERS = (
+    "error connecting",
+    "error processing",
+    "unable to process",
+    "i'm unable to",
+    "having trouble accessing",
+    "no image data provided",
+    "please try again later",
+)
+
+
+def is_final_output(tool_name: str, output: str) -> bool:
+    """
+    Whether a tool's output answers the routed lookup, meets its return-direct rule and can be shown to the user as is
+    """
+    rule = RETURN_DIRECT_RULES.get(tool_name)
+    if rule is None or tool_name != return_direct_tool.get():
+        return False
+    text = str(output).strip()
+    if len(text) < rule["min_chars"]:
+        return False
+    lowered = text.lower()
+    return not any(marker in lowered for marker in rule.get("error_markers", ERROR_MARKERS))
+
+
+# Plain coroutines, so the router's fast path can call them without LangChain loaded
+TOOL_FUNCTIONS = [
+    ask_medical_specialist,
+    emergency_call_tool,
+    find_nearby_specialists_by_location,
+    analyze_medical_image,
+    get_medication_information,
+    schedule_appointment_helper
+]
+
+
+def build_tools() -> list:
+    """
+    Wrap the tool functions as LangChain tools for the agent (imports LangChain on first call)
+    """
+    from langchain_core.tools import tool
 
-
+    return [tool(function) for function in TOOL_FUNCTIONS]
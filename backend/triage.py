@@ -0,0 +1,173 @@
+import re
+import time
+
+# Phrase -> weight. Weights >= 0.9 are life-threatening when reported in the present (see assess_emergency).
+EMERGENCY_PHRASES = {
+    "chest pain": 1.0,
+    "chest pains": 1.0,
+    "chest tightness": 0.9,
+    "heart attack": 1.0,
+    "having a stroke": 1.0,
+    # A bare mention is often history ("my father had a stroke in 2019"); stroke symptoms below still escalate
+    "stroke": 0.7,
+    "can't breathe": 1.0,
+    "cant breathe": 1.0,
+    "cannot breathe": 1.0,
+    "unable to breathe": 1.0,
+    "not breathing": 1.0,
+    "isn't breathing": 1.0,
+    "isnt breathing": 1.0,
+    "stopped breathing": 1.0,
+    "choking": 1.0,
+    "unconscious": 1.0,
+    "unresponsive": 1.0,
+    "not responding": 0.9,
+    "passed out": 0.9,
+    "collapsed": 0.9,
+    "seizure": 0.9,
+    "seizures": 0.9,
+    "severe bleeding": 1.0,
+    "bleeding heavily": 1.0,
+    "won't stop bleeding": 1.0,
+    "wont stop bleeding": 1.0,
+    "coughing up blood": 0.9,
+    "vomiting blood": 0.9,
+    "overdose": 1.0,
+    "overdosed": 1.0,
+    "suicidal": 1.0,
+    "kill myself": 1.0,
+    "end my life": 1.0,
+    "anaphylaxis": 1.0,
+    "throat is closing": 1.0,
+    "throat closing": 1.0,
+    "face drooping": 1.0,
+    "slurred speech": 0.9,
+    "difficulty breathing": 0.8,
+    "trouble breathing": 0.8,
+    "shortness of breath": 0.7,
+    "short of breath": 0.7,
+    "severe allergic reaction": 0.9,
+    "poisoning": 0.8,
+    "poisoned": 0.8,
+    "fainted": 0.7,
+    "head injury": 0.7,
+    "call an ambulance": 1.0,
+    "need an ambulance": 1.0,
+    "medical emergency": 0.8,
+    "this is an emergency": 0.8,
+    "ambulance": 0.7,
+    "severe pain": 0.6,
+    "bleeding": 0.5,
+    "emergency": 0.4,
+    "urgent": 0.3,
+    "severe": 0.3,
+    "critical": 0.3,
+}
+
+_NEGATION = re.compile(
+    r"\b(?:no|not|never|without|denies|deny|denied|don't have|dont have|doesn't have|doesnt have|"
+    r"isn't|isnt|wasn't|wasnt|no longer|free of|no sign of|no signs of)\b[^.!?;,]{0,25}$",
+    re.IGNORECASE
+)
+_INFORMATIONAL = re.compile(
+    r"\b(?:what (?:is|are|causes)|symptoms of|signs of|how to prevent|prevent(?:ing)?|risk of|"
+    r"difference between|history of|learn about|tell me about|side effects? of|causes?|caused by|"
+    r"what could|why (?:do|does|did|would))\b"
+    # Questions about a condition rather than reports of it: "Can anxiety cause chest pain?"
+    r"|^\s*(?:can|could|does|do|is|are|will|would|should|which|how)\b",
+    re.IGNORECASE
+)
+_PAST = re.compile(
+    r"\b(?:had|used to|once|previously|years? ago|months? ago|weeks? ago|last (?:week|month|year|night|time)|"
+    r"in (?:19|20)\d\d)\b",
+    re.IGNORECASE
+)
+_OTHER_PERSON = re.compile(
+    r"\bmy (?:father|mother|dad|mom|mum|parents?|grand\w+|brother|sister|son|daughter|child|kids?|baby|"
+    r"wife|husband|partner|friend|uncle|aunt|cousin|neighbou?r|colleague)\b|\b(?:he|she|they|someone|somebody)\b",
+    re.IGNORECASE
+)
+_NOT_SERIOUS = re.compile(r"\b(?:lol|lmao|haha\w*|jk|just kidding|joking)\b", re.IGNORECASE)
+# Happening now, to whoever it is: overrides the past-tense and other-person discounts
+_NOW = re.compile(
+    r"\b(?:right now|just now|now|currently|at the moment|is having|are having|is not|isn't|isnt|is unconscious|"
+    r"is unresponsive|has collapsed|just collapsed|keeps?|won't stop|help)\b",
+    re.IGNORECASE
+)
+# The writer describing themselves in the present: "I'm having chest pain", "my chest hurts"
+_FIRST_PERSON_PRESENT = re.compile(
+    r"\b(?:i'm|im|i am|i have|i've|ive|i can't|i cant|i cannot|i feel|i think|i need|i want|i keep|"
+    r"i (?:just )?(?:took|swallowed|overdosed)|"
+    r"my (?:chest|heart|throat|head|arm|face|breathing|speech))\b",
+    re.IGNORECASE
+)
+# Phrases that are a present, first-person report by themselves
+_SELF_REPORTS = {
+    "can't breathe", "cant breathe", "cannot breathe", "unable to breathe", "kill myself", "end my life",
+    "call an ambulance", "need an ambulance", "this is an emergency", "throat is closing",
+}
+# One precompiled alternation, longest phrases first so "severe bleeding" wins over "bleeding"
+_MATCHER = re.compile(
+    r"\b(?:" + "|".join(re.escape(phrase) for phrase in sorted(EMERGENCY_PHRASES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+
+SEVERITY_LEVELS = ("none", "moderate", "high", "critical")
+
+
+def _severity(score: float) -> str:
+    if score >= 0.9:
+        return "critical"
+    if score >= 0.7:
+        return "high"
+    if score >= 0.4:
+        return "moderate"
+    return "none"
+
+
+def assess_emergency(text: str) -> dict:
+    """
+    Score a message for medical emergencies before any LLM call.
+
+    Phrases are matched on word boundaries; a phrase preceded by a negation in the same clause
+    ("no chest pain") is ignored. Questions and informational phrasing ("can anxiety cause chest
+    pain?"), past events ("I had chest pain last week") and joking halve the score, and mentions of
+    someone else are discounted, unless the message says it is happening now. Critical (which
+    dispatches a call) also needs a present report: first person, or something happening right now.
+
+    Returns:
+        dict: severity ("none", "moderate", "high", "critical"), score (0-1), matched phrases,
+              has_emergency (severity high or critical) and detection time in microseconds
+    """
+    start = time.perf_counter()
+    matches = []
+    for match in _MATCHER.finditer(text):
+        if _NEGATION.search(text, max(0, match.start() - 40), match.start()):
+            continue
+        matches.append(match.group(0).lower())
+    weights = sorted((EMERGENCY_PHRASES[phrase] for phrase in matches), reverse=True)
+    score = 0.0
+    if weights:
+        # Strongest signal plus a small boost for each corroborating one
+        score = min(1.0, weights[0] + 0.1 * (len(weights) - 1))
+        now = _NOW.search(text)
+        if _INFORMATIONAL.search(text):
+            score *= 0.5
+        elif _PAST.search(text) and not now:
+            score *= 0.5
+        if _NOT_SERIOUS.search(text):
+            score *= 0.5
+        if _OTHER_PERSON.search(text) and not now:
+            score *= 0.8
+        if score >= 0.9 and not (now or _FIRST_PERSON_PRESENT.search(text) or _SELF_REPORTS.intersection(matches)):
+            # A bare "chest pain" is flagged high, but only a present report dials the emergency contact
+            score = 0.85
+    severity = _severity(score)
+    return {
+        "severity": severity,
+        "score": round(score, 3),
+        "matches": matches,
+        "has_emergency": severity in ("high", "critical"),
+        "detection_us": round((time.perf_counter() - start) * 1e6, 1),
+    }
@@ -1,156 +1,483 @@
 import os
+import re
+import json
+import asyncio
 import httpx
 import base64
-from twilio.rest import Client
-from openai import OpenAI
+import hashlib
+import contextvars
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, AsyncIterator, Callable, List, Optional, Tuple, Union
+from config import MEDGEMMA_PROMPT_VERSION
+from cache import medgemma_cache, make_cache_key, normalize_text
+from scheduler import scheduler, Overloaded
+from observability import get_logger, span, record_span, metrics
 
-async def query_medgemma(query: str) -> str:
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = get_logger(__name__)
+
+# Pooled Ollama clients keyed by base URL, owned by the FastAPI lifespan
+_ollama_clients = {}
+
+# Shared AsyncOpenAI client, created on first use and closed by the FastAPI lifespan
+_openai_client = None
+
+# Callback receiving model tokens for the request currently being streamed, if any
+token_sink: ContextVar = ContextVar("token_sink", default=None)
+
+
+def _ollama_base_url(base_url: str = None) -> str:
+    return (base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")).rstrip("/")
+
+
+def _ollama_timeout(endpoint: str) -> httpx.Timeout:
+    """
+    Build the timeout for an Ollama endpoint ("text" or "vision")
+    """
+    defaults = {"text": "60", "vision": "120"}
+    read_timeout = float(os.getenv(f"OLLAMA_{endpoint.upper()}_TIMEOUT", defaults.get(endpoint, "60")))
+    connect_timeout = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+def ollama_keep_alive():
+    """
+    How long Ollama keeps a model loaded after a call (OLLAMA_KEEP_ALIVE: a duration such as "30m",
+    seconds, or -1 to keep it loaded indefinitely)
+    """
+    value = os.getenv("OLLAMA_KEEP_ALIVE", "30m").strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def get_ollama_client(base_url: str = None) -> httpx.AsyncClient:
+    """
+    Return the shared pooled client for an Ollama base URL, creating it on first use
+    """
+    base_url = _ollama_base_url(base_url)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    entry = _ollama_clients.get(base_url)
+    # A pooled connection is bound to the loop that opened it
+    if entry is None or entry[0].is_closed or entry[1] is not loop:
+        limits = httpx.Limits(
+            max_connections=int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("OLLAMA_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry=float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "30")),
+        )
+        client = httpx.AsyncClient(base_url=base_url, limits=limits, timeout=_ollama_timeout("text"))
+        entry = (client, loop)
+        _ollama_clients[base_url] = entry
+    return entry[0]
+
+
+async def init_ollama_clients():
+    """
+    Create the pooled Ollama client on the server event loop (called from the app lifespan)
+    """
+    get_ollama_client()
+    logger.info("[OLLAMA] Connection pool ready for %s", _ollama_base_url())
+
+
+async def close_ollama_clients():
+    """
+    Close every pooled Ollama client (called from the app lifespan)
+    """
+    entries = list(_ollama_clients.values())
+    _ollama_clients.clear()
+    for client, _ in entries:
+        await client.aclose()
+
+
+class _Flight:
+    """One upstream call shared by every concurrent caller with the same key"""
+    __slots__ = ("task", "waiters", "tokens", "sinks")
+
+    def __init__(self):
+        self.task = None
+        self.waiters = 0
+        self.tokens = []
+        self.sinks = []
+
+    def broadcast(self, token: str) -> None:
+        self.tokens.append(token)
+        for sink in self.sinks:
+            sink(token)
+
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight calls: the first caller starts the upstream call and later callers
+    with the same key await the same result instead of taking another backend slot.
+
+    Cancelling one caller never cancels the call for the others; the upstream call is only cancelled
+    once every caller waiting on it has gone. Streamed tokens are fanned out to every caller's token
+    sink, replaying what was already generated to callers that join late.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key: str, factory: Callable):
+        sink = token_sink.get()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            context = contextvars.copy_context()
+            if sink is not None:
+                # Tokens of the shared call go to every subscribed caller, not just the leader
+                context.run(token_sink.set, flight.broadcast)
+            flight.task = asyncio.get_running_loop().create_task(factory(), context=context)
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            self._flights[key] = flight
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+            for token in flight.tokens:
+                if sink is not None:
+                    sink(token)
+        if sink is not None:
+            flight.sinks.append(sink)
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if sink is not None:
+                flight.sinks.remove(sink)
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                # Until its done callback runs, a new caller would join the cancelled task
+                self._forget(key, flight)
+                self.cancelled += 1
+        if sink is not None and not flight.tokens and result[1]:
+            # The shared call ran without streaming, hand this caller the whole text at once
+            sink(result[1])
+        return result
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+        }
+
+
+ollama_flights = SingleFlight()
+
+metrics.register_callback(
+    "ollama_coalesced_calls_total", "Ollama calls served by an identical in-flight call", "counter", (),
+    lambda: [((), ollama_flights.coalesced)]
+)
+
+
+def _flight_key(payload: dict) -> str:
+    digest = hashlib.sha256()
+    digest.update(payload["model"].encode("utf-8") + b"\0" + payload["prompt"].encode("utf-8"))
+    for image in payload.get("images") or []:
+        digest.update(b"\0" + hashlib.sha256(image.encode("ascii")).digest())
+    return digest.hexdigest()
+
+
+async def _ollama_generate(payload: dict, endpoint: str) -> Tuple[int, Optional[str]]:
+    """
+    Call Ollama's /api/generate and return (status code, generated text).
+    When a token sink is active the NDJSON stream is consumed and each token is forwarded as it arrives.
+    Identical concurrent calls (same model, prompt and images) share one upstream request, which
+    waits for an ollama_text/ollama_vision slot first, raising Overloaded when the backend is saturated.
+    """
+    async def generate():
+        async with scheduler.slot(f"ollama_{endpoint}"):
+            with span("ollama_call", payload["model"]):
+                return await _ollama_generate_unscheduled(payload, endpoint)
+
+    return await ollama_flights.do(_flight_key(payload), generate)
+
+
+OLLAMA_LOAD_SECONDS = metrics.histogram(
+    "ollama_load_seconds", "Model load time reported by Ollama for each generate call", ("model",)
+)
+OLLAMA_INFERENCE_SECONDS = metrics.histogram(
+    "ollama_inference_seconds", "Ollama generate time excluding model load", ("model",)
+)
+
+
+def _record_ollama_durations(model: str, body: dict) -> None:
     """
-    Query MedGemma model via Ollama for medical analysis
+    Split Ollama's reported total_duration into model load and inference time
+    """
+    load, total = body.get("load_duration"), body.get("total_duration")
+    if load is None or total is None:
+        return
+    load_seconds = load / 1e9
+    OLLAMA_LOAD_SECONDS.observe(load_seconds, model=model)
+    OLLAMA_INFERENCE_SECONDS.observe(max(0.0, (total - load) / 1e9), model=model)
+    if load_seconds >= float(os.getenv("OLLAMA_COLD_LOAD_SECONDS", "1.0")):
+        record_span("ollama_cold_load", load_seconds, model)
+        logger.warning("[OLLAMA] %s was not loaded, the call waited %.1fs for the model to load", model, load_seconds)
+
+
+async def _ollama_generate_unscheduled(payload: dict, endpoint: str) -> Tuple[int, Optional[str]]:
+    client = get_ollama_client()
+    sink = token_sink.get()
+    if sink is None:
+        response = await client.post(
+            "/api/generate",
+            json={**payload, "stream": False, "keep_alive": ollama_keep_alive()},
+            timeout=_ollama_timeout(endpoint)
+        )
+        if response.status_code != 200:
+            return response.status_code, None
+        body = response.json()
+        _record_ollama_durations(payload["model"], body)
+        return 200, body.get("response")
+
+    chunks = []
+    async with client.stream(
+        "POST",
+        "/api/generate",
+        json={**payload, "stream": True, "keep_alive": ollama_keep_alive()},
+        timeout=_ollama_timeout(endpoint)
+    ) as response:
+        if response.status_code != 200:
+            return response.status_code, None
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            token = chunk.get("response", "")
+            if token:
+                chunks.append(token)
+                sink(token)
+            if chunk.get("done"):
+                _record_ollama_durations(payload["model"], chunk)
+                break
+    return 200, "".join(chunks)
+
+
+async def query_medgemma(query: str, cache_key: str = None) -> str:
+    """
+    Query MedGemma model via Ollama for medical analysis.
+    Successful answers are cached under the model, prompt version and normalized query
+    (or the caller's normalized cache_key when given). Only answers with a cache_key, such as
+    medication lookups, are persisted; free-text questions can carry the user's health details
+    and stay in memory.
     """
     try:
-        base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         medgemma_model = os.getenv("MEDGEMMA_MODEL", "gemma:7b")
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            payload = {
-                "model": medgemma_model,
-                "prompt": f"As a medical AI assistant, please analyze the following query and provide helpful medical information. Remember to always recommend consulting with healthcare professionals for proper diagnosis and treatment.\n\nQuery: {query}",
-                "stream": False
-            }
-            
-            response = await client.post(
-                f"{base_url}/api/generate",
-                json=payload
-            )
+        key = make_cache_key(medgemma_model, MEDGEMMA_PROMPT_VERSION, cache_key or normalize_text(query))
+        persist = cache_key is not None
+        cached = await medgemma_cache.aget(key, persist=persist)
+        if cached is not None:
+            logger.info("[CACHE] MedGemma cache hit")
+            sink = token_sink.get()
+            if sink is not None:
+                sink(cached)
+            return cached
+        
+        payload = {
+            "model": medgemma_model,
+            "prompt": f"As a medical AI assistant, please analyze the following query and provide helpful medical information. Remember to always recommend consulting with healthcare professionals for proper diagnosis and treatment.\n\nQuery: {query}"
+        }
+        
+        status_code, text = await _ollama_generate(payload, "text")
+        
+        if status_code == 200 and text:
+            await medgemma_cache.aset(key, text, persist=persist)
+            return text
+        elif status_code == 200:
+            return "Unable to process medical query."
+        else:
+            return f"Error connecting to MedGemma service (Status: {status_code}). Please try again later."
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "Unable to process medical query.")
-            else:
-                return f"Error connecting to MedGemma service (Status: {response.status_code}). Please try again later."
-                
+    except Overloaded:
+        raise
     except Exception as e:
         return f"Error connecting to MedGemma: {str(e)}. Please consult a healthcare professional."
 
 
-async def query_llava_vision(query: str, image_data: bytes = None) -> str:
+async def query_llava_vision(query: str, image_data: Union[bytes, List[bytes]] = None) -> str:
     """
-    Query LLaVA model for image analysis
+    Query LLaVA model for image analysis.
+    image_data is one image or a list of images (e.g. tiles of a tall document).
     """
     try:
-        base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         llava_model = os.getenv("LLAVA_MODEL", "llava:7b")
         
         if image_data is None:
             return "No image data provided for analysis. Please upload an image and try again."
         
-        # Convert image to base64
-        image_b64 = base64.b64encode(image_data).decode('utf-8')
+        # Convert images to base64, the only encode between upload and Ollama
+        images = image_data if isinstance(image_data, list) else [image_data]
+        images_b64 = [base64.b64encode(image).decode('utf-8') for image in images]
         
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            payload = {
-                "model": llava_model,
-                "prompt": f"""As a medical AI assistant analyzing a medical prescription or medical image, please:
-
-                1. Carefully examine the image and describe what you see in detail
-                2. If this is a prescription, list all medicines, dosages, frequency, and instructions you can identify
-                3. If this is a medical scan/report, describe the findings and any notable features
-                4. Provide clear, organized information about what is visible in the image
-                5. Always emphasize that this is for informational purposes only
-                6. Recommend consulting healthcare professionals for proper medical advice
-
-                User's question: {query}
-
-                Please provide a comprehensive analysis of what you can see in this medical image.""",
-                "images": [image_b64],
-                "stream": False
-            }
-            
-            response = await client.post(
-                f"{base_url}/api/generate",
-                json=payload
-            )
+        payload = {
+            "model": llava_model,
+            "prompt": f"""As a medical AI assistant analyzing a medical prescription or medical image, please:
+
+            1. Carefully examine the image and describe what you see in detail
+            2. If this is a prescription, list all medicines, dosages, frequency, and instructions you can identify
+            3. If this is a medical scan/report, describe the findings and any notable features
+            4. Provide clear, organized information about what is visible in the image
+            5. Always emphasize that this is for informational purposes only
+            6. Recommend consulting healthcare professionals for proper medical advice
+
+            User's question: {query}
+
+            Please provide a comprehensive analysis of what you can see in this medical image.""",
+            "images": images_b64
+        }
+        
+        status_code, text = await _ollama_generate(payload, "vision")
+        
+        if status_code == 200:
+            return text or "Unable to process medical image."
+        else:
+            return f"Error connecting to LLaVA vision service (Status: {status_code}). Please try again later."
             
-            if response.status_code == 200:
-                result = response.json()
-                return result.get("response", "Unable to process medical image.")
-            else:
-                return f"Error connecting to LLaVA vision service (Status: {response.status_code}). Please try again later."
-                
+    except Overloaded:
+        raise
     except Exception as e:
         return f"Error processing medical image: {str(e)}. Please consult a healthcare professional for proper image analysis."
 
 
-def call_emergency(message: str = "Emergency medical assistance needed. Please call back immediately.") -> str:
+def init_openai_client() -> "AsyncOpenAI":
     """
-    Make emergency call using Twilio
+    Create the shared AsyncOpenAI client (on first Whisper/TTS call; the openai package is imported here)
     """
-    try:
-        account_sid = os.getenv("TWILIO_ACCOUNT_SID")
-        auth_token = os.getenv("TWILIO_AUTH_TOKEN")
-        from_number = os.getenv("TWILIO_FROM_NUMBER")
-        to_number = os.getenv("EMERGENCY_CONTACT")
-        
-        if not all([account_sid, auth_token, from_number, to_number]):
-            return "Emergency call configuration missing. Please contact emergency services directly."
-        
-        client = Client(account_sid, auth_token)
-        
-        twiml_message = f"""
-        <Response>
-            <Say voice="alice">
-                {message}
-            </Say>
-            <Say voice="alice">
-                This is an automated emergency call from the AI Medical Consulting system. 
-                Please contact the user immediately for medical assistance.
-            </Say>
-        </Response>
-        """
-        
-        call = client.calls.create(
-            twiml=twiml_message,
-            to=to_number,
-            from_=from_number
-        )
-        return f"Emergency call initiated successfully. Call SID: {call.sid}"
-        
-    except Exception as e:
-        return f"Failed to make emergency call: {str(e)}. Please contact emergency services directly."
+    global _openai_client
+    from openai import AsyncOpenAI
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("OPENAI_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10")),
+    )
+    timeout = httpx.Timeout(float(os.getenv("OPENAI_TIMEOUT", "60")), connect=float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5")))
+    _openai_client = AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # Point at a local stand-in for tests and benchmarks
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+    )
+    return _openai_client
+
+
+def get_openai_client() -> "AsyncOpenAI":
+    return _openai_client or init_openai_client()
 
 
-def transcribe_audio_whisper(audio_bytes: bytes) -> str:
+async def close_openai_client():
+    """
+    Close the shared AsyncOpenAI client (called from the app lifespan)
+    """
+    global _openai_client
+    client = _openai_client
+    _openai_client = None
+    if client is not None:
+        await client.close()
+
+
+async def transcribe_audio_whisper(audio_bytes: bytes) -> str:
     """
     Transcribe audio using OpenAI Whisper
     """
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        # Create file-like object
-        import io
-        audio_file = io.BytesIO(audio_bytes)
-        audio_file.name = "audio.wav"
-        transcript = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file
-        )
+        client = get_openai_client()
+        async with scheduler.slot("whisper"):
+            with span("openai_call", "whisper"):
+                transcript = await client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=("audio.wav", audio_bytes)
+                )
         return transcript.text
         
+    except Overloaded:
+        raise
     except Exception as e:
         return f"Error transcribing audio: {str(e)}"
 
 
-def generate_speech_tts(text: str) -> bytes:
+async def generate_speech_tts(text: str, voice: str = "nova", model: str = "tts-1", audio_format: str = "mp3") -> bytes:
     """
     Generate speech using OpenAI TTS
     """
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=text
-        )
+        client = get_openai_client()
+        async with scheduler.slot("tts"):
+            with span("openai_call", "tts"):
+                response = await client.audio.speech.create(
+                    model=model,
+                    voice=voice,
+                    input=text,
+                    response_format=audio_format
+                )
         return response.content
         
+    except Overloaded:
+        raise
     except Exception as e:
         raise Exception(f"Error generating speech: {str(e)}")
+
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def split_sentences(text: str, min_chars: int = 40, max_chars: int = 400) -> List[str]:
+    """
+    Split text into sentence-sized chunks for speech synthesis.
+    Short fragments are merged into the next sentence and overly long ones are cut at a word boundary.
+    """
+    chunks = []
+    pending = ""
+    for sentence in _SENTENCE_BOUNDARY.split(text):
+        sentence = " ".join(sentence.split())
+        if not sentence:
+            continue
+        pending = f"{pending} {sentence}".strip()
+        while len(pending) > max_chars:
+            cut = pending.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            chunks.append(pending[:cut])
+            pending = pending[cut:].strip()
+        if len(pending) >= min_chars:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        chunks.append(pending)
+    return chunks
+
+
+async def stream_speech_chunks(text: str, synthesize: Callable = generate_speech_tts, max_concurrency: int = 3) -> AsyncIterator[bytes]:
+    """
+    Synthesize text sentence by sentence with bounded parallelism, yielding the audio chunks in order.
+    `synthesize` takes one sentence and returns audio bytes; it may be sync (run in a thread) or async.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def synthesize_chunk(sentence: str) -> bytes:
+        async with semaphore:
+            if asyncio.iscoroutinefunction(synthesize):
+                return await synthesize(sentence)
+            return await asyncio.to_thread(synthesize, sentence)
+
+    tasks = [asyncio.create_task(synthesize_chunk(sentence)) for sentence in split_sentences(text)]
+    try:
+        for task in tasks:
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
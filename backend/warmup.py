@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+from typing import Optional
+from dotenv import load_dotenv
+from utils import get_ollama_client, ollama_keep_alive
+from scheduler import scheduler, Overloaded, PRIORITY_NORMAL
+from observability import get_logger, metrics
+
+load_dotenv()
+logger = get_logger(__name__)
+
+
+def _canonical(model: str) -> str:
+    # Ollama lists untagged models with their implicit ":latest" tag
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelWarmer:
+    """
+    Keeps the Ollama models the backend uses loaded, so user requests never pay the model load.
+
+    On startup every model is preloaded (an empty generate call, which only loads the model) with
+    OLLAMA_KEEP_ALIVE. A background loop then checks /api/ps every interval seconds and pings each
+    model again, reloading models Ollama has unloaded and extending the keep-alive of the others.
+    Pings wait for a slot of the model's scheduler backend (ollama_text or ollama_vision) like user calls.
+    The service is ready once every model is resident.
+
+    When Ollama cannot hold every model (a model is unloaded again right after the others load), only
+    the first (text) model is kept warm for backoff seconds instead of swapping the models back and forth;
+    the others load on demand.
+    """
+
+    def __init__(self, models: dict, interval: float = 60.0, load_timeout: float = 300.0, backoff: float = 1800.0, enabled: bool = True):
+        self.models = list(models)
+        self.backends = dict(models)  # model -> scheduler backend its pings wait for
+        self.interval = interval
+        self.load_timeout = load_timeout
+        self.backoff = backoff
+        self.enabled = enabled
+        self.contended_until = 0.0  # warm only the first model until then
+        self.resident = {model: False for model in self.models}
+        self.last_load = {}  # model -> {"seconds", "at"} of its latest cold load
+        self.cold_loads = 0
+        self.failures = 0
+        self.last_check = None
+        self._task = None
+
+    @classmethod
+    def from_env(cls) -> "ModelWarmer":
+        models = {os.getenv("MEDGEMMA_MODEL", "gemma:7b"): "ollama_text"}
+        models.setdefault(os.getenv("LLAVA_MODEL", "llava:7b"), "ollama_vision")
+        return cls(
+            models=models,
+            interval=float(os.getenv("OLLAMA_WARMUP_INTERVAL", "60")),
+            load_timeout=float(os.getenv("OLLAMA_LOAD_TIMEOUT", "300")),
+            backoff=float(os.getenv("OLLAMA_WARMUP_BACKOFF", "1800")),
+            enabled=os.getenv("OLLAMA_PRELOAD", "true").lower() == "true",
+        )
+
+    @property
+    def contended(self) -> bool:
+        return time.time() < self.contended_until
+
+    def _warm_models(self) -> list:
+        return self.models[:1] if self.contended else self.models
+
+    @property
+    def ready(self) -> bool:
+        # Without preloading there is nothing to wait for
+        return not self.enabled or all(self.resident[model] for model in self._warm_models())
+
+    def start(self) -> None:
+        """
+        Start preloading and the warm-up loop on the running event loop (idempotent)
+        """
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task = self._task
+        self._task = None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            loaded = await self.check()
+            if loaded and not self.interval:
+                return
+            # Retry sooner while Ollama is unreachable or a model fails to load
+            await asyncio.sleep(self.interval if loaded else min(self.interval or 5.0, 5.0))
+
+    async def check(self) -> bool:
+        """
+        Load or refresh every model, then record which ones Ollama reports as resident.
+        Returns False when a model could not be loaded or was unloaded again.
+        """
+        models = self._warm_models()
+        evicted = []
+        loaded = await self._loaded_models()
+        results = [await self._ping(model, cold=loaded is not None and _canonical(model) not in loaded) for model in models]
+        loaded = await self._loaded_models()
+        if loaded is not None:
+            for model in self.models:
+                self.resident[model] = _canonical(model) in loaded
+            evicted = [model for model, ok in zip(models, results) if ok and not self.resident[model]]
+            if evicted and len(models) > 1:
+                # Loaded but already unloaded again, e.g. OLLAMA_MAX_LOADED_MODELS is lower than the models used;
+                # pinging them all again would only keep swapping them
+                self.contended_until = time.time() + self.backoff
+                logger.warning("[WARMUP] %s not resident after loading; keeping only %s warm for %.0fs",
+                               ", ".join(evicted), models[0], self.backoff)
+            elif evicted:
+                logger.warning("[WARMUP] %s is not resident after loading it", evicted[0])
+        self.last_check = time.time()
+        return all(results) and not evicted
+
+    async def _loaded_models(self) -> Optional[set]:
+        try:
+            response = await get_ollama_client().get("/api/ps")
+            response.raise_for_status()
+            return {_canonical(entry.get("name") or entry.get("model", "")) for entry in response.json().get("models", [])}
+        except Exception as e:
+            logger.warning("[WARMUP] Could not list loaded Ollama models: %s", e)
+            return None
+
+    async def _ping(self, model: str, cold: bool) -> bool:
+        try:
+            # Queued behind user calls on the same backend instead of loading a model under them
+            async with scheduler.slot(self.backends[model], priority=PRIORITY_NORMAL):
+                start = time.perf_counter()
+                # A generate call without a prompt only loads the model and sets its keep-alive
+                response = await get_ollama_client().post(
+                    "/api/generate",
+                    json={"model": model, "keep_alive": ollama_keep_alive()},
+                    timeout=self.load_timeout
+                )
+                response.raise_for_status()
+        except Overloaded:
+            # The backend is saturated with user calls, which keep the model loaded themselves
+            logger.info("[WARMUP] %s backend busy, skipping this ping", self.backends[model])
+            return True
+        except Exception as e:
+            self.failures += 1
+            self.resident[model] = False
+            logger.warning("[WARMUP] Loading %s failed: %s", model, e)
+            return False
+        seconds = time.perf_counter() - start
+        self.resident[model] = True
+        if cold:
+            self.cold_loads += 1
+            self.last_load[model] = {"seconds": round(seconds, 3), "at": time.time()}
+            logger.info("[WARMUP] Loaded %s in %.1fs (keep_alive=%s)", model, seconds, ollama_keep_alive())
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "keep_alive": ollama_keep_alive(),
+            "interval": self.interval,
+            "contended_until": self.contended_until if self.contended else None,
+            "models": {
+                model: {"resident": self.resident[model], "last_load": self.last_load.get(model)}
+                for model in self.models
+            },
+            "cold_loads": self.cold_loads,
+            "failures": self.failures,
+            "last_check": self.last_check,
+        }
+
+
+model_warmer = ModelWarmer.from_env()
+
+metrics.register_callback(
+    "ollama_model_resident", "Whether a model the backend uses is loaded in Ollama", "gauge", ("model",),
+    lambda: [((model,), int(resident)) for model, resident in model_warmer.resident.items()]
+)
+metrics.register_callback(
+    "ollama_warmup_loads_total", "Models loaded by the warm-up loop", "counter", (),
+    lambda: [((), model_warmer.cold_loads)]
+)
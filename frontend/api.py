@@ -5,15 +5,20 @@ import streamlit as st
 
 API_BASE_URL = "http://localhost:8000"
 
-def send_chat_request(message, image_data=None):
+def send_chat_request(message, image_bytes=None, image_name="image", image_type="application/octet-stream", session_id=None):
     try:
-        payload = {
-            "message": message,
-            "has_image": image_data is not None,
-            "image_data": image_data
-        }
-        headers = {"Content-Type": "application/json", "Accept": "application/json"}
-        response = requests.post(f"{API_BASE_URL}/chat", json=payload, headers=headers, timeout=75)
+        headers = {"Accept": "application/json"}
+        if image_bytes is not None:
+            # Send the original file bytes as multipart instead of re-encoding to base64 JSON
+            files = {"image": (image_name, image_bytes, image_type)}
+            data = {"message": message}
+            if session_id:
+                data["session_id"] = session_id
+            response = requests.post(f"{API_BASE_URL}/chat/upload", data=data, files=files, headers=headers, timeout=75)
+        else:
+            payload = {"message": message, "has_image": False, "session_id": session_id}
+            headers["Content-Type"] = "application/json"
+            response = requests.post(f"{API_BASE_URL}/chat", json=payload, headers=headers, timeout=75)
         if response.status_code == 403:
             st.error("❌ Access denied. Please check if the backend is running on http://localhost:8000")
             return None
@@ -77,9 +82,11 @@ def get_tts_audio(text):
         st.error(f"❌ Error generating audio: {e}")
         return None
 
-def trigger_emergency_call(message=None):
+def trigger_emergency_call(message=None, session_id=None):
     try:
         payload = {"message": message} if message else {}
+        if session_id:
+            payload["session_id"] = session_id
         headers = {"Content-Type": "application/json"}
         response = requests.post(f"{API_BASE_URL}/emergency-call", json=payload, headers=headers, timeout=30)
         if response.status_code == 403:
@@ -89,7 +96,11 @@ def trigger_emergency_call(message=None):
             st.error(f"❌ Emergency call error: {response.status_code}")
             return None
         response.raise_for_status()
-        return response.json()
+        result = response.json()
+        if result.get("status") == "failed":
+            st.error(f"❌ {result.get('message')}")
+            return None
+        return result
     except requests.exceptions.ConnectionError:
         st.error("❌ Cannot connect to backend for emergency call")
         return None
@@ -97,6 +108,12 @@ def trigger_emergency_call(message=None):
         st.error(f"❌ Error making emergency call: {e}")
         return None
 
+def end_chat_session(session_id):
+    try:
+        requests.delete(f"{API_BASE_URL}/sessions/{session_id}", timeout=5)
+    except requests.exceptions.RequestException:
+        pass
+
 def check_backend_status():
     try:
         response = requests.get(f"{API_BASE_URL}/docs", timeout=3)
@@ -9,3 +9,5 @@ def initialize_session_state():
         st.session_state.uploaded_image = None
     if 'audio_response' not in st.session_state:
         st.session_state.audio_response = None
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = None
@@ -3,7 +3,7 @@
 import streamlit as st
 from streamlit_mic_recorder import mic_recorder
 from components import display_chat_message
-from api import trigger_emergency_call, transcribe_audio
+from api import trigger_emergency_call, transcribe_audio, end_chat_session
 from ui_handlers import process_message
 def render_sidebar():
     """Render the sidebar with all controls"""
@@ -30,7 +30,7 @@ def render_emergency_section():
     st.markdown("**🚨 Emergency**")
     if st.button("Call Emergency Contact", key="emergency_btn", help="Trigger emergency call via Twilio"):
         with st.spinner("Making emergency call..."):
-            result = trigger_emergency_call()
+            result = trigger_emergency_call(session_id=st.session_state.session_id)
             if result:
                 st.success("Emergency call initiated!")
                 st.session_state.chat_history.append({
@@ -94,8 +94,11 @@ def render_settings_section():
     st.markdown("**⚙️ Settings**")
     auto_tts = st.checkbox("Auto-play AI responses", value=False)
     if st.button("Clear Chat History"):
+        if st.session_state.session_id:
+            end_chat_session(st.session_state.session_id)
         st.session_state.chat_history = []
         st.session_state.audio_response = None
+        st.session_state.session_id = None
         st.rerun()
     st.markdown('</div>', unsafe_allow_html=True)
     return auto_tts
@@ -160,7 +163,7 @@ def render_chat_input_form():
         if emergency_button:
             emergency_msg = user_input if user_input else "Emergency medical assistance needed"
             with st.spinner("Making emergency call..."):
-                result = trigger_emergency_call(emergency_msg)
+                result = trigger_emergency_call(emergency_msg, session_id=st.session_state.session_id)
                 if result:
                     st.session_state.chat_history.append({
                         "message": f"🚨 Emergency call initiated: {emergency_msg}",
@@ -1,9 +1,6 @@
 # ui_handlers.py
 # Event handlers and business logic for UI interactions
 import streamlit as st
-from PIL import Image
-import io
-import base64
 from api import send_chat_request, get_tts_audio
 
 def process_message(message):
@@ -14,20 +11,26 @@ def process_message(message):
         "is_user": True
     })
     
-    # Prepare image data if available
-    image_data = None
-    if st.session_state.uploaded_image:
-        image = Image.open(st.session_state.uploaded_image)
-        buffer = io.BytesIO()
-        image.save(buffer, format="PNG")
-        image_data = base64.b64encode(buffer.getvalue()).decode()
+    # Send the uploaded file's original bytes, no decode/re-encode
+    uploaded_image = st.session_state.uploaded_image
     
     # Get AI response
     with st.spinner("🤖 AI is analyzing your medical question... This may take up to 60 seconds."):
-        response = send_chat_request(message, image_data)
+        if uploaded_image:
+            response = send_chat_request(
+                message,
+                image_bytes=uploaded_image.getvalue(),
+                image_name=uploaded_image.name,
+                image_type=uploaded_image.type,
+                session_id=st.session_state.session_id
+            )
+        else:
+            response = send_chat_request(message, session_id=st.session_state.session_id)
         
         if response:
             ai_message = response["response"]
+            # The backend keeps the conversation context; only its ID lives here
+            st.session_state.session_id = response.get("session_id") or st.session_state.session_id
             source = response.get("source", "unknown")
             
             # Add AI response to chat history